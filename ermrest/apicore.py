@@ -23,6 +23,10 @@
 """
 
 import threading
+import queue
+import tempfile
+import time
+import atexit
 import logging
 from logging.handlers import SysLogHandler
 import datetime
@@ -44,8 +48,12 @@ from webauthn2.rest import format_trace_json, format_final_json
 from .exception import *
 
 from .registry import get_registry
-from .catalog import get_catalog_factory
+from .catalog import get_catalog_factory, Catalog
 from .util import urlquote, random_name
+from . import sanepg2
+from .regcache import registration_cache
+from .model.snapshot import model_snapshots
+from .ermpath.compiled import compiled_queries
 
 __all__ = [
     'web_urls',
@@ -91,6 +99,19 @@ global_env = merge_config(
 # setup webauthn2 handler
 webauthn2_manager = Manager()
 
+# setup database connection pooling limits
+sanepg2.pools.configure(global_env.get('connection_pool', {}))
+
+# setup catalog model cache limits
+Catalog.MODEL_CACHE.configure(global_env.get('model_cache', {}))
+model_snapshots.configure(global_env.get('model_snapshots', {}))
+
+# setup shared client/group registration cache
+registration_cache.configure(global_env.get('registration_cache', {}))
+
+# setup compiled data query cache
+compiled_queries.configure(global_env.get('compiled_query_cache', {}))
+
 # setup registry
 registry_config = global_env.get('registry')
 if registry_config:
@@ -197,6 +218,139 @@ def request_trace(tracedata):
         webauthn2_context=deriva_ctx.webauthn2_context,
     ))
 
+class AuditSink (object):
+    """Background writer for row-level audit events.
+
+       Request threads spool JSON lines, one audit event per line, as
+       produced by COPY in sanepg2, to a temporary file and hand the
+       file over without waiting.  A writer thread formats each event
+       with the originating request context and flushes them in
+       batches to syslog or to a JSON-lines file.  When more than
+       queue_blocks spools are waiting, requests pause after their
+       commit until the writer catches up.
+    """
+    def __init__(self, config):
+        self.target = config.get('target', 'syslog')
+        self.path = config.get('path')
+        if self.target not in {'syslog', 'file'}:
+            raise ValueError('Unsupported audit_sink target %r.' % self.target)
+        if self.target == 'file' and not self.path:
+            raise ValueError('audit_sink target "file" requires a path.')
+        self.block_bytes = int(config.get('block_bytes', 64 * 1024))
+        self.batch_events = int(config.get('batch_events', 1000))
+        self.flush_interval_s = float(config.get('flush_interval_s', 1.0))
+        self.queue_blocks = int(config.get('queue_blocks', 64))
+        # unbounded so that no request waits while its transaction is open
+        self._queue = queue.Queue()
+        self._drained = threading.Condition()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pending = []
+        self._last_flush = time.monotonic()
+        atexit.register(self.shutdown)
+
+    def writer(self):
+        """Return a file-like COPY target collecting events for the current request."""
+        return AuditSinkWriter(self, dict(
+            start_time=deriva_ctx.ermrest_start_time,
+            req=deriva_ctx.ermrest_request_guid,
+            client=flask.request.remote_addr,
+            webauthn2_context=deriva_ctx.webauthn2_context,
+        ))
+
+    def submit(self, context, spool):
+        """Enqueue spool file of JSON lines without waiting."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ermrest-audit-sink', daemon=True)
+                self._thread.start()
+        self._queue.put((context, spool))
+
+    def throttle(self):
+        """Wait while the writer is more than queue_blocks submissions behind.
+
+           Call after the submitting transaction has committed.
+        """
+        with self._drained:
+            while self._queue.qsize() > self.queue_blocks \
+                  and self._thread is not None and self._thread.is_alive():
+                self._drained.wait(self.flush_interval_s)
+
+    def shutdown(self):
+        """Flush queued events and stop the writer thread."""
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join(30)
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval_s)
+            except queue.Empty:
+                item = False
+            if item is None:
+                self._flush()
+                return
+            if item:
+                context, spool = item
+                try:
+                    spool.seek(0)
+                    for line in spool:
+                        try:
+                            self._pending.append(format_trace_json(json.loads(line.decode('utf-8')), **context))
+                        except Exception as te:
+                            deriva_debug('ermrest audit sink dropped malformed event: %s' % te)
+                        if len(self._pending) >= self.batch_events:
+                            self._flush()
+                finally:
+                    spool.close()
+                with self._drained:
+                    self._drained.notify_all()
+            if len(self._pending) >= self.batch_events \
+               or (time.monotonic() - self._last_flush) >= self.flush_interval_s:
+                self._flush()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            if self.target == 'file':
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write('\n'.join(batch) + '\n')
+            else:
+                for record in batch:
+                    logger.info(record)
+        except Exception as te:
+            deriva_debug('ermrest audit sink failed to write %d events: %s' % (len(batch), te))
+
+class AuditSinkWriter (object):
+    """File-like object accepting COPY output for one AuditSink submission.
+
+       Output beyond block_bytes is spooled to a temporary file.
+    """
+    def __init__(self, sink, context):
+        self._sink = sink
+        self._context = context
+        self._spool = tempfile.SpooledTemporaryFile(max_size=sink.block_bytes)
+
+    def write(self, data):
+        self._spool.write(data)
+
+    def close(self):
+        if self._spool.tell() > 0:
+            self._sink.submit(self._context, self._spool)
+        else:
+            self._spool.close()
+
+    def throttle(self):
+        self._sink.throttle()
+
+audit_sink = AuditSink(global_env.get('audit_sink', {}))
+
 _client_session_proxy = ClientSessionCachedProxy(global_env.get('webauthn_proxy_config'))
 
 @app.before_request
@@ -215,6 +369,7 @@ def request_init():
     deriva_ctx.ermrest_history_snaprange = None # for longitudinal history manipulation
     deriva_ctx.ermrest_history_amendver = None # for ETag versioning of historical results
     deriva_ctx.ermrest_request_trace = request_trace
+    deriva_ctx.ermrest_audit_sink = audit_sink
     deriva_ctx.ermrest_registry = registry
     deriva_ctx.ermrest_catalog_factory = catalog_factory
     deriva_ctx.ermrest_catalog_model = None
@@ -223,6 +378,8 @@ def request_init():
     deriva_ctx.ermrest_catalog_id = None
     deriva_ctx.ermrest_change_notify = amqp_notifier.notify if amqp_notifier else lambda : None
     deriva_ctx.ermrest_model_rights_cache = dict()
+    deriva_ctx.ermrest_request_stats = dict() # performance counters for request log
+    deriva_ctx.ermrest_deferred_query = flask.request.environ.get('ermrest.deferred_query') # set by ASGI entry point
 
     # get client authentication context
     deriva_ctx.webauthn2_context = _client_session_proxy.get_context(flask.request.environ, flask.request.cookies, fallback=True)
@@ -244,8 +401,8 @@ def _teardown():
 def request_final(response):
     """Log final request handler state to finalize a request's audit trail."""
 
-    if not hasattr(response.response, 'seek'):
-        # force lingering response generator, unless it is a seekable file/buffer
+    if not hasattr(response.response, 'seek') and not response.direct_passthrough:
+        # force lingering response generator, unless it is a seekable file/buffer or wrapped file
         response.make_sequence()
 
     if flask.request.method in {'PUT', 'POST', 'DELETE'} \
@@ -259,6 +416,8 @@ def request_final(response):
         extra['snaptime'] = str(deriva_ctx.ermrest_history_snaptime)
     if deriva_ctx.ermrest_history_snaprange:
         extra['snaprange'] = [ str(ts) if ts else None for ts in deriva_ctx.ermrest_history_snaprange ]
+    if deriva_ctx.ermrest_request_stats:
+        extra['stats'] = deriva_ctx.ermrest_request_stats
 
     if isinstance(response, flask.Response):
         deriva_ctx.ermrest_status = response.status
@@ -298,7 +457,13 @@ def error_handler(ev):
        and not isinstance(ev, rest.RestException):
         deriva_debug(str(ev), flask.request.path, flask.request.environ['REQUEST_URI'])
 
-    if isinstance(ev, psycopg2.Error):
+    if isinstance(ev, sanepg2.PoolExhausted):
+        request_trace(u"Connection pool error: %s" % ev)
+        ev = rest.ServiceUnavailable(
+            'Database connections exhausted.',
+            headers=({'Retry-After': str(ev.retry_after)} if ev.retry_after else {}),
+        )
+    elif isinstance(ev, psycopg2.Error):
         request_trace(u"Postgres error: %s (%s)" % (ev.pgerror, ev.pgcode))
 
         if ev.pgcode is not None:
@@ -0,0 +1,358 @@
+
+#
+# Copyright 2026 University of Southern California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""ERMREST ASGI entry point.
+
+The synchronous flask app still does all request handling: URL
+parsing, authentication, ACL and precondition checks, and ermpath SQL
+generation run in a small pool of worker threads.
+
+For data GET requests with JSON content types, the flask handler stops
+short of executing the final query. It binds the generated SQL to a
+DeferredQuery and releases its catalog connection. This entry point
+then runs the query with the psycopg 3 asyncio driver and streams rows
+to the client from the event loop, so a slow download holds neither a
+worker thread nor a connection from the synchronous pool.
+
+Run it with any ASGI server, e.g.:
+
+   uvicorn --root-path /ermrest ermrest.asgi:application
+
+The asyncio driver is optional. Without the psycopg and psycopg_pool
+packages, every request goes through the WSGI bridge.
+
+"""
+
+import io
+import sys
+import asyncio
+import datetime
+from datetime import timezone
+import concurrent.futures
+
+from webauthn2.util import deriva_ctx, deriva_debug
+
+try:
+    import psycopg
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    psycopg = None
+
+from .ermrest_apis import app
+from .apicore import global_env
+from .model import current_catalog_snaptime
+from .ermpath.resource import _catalog_snaptime_sql
+
+_catalog_version_sql = _catalog_snaptime_sql % {'prefix': '_ermrest.tstzencode(', 'suffix': ')'}
+
+class DeferredQuery (object):
+    """Final data query handed from the flask handler to the ASGI entry point.
+
+       The flask request sees an empty response body. After the WSGI
+       call returns, the entry point checks whether bind() was called
+       and, if so, runs the bound SQL itself.
+    """
+    def __init__(self):
+        self.sql = None
+        self.dsn = None
+        self.gucs = None
+        self.version = None
+        self.deadline = None
+
+    def bind(self, cur, sql):
+        """Capture SQL and session state needed to run it in another transaction.
+
+           cur: the catalog cursor of the synchronous request
+           sql: the preserialized query yielding one text column
+        """
+        pc = deriva_ctx.ermrest_catalog_pc
+        if pc is not None and pc.conn is cur.connection:
+            self.dsn = pc.dsn
+        else:
+            self.dsn = cur.connection.dsn
+        cur.execute("""
+SELECT
+  current_setting('webauthn2.client', true),
+  current_setting('webauthn2.client_json', true),
+  current_setting('webauthn2.attributes', true),
+  current_setting('webauthn2.attributes_array', true);
+""")
+        self.gucs = cur.fetchone()
+        if deriva_ctx.ermrest_history_snaptime is None:
+            # live data must be unchanged since the ETag was computed
+            self.version = current_catalog_snaptime(cur, encode=True)
+        request_timeout_s = float(deriva_ctx.ermrest_config.get('request_timeout_s', '55'))
+        self.deadline = deriva_ctx.ermrest_start_time + datetime.timedelta(seconds=request_timeout_s)
+        self.sql = sql
+        return self
+
+    def remaining_ms(self):
+        remaining = self.deadline - datetime.datetime.now(timezone.utc)
+        return int(1000.0 * remaining.total_seconds())
+
+    def __iter__(self):
+        # the real body is produced by the ASGI entry point
+        return iter(())
+
+    def close(self):
+        pass
+
+class AsgiApp (object):
+    """ASGI application wrapping the ERMrest flask app.
+
+       Configuration is the "asgi" section of ermrest_config.json:
+
+         worker_threads: threads running the synchronous flask app
+         min_connections: async connections kept open per database
+         max_connections: async connections allowed per database
+         fetch_rows: rows fetched per round trip while streaming
+         block_bytes: target size of body messages sent to the server
+    """
+    defaults = {
+        'worker_threads': 8,
+        'min_connections': 1,
+        'max_connections': 16,
+        'fetch_rows': 1000,
+        'block_bytes': 65536,
+    }
+
+    def __init__(self, wsgi_app, config={}):
+        self.wsgi_app = wsgi_app
+        self.config = dict(self.defaults)
+        self.config.update(config)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(self.config['worker_threads']),
+            thread_name_prefix='ermrest-asgi',
+        )
+        self.async_pools = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.lifespan(scope, receive, send)
+        else:
+            raise NotImplementedError('ASGI scope type %s' % scope['type'])
+
+    async def lifespan(self, scope, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def shutdown(self):
+        pools = list(self.async_pools.values())
+        self.async_pools.clear()
+        for pool in pools:
+            await pool.close()
+        self.executor.shutdown(wait=False)
+
+    async def http(self, scope, receive, send):
+        body = io.BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+
+        environ = self._environ(scope, body.getvalue())
+        deferred = None
+        if psycopg is not None and scope['method'] == 'GET':
+            deferred = DeferredQuery()
+            environ['ermrest.deferred_query'] = deferred
+
+        loop = asyncio.get_running_loop()
+        status, headers, app_iter = await loop.run_in_executor(self.executor, self._call_wsgi, environ)
+
+        if deferred is not None and deferred.sql is not None:
+            await loop.run_in_executor(self.executor, self._close, app_iter)
+            if await self._stream(deferred, status, headers, send):
+                return
+            # catalog changed or query failed, so run the request again synchronously
+            environ = self._environ(scope, body.getvalue())
+            status, headers, app_iter = await loop.run_in_executor(self.executor, self._call_wsgi, environ)
+
+        await self._send_wsgi(status, headers, app_iter, send)
+
+    def _environ(self, scope, body):
+        """Build a WSGI environ equivalent to what mod_wsgi would give the flask app."""
+        root_path = scope.get('root_path', '')
+        raw_path = scope.get('raw_path')
+        if raw_path is None:
+            raw_path = scope['path'].encode('utf8')
+        raw_path = raw_path.decode('latin-1')
+        if not raw_path.startswith(root_path):
+            raw_path = root_path + raw_path
+        query_string = scope.get('query_string', b'').decode('latin-1')
+        request_uri = raw_path + ('?%s' % query_string if query_string else '')
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': root_path,
+            'PATH_INFO': raw_path[len(root_path):],
+            'QUERY_STRING': query_string,
+            'REQUEST_URI': request_uri,
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+                key = name
+            else:
+                key = 'HTTP_%s' % name
+            if key in environ:
+                environ[key] = '%s,%s' % (environ[key], value)
+            else:
+                environ[key] = value
+        return environ
+
+    def _call_wsgi(self, environ):
+        """Run the flask app in a worker thread and return (status, headers, app_iter)."""
+        response = {}
+        written = []
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+            return written.append
+
+        app_iter = self.wsgi_app(environ, start_response)
+        if written:
+            app_iter = written + list(app_iter)
+        return response['status'], response['headers'], app_iter
+
+    def _close(self, app_iter):
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+    def _next_block(self, it):
+        """Pull a body block from a synchronous app_iter or return None at the end."""
+        parts = []
+        nbytes = 0
+        for part in it:
+            if not part:
+                continue
+            parts.append(part)
+            nbytes += len(part)
+            if nbytes >= self.config['block_bytes']:
+                break
+        return b''.join(parts) if parts else None
+
+    async def _start(self, status, headers, send):
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [ (k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers ],
+        })
+
+    async def _send_wsgi(self, status, headers, app_iter, send):
+        loop = asyncio.get_running_loop()
+        try:
+            await self._start(status, headers, send)
+            it = iter(app_iter)
+            while True:
+                block = await loop.run_in_executor(self.executor, self._next_block, it)
+                if block is None:
+                    break
+                await send({'type': 'http.response.body', 'body': block, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            await loop.run_in_executor(self.executor, self._close, app_iter)
+
+    async def _pool(self, dsn):
+        pool = self.async_pools.get(dsn)
+        if pool is None:
+            pool = AsyncConnectionPool(
+                dsn,
+                min_size=int(self.config['min_connections']),
+                max_size=int(self.config['max_connections']),
+                open=False,
+            )
+            self.async_pools[dsn] = pool
+            await pool.open()
+        return pool
+
+    async def _stream(self, deferred, status, headers, send):
+        """Run deferred query and stream its rows as the response body.
+
+           Returns False without sending anything if the catalog
+           version moved since the flask handler computed the ETag, or
+           if the query fails before the response has started.
+        """
+        # the flask response had an empty body, so drop its Content-Length
+        headers = [ (k, v) for k, v in headers if k.lower() != 'content-length' ]
+        started = False
+        pool = await self._pool(deferred.dsn)
+        try:
+            async with pool.connection() as conn:
+                conn.isolation_level = psycopg.IsolationLevel.REPEATABLE_READ
+                conn.read_only = True
+                async with conn.transaction():
+                    async with conn.cursor() as cur:
+                        await cur.execute(
+                            "SELECT"
+                            " set_config('webauthn2.client', %s, true),"
+                            " set_config('webauthn2.client_json', %s, true),"
+                            " set_config('webauthn2.attributes', %s, true),"
+                            " set_config('webauthn2.attributes_array', %s, true),"
+                            " set_config('statement_timeout', %s, true);",
+                            tuple(deferred.gucs) + (str(max(deferred.remaining_ms(), 1)),)
+                        )
+                        if deferred.version is not None:
+                            await cur.execute(_catalog_version_sql)
+                            if (await cur.fetchone())[0] != deferred.version:
+                                return False
+                    async with conn.cursor(name='ermrest_deferred') as cur:
+                        await cur.execute(deferred.sql)
+                        fetch_rows = int(self.config['fetch_rows'])
+                        while True:
+                            rows = await cur.fetchmany(fetch_rows)
+                            if not started:
+                                await self._start(status, headers, send)
+                                started = True
+                            if not rows:
+                                break
+                            block = ''.join([ row[0] + '\n' for row in rows ]).encode('utf8')
+                            await send({'type': 'http.response.body', 'body': block, 'more_body': True})
+        except psycopg.Error as e:
+            if started:
+                raise
+            deriva_debug('ERMrest ASGI deferred query failed: %s' % e)
+            return False
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        return True
+
+application = AsgiApp(app, global_env.get('asgi', {}))
@@ -26,15 +26,18 @@ This module provides catalog management features including:
 
 import psycopg2
 import pkgutil
-import datetime
-from webauthn2.util import deriva_ctx
+import threading
+import time
+from collections import OrderedDict
+from webauthn2.util import deriva_ctx, deriva_debug
 
 from . import sanepg2
 from .util import sql_identifier, sql_literal, schema_exists, table_exists, random_name
 from .exception import *
 from .model.misc import annotatable_classes, hasacls_classes, hasdynacls_classes
 from .model.introspect import introspect
-from .model import current_model_snaptime, normalized_history_snaptime, Table
+from .model import current_catalog_snaptime, current_model_snaptime, normalized_history_snaptime, Table
+from .ermpath.resource import _catalog_snaptime_sql
 from . import sql
 
 __all__ = ['get_catalog_factory']
@@ -170,6 +173,150 @@ WHERE datname = %(dbname)s
             self._dbc.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
     
     
+class ModelCache (object):
+    """Thread-safe LRU of introspected catalog models.
+
+       Live and historical (@snaptime) models are kept in separate
+       tiers, each bounded by entry count and by estimated size, so
+       browsing old snapshots cannot evict the live models.
+
+       Concurrent misses on the same key share one introspection.
+
+       Configuration is the "model_cache" section of ermrest_config.json:
+
+         live_entries: maximum live models
+         live_mb: maximum estimated size of live models
+         historical_entries: maximum historical models
+         historical_mb: maximum estimated size of historical models
+    """
+    defaults = {
+        'live_entries': 16,
+        'live_mb': 1024,
+        'historical_entries': 8,
+        'historical_mb': 256,
+    }
+
+    class Flight (object):
+        """Introspection in progress for one cache key."""
+        def __init__(self):
+            self.done = threading.Event()
+            self.model = None
+
+    def __init__(self, config={}):
+        self._lock = threading.Lock()
+        self._tiers = {
+            'live': OrderedDict(),
+            'historical': OrderedDict(),
+        }
+        self._bytes = { 'live': 0, 'historical': 0 }
+        self._flights = dict()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'evictions': 0,
+            'introspections': 0,
+            'introspection_s': 0.0,
+        }
+        self.configure(config)
+
+    def configure(self, config):
+        """Apply cache configuration, falling back to defaults for missing keys."""
+        with self._lock:
+            self.config = dict(self.defaults)
+            self.config.update(config if config else {})
+            self._limits = {
+                'live': (int(self.config['live_entries']), int(float(self.config['live_mb']) * 1024 * 1024)),
+                'historical': (int(self.config['historical_entries']), int(float(self.config['historical_mb']) * 1024 * 1024)),
+            }
+            for tier in self._tiers:
+                self._evict(tier)
+
+    def _evict(self, tier):
+        entries = self._tiers[tier]
+        max_entries, max_bytes = self._limits[tier]
+        while entries and (len(entries) > max_entries or self._bytes[tier] > max_bytes):
+            if len(entries) == 1 and max_entries > 0:
+                # keep the newest model even if it alone exceeds the size budget
+                break
+            key, (model, size) = entries.popitem(last=False)
+            self._bytes[tier] -= size
+            self._counters['evictions'] += 1
+
+    def get(self, key, historical, introspect_func):
+        """Return cached model for key, calling introspect_func() on a miss.
+
+           key: hashable model identity, e.g. (descriptor, (snapwhen, amendver))
+           historical: True to store the model in the historical tier
+           introspect_func: produces the model if it is not cached
+        """
+        tier = 'historical' if historical else 'live'
+        while True:
+            with self._lock:
+                entry = self._tiers[tier].get(key)
+                if entry is not None:
+                    self._tiers[tier].move_to_end(key)
+                    self._counters['hits'] += 1
+                    sanepg2.request_stat_add('model_cache_hits')
+                    return entry[0]
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = self.Flight()
+                    self._counters['misses'] += 1
+                else:
+                    self._counters['waits'] += 1
+            sanepg2.request_stat_add('model_cache_misses')
+            if not leader:
+                flight.done.wait()
+                if flight.model is not None:
+                    return flight.model
+                # the introspection we waited for failed, so try our own
+                continue
+            try:
+                t0 = time.monotonic()
+                model = introspect_func()
+                elapsed = time.monotonic() - t0
+                size = model.estimated_size()
+                with self._lock:
+                    old = self._tiers[tier].pop(key, None)
+                    if old is not None:
+                        self._bytes[tier] -= old[1]
+                    self._tiers[tier][key] = (model, size)
+                    self._bytes[tier] += size
+                    self._counters['introspections'] += 1
+                    self._counters['introspection_s'] += elapsed
+                    self._evict(tier)
+                flight.model = model
+                return model
+            finally:
+                with self._lock:
+                    del self._flights[key]
+                flight.done.set()
+
+    def newest_live_key(self, descriptor):
+        """Return key of the most recently cached live model for descriptor or None."""
+        with self._lock:
+            for key in reversed(self._tiers['live']):
+                if key[0] == descriptor:
+                    return key
+        return None
+
+    def stats(self):
+        """Return a summary of model cache usage for diagnostics."""
+        with self._lock:
+            result = dict(self._counters)
+            result['introspection_s'] = round(result['introspection_s'], 3)
+            for tier, entries in self._tiers.items():
+                max_entries, max_bytes = self._limits[tier]
+                result[tier] = {
+                    "entries": len(entries),
+                    "max_entries": max_entries,
+                    "estimated_bytes": self._bytes[tier],
+                    "max_bytes": max_bytes,
+                }
+            return result
+
 class Catalog (object):
     """Provides basic catalog management.
     """
@@ -178,8 +325,15 @@ class Catalog (object):
     _SUPPORTED_REGISTRY_TYPES = (_POSTGRES_REGISTRY)
 
     # key cache by (str(descriptor), version)
-    MODEL_CACHE = dict()
-    MODEL_CACHE_SIZE = 16
+    MODEL_CACHE = ModelCache()
+
+    # standby dsn -> monotonic time before which we do not retry it
+    STANDBY_BACKOFF = dict()
+    STANDBY_BACKOFF_SECONDS = 30
+
+    # primary dsn -> (encoded version, monotonic time it was read)
+    PRIMARY_VERSIONS = dict()
+    _standby_lock = threading.Lock()
 
     def __init__(self, factory, reg_entry, config=None):
         """Initializes the catalog.
@@ -200,6 +354,11 @@ class Catalog (object):
         if self.descriptor is None:
             raise ConflictData('Alias %(id)r is currently not bound to a catalog.' % reg_entry)
         self.dsn = self._serialize_descriptor(self.descriptor)
+        # optional hot standbys are descriptor overrides, e.g. {"host": "replica1"}
+        self.standby_dsns = [
+            self._serialize_descriptor(dict(self.descriptor, **standby))
+            for standby in self.descriptor.get('standbys', [])
+        ]
         self._factory = factory
         self.alias_target = reg_entry.get('alias_target')
         self.name = reg_entry.get('name')
@@ -219,34 +378,117 @@ class Catalog (object):
             return "'%s'" % (str(v).replace('\\', '\\\\').replace("'", "\\'"),)
 
         if 'type' not in descriptor or descriptor['type'] == self._POSTGRES_REGISTRY:
-            return " ".join([ "%s=%s" % (key, serialize_value(descriptor[key])) for key in descriptor if key != 'type' ])
+            return " ".join([ "%s=%s" % (key, serialize_value(descriptor[key])) for key in descriptor if key not in {'type', 'standbys'} ])
         else:
             raise KeyError("Catalog descriptor type not supported: %(type)s" % descriptor)
 
+    def _primary_version(self):
+        """Return latest catalog version on the primary as encoded snaptime.
+
+           A version read by this process within standby_version_ttl_s
+           is reused instead of querying the primary again.
+        """
+        ttl_s = float(self._config.get('standby_version_ttl_s', 1.0)) if self._config else 1.0
+        cached = self.PRIMARY_VERSIONS.get(self.dsn)
+        if cached is not None and (time.monotonic() - cached[1]) < ttl_s:
+            sanepg2.request_stat_add('primary_version_hits')
+            return cached[0]
+        read_at = time.monotonic()
+        primary = sanepg2.PooledConnection(self.dsn)
+        try:
+            version = current_catalog_snaptime(primary.cur, encode=True)
+            primary.conn.commit()
+        finally:
+            primary.final()
+        with self._standby_lock:
+            self.PRIMARY_VERSIONS[self.dsn] = (version, read_at)
+        return version
+
+    def _standby_covers(self, cur, snapwhen):
+        """Return True if standby has the catalog version needed by this request.
+
+           snapwhen: encoded snaptime the standby must have replayed
+        """
+        cur.execute(_catalog_snaptime_sql % {
+            'prefix': 'COALESCE(',
+            'suffix': '>= _ermrest.tstzdecode(%s), False)' % sql_literal(snapwhen),
+        })
+        return cur.fetchone()[0]
+
+    def pooled_connection(self, read_only=False, snapwhen=None):
+        """Return a PooledConnection suitable for this request.
+
+           read_only: True if the request will not modify the catalog
+           snapwhen: encoded snaptime of a historical query or None
+
+           Read-only requests go to the first configured standby which
+           covers the needed catalog version, otherwise to the primary.
+           A live read needs the latest version on the primary, so it
+           sees writes made through any service process or host no
+           later than standby_version_ttl_s after they committed.
+        """
+        if read_only and self.standby_dsns and snapwhen is None:
+            snapwhen = self._primary_version()
+            if snapwhen is None:
+                # empty version history gives no bound to check
+                return sanepg2.PooledConnection(self.dsn)
+        if read_only:
+            for dsn in self.standby_dsns:
+                if self.STANDBY_BACKOFF.get(dsn, 0) > time.monotonic():
+                    continue
+                try:
+                    pc = sanepg2.PooledConnection(dsn, standby=True)
+                except psycopg2.OperationalError as te:
+                    deriva_debug('Skipping unreachable catalog standby: %s' % te)
+                    with self._standby_lock:
+                        self.STANDBY_BACKOFF[dsn] = time.monotonic() + self.STANDBY_BACKOFF_SECONDS
+                    continue
+                except sanepg2.PoolExhausted as te:
+                    # standby is busy but healthy, so no back-off
+                    deriva_debug('Skipping busy catalog standby: %s' % te)
+                    continue
+                try:
+                    if self._standby_covers(pc.cur, snapwhen):
+                        pc.conn.commit()
+                        sanepg2.request_stat_add('standby_reads')
+                        return pc
+                    pc.conn.rollback()
+                except psycopg2.Error as te:
+                    # e.g. malformed snapwhen which the primary will report properly
+                    pc.conn.rollback()
+                pc.final()
+        return sanepg2.PooledConnection(self.dsn)
+
+    @classmethod
+    def model_cache_stats(cls):
+        """Return a summary of model cache usage for diagnostics."""
+        return cls.MODEL_CACHE.stats()
+
     def get_model(self, cur=None, config=None, private=False, snapwhen=None, amendver=None):
         if cur is None:
             cur = deriva_ctx.ermrest_catalog_pc.cur
         if config is None:
             config = self._config
+        historical = snapwhen is not None
         if snapwhen is None:
             snapwhen = current_model_snaptime(cur)
             assert amendver is None
         else:
             assert amendver is not None
+        if private:
+            return introspect(cur, config, snapwhen, amendver)
         cache_key = (str(self.descriptor), (snapwhen, amendver))
-        model = self.MODEL_CACHE.get(cache_key)
-        if (model is None) or private:
-            model = introspect(cur, config, snapwhen, amendver)
-            if not private:
-                self.MODEL_CACHE[cache_key] = model
-        # LRU replacement scheme
-        model.last_access = datetime.datetime.utcnow()
-        if len(self.MODEL_CACHE) > 2 * self.MODEL_CACHE_SIZE:
-            cache_items = list(self.MODEL_CACHE.items())
-            cache_items.sort(key=lambda item: item[1].last_access, reverse=True)
-            for key, victim in cache_items[self.MODEL_CACHE_SIZE:]:
-                del self.MODEL_CACHE[key]
-        return model
+        # a cached older live model allows an incremental refresh
+        base_key = None if historical else self.MODEL_CACHE.newest_live_key(str(self.descriptor))
+        return self.MODEL_CACHE.get(
+            cache_key,
+            historical,
+            lambda: introspect(
+                cur, config, snapwhen, amendver,
+                snapshot_key=cache_key,
+                base=(base_key, base_key[1][0]) if base_key is not None else None
+            )
+        )
 
     def destroy(self):
         """Destroys the catalog (i.e., drops the database).
@@ -22,4 +22,4 @@ navigating, and manipulating data in an ERMREST catalog.
 
 """
 from .resource import *
-
+from .compiled import CompiledDataPath, abstract_literals, compiled_queries
@@ -0,0 +1,302 @@
+
+#
+# Copyright 2026 University of Southern California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""ERMREST compiled data query cache.
+
+Building ermpath objects for a data URL resolves every name against
+the model, validates every predicate, and evaluates access rights
+before the SQL text is generated. The generated SQL only depends on
+the URL syntax, the model version, and the client roles, except for
+the literal values in filters and page keys.
+
+A data GET therefore abstracts its literal values into numbered
+slots, generates SQL once per distinct syntax, and caches the result
+as a template. Later requests with the same syntax, model version,
+and roles bind their own literals into the template without building
+any ermpath objects.
+
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from webauthn2.util import deriva_ctx
+
+from .. import sanepg2
+from ..model.predicate import Value
+from .resource import current_catalog_snaptime, execute_get
+
+class ValueSlot (Value):
+    """Literal value from a URL standing in for a query template slot."""
+    def __init__(self, value, index):
+        Value.__init__(self, value._str)
+        self.index = index
+        self.template = None
+
+    def sql_literal(self, etype):
+        if self.template is None:
+            return Value.sql_literal(self, etype)
+        return self.template.slot(self.index, etype)
+
+def abstract_literals(x, slots):
+    """Return hashable syntax key for x, replacing literal values by slots.
+
+       x: syntax objects from a parsed data URL
+       slots: list receiving ValueSlot instances in slot order
+
+       Each non-null Value in x is replaced in place by a ValueSlot.
+       Null values remain part of the key, since they change the
+       structure of generated SQL. Raises TypeError for content which
+       cannot be keyed.
+    """
+    memo = {}
+
+    def visit(x):
+        if isinstance(x, Value):
+            if x.is_null():
+                return x, ('null',)
+            slot = memo.get(id(x))
+            if slot is None:
+                slot = memo[id(x)] = ValueSlot(x, len(slots))
+                slots.append(slot)
+            return slot, ('?',)
+        elif isinstance(x, (str, int, float, bool, type(None))):
+            return x, x
+        elif type(x) is tuple:
+            pairs = [ visit(v) for v in x ]
+            return tuple([ v for v, k in pairs ]), tuple([ k for v, k in pairs ])
+        elif isinstance(x, list):
+            keys = []
+            for i in range(len(x)):
+                x[i], k = visit(x[i])
+                keys.append(k)
+            return x, (type(x), tuple(keys), visit_attrs(x))
+        elif isinstance(x, dict):
+            keys = []
+            for k in sorted(x, key=str):
+                x[k], vk = visit(x[k])
+                keys.append((k, vk))
+            return x, (type(x), tuple(keys))
+        elif hasattr(x, '__dict__'):
+            return x, (type(x), visit_attrs(x))
+        else:
+            raise TypeError('Cannot key syntax object %r.' % (x,))
+
+    def visit_attrs(x):
+        keys = []
+        for k, v in sorted(getattr(x, '__dict__', {}).items()):
+            v, vk = visit(v)
+            setattr(x, k, v)
+            keys.append((k, vk))
+        return tuple(keys)
+
+    return visit(x)[1]
+
+class QueryTemplate (object):
+    """SQL query text with numbered literal slots."""
+    def __init__(self):
+        self.slots = []
+        self.parts = None
+        # number of requests which found this template in the cache
+        self.uses = 0
+
+    def slot(self, index, etype):
+        """Return placeholder for ValueSlot index rendered as etype."""
+        self.slots.append((index, etype))
+        # NUL cannot occur in SQL text from the model or literals
+        return '\x00%d\x00' % (len(self.slots) - 1)
+
+    def set_sql(self, sql):
+        self.parts = sql.split('\x00')
+
+    def bind(self, values):
+        """Return SQL text with literal values bound to slots."""
+        parts = list(self.parts)
+        for i in range(1, len(parts), 2):
+            index, etype = self.slots[int(parts[i])]
+            parts[i] = etype.sql_literal(etype.url_parse(values[index]))
+        return ''.join(parts)
+
+    def bind_params(self, values):
+        """Return (sql, argtypes, args) with literal values as $1, $2, ... parameters.
+
+           The sql and argtypes only depend on the template, so every
+           request using the template runs the same statement.
+        """
+        parts = list(self.parts)
+        positions = {}
+        argtypes = []
+        args = []
+        for i in range(1, len(parts), 2):
+            index, etype = self.slots[int(parts[i])]
+            argtype = etype.sql(basic_storage=True)
+            n = positions.get((index, argtype))
+            if n is None:
+                value = etype.url_parse(values[index])
+                if argtype in [ 'json', 'jsonb' ]:
+                    value = json.dumps(value)
+                argtypes.append(argtype)
+                args.append(value)
+                n = positions[(index, argtype)] = len(args)
+            parts[i] = '$%d' % n
+        return ''.join(parts), argtypes, args
+
+class CompiledQueryCache (object):
+    """Thread-safe LRU of data query templates.
+
+       Configuration is the "compiled_query_cache" section of
+       ermrest_config.json:
+
+         size: maximum number of templates, 0 disables the cache
+         prepare_after: cache hits after which a template runs as a
+           prepared statement with parameters, 0 (default) always
+           inlines literals
+         statements_per_connection: maximum prepared statements kept
+           by each database connection
+    """
+    defaults = {
+        'size': 1000,
+        'prepare_after': 0,
+        'statements_per_connection': 64,
+    }
+
+    def __init__(self, config={}):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._counters = { 'hits': 0, 'misses': 0 }
+        self.configure(config)
+
+    def configure(self, config):
+        """Apply cache configuration, falling back to defaults for missing keys."""
+        with self._lock:
+            self.config = dict(self.defaults)
+            self.config.update(config if config else {})
+            self.size = int(self.config['size'])
+            self.prepare_after = int(self.config['prepare_after'])
+            self._entries.clear()
+            sanepg2.max_session_statements = int(self.config['statements_per_connection'])
+
+    def get(self, key):
+        """Return cached QueryTemplate for key or None."""
+        with self._lock:
+            template = self._entries.get(key)
+            if template is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                template.uses += 1
+            else:
+                self._counters['misses'] += 1
+        sanepg2.request_stat_add('compiled_query_hits' if template is not None else 'compiled_query_misses')
+        return template
+
+    def put(self, key, template):
+        with self._lock:
+            self._entries[key] = template
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Return a summary of cache usage for diagnostics."""
+        with self._lock:
+            result = dict(self._counters)
+            result['entries'] = len(self._entries)
+            result['size'] = self.size
+            return result
+
+# shared by all threads of the service process
+compiled_queries = CompiledQueryCache()
+
+class CompiledDataPath (object):
+    """Data resource fetched through the compiled query cache.
+
+       key: catalog identity and URL syntax key from abstract_literals()
+       slots: ValueSlot instances placed in the URL syntax objects
+       build: function returning the ermpath resource, called on cache misses
+    """
+    def __init__(self, key, slots, build):
+        self.key = key
+        self.slots = slots
+        self.build = build
+        self.sort = None
+        self.after = None
+        self.before = None
+        self.template = None
+        self.values = None
+
+    def etag(self, cur):
+        return current_catalog_snaptime(cur)
+
+    def add_sort(self, sort):
+        self.sort = sort
+
+    def add_paging(self, after, before):
+        self.after = after
+        self.before = before
+
+    def prepare(self, content_type='text/csv', limit=None, arrays_to_json=False):
+        """Find or compile the query template and bind this request's literals.
+
+           This raises the same URL, model and access errors as
+           building the ermpath resource would, so callers run it
+           before evaluating HTTP preconditions.
+        """
+        model = deriva_ctx.ermrest_catalog_model
+        key = (
+            self.key,
+            model.snaptime,
+            model.amendver,
+            deriva_ctx.ermrest_history_snaptime,
+            frozenset(deriva_ctx.ermrest_client_roles),
+            content_type,
+            limit,
+            arrays_to_json,
+        )
+        template = compiled_queries.get(key)
+        if template is None:
+            path = self.build()
+            path.add_sort(self.sort)
+            path.add_paging(self.after, self.before)
+            template = QueryTemplate()
+            for slot in self.slots:
+                slot.template = template
+            try:
+                template.set_sql(path.sql_get_checked(content_type, limit=limit, arrays_to_json=arrays_to_json))
+            finally:
+                for slot in self.slots:
+                    slot.template = None
+            compiled_queries.put(key, template)
+        values = [ slot._str for slot in self.slots ]
+        # literals which do not parse as their column type fail here
+        template.bind(values)
+        self.template = template
+        self.values = values
+
+    def get(self, conn, cur, content_type='text/csv', output_file=None, limit=None, arrays_to_json=False):
+        """Fetch resources as for AnyPath.get()."""
+        if self.template is None:
+            self.prepare(content_type, limit=limit, arrays_to_json=arrays_to_json)
+        template = self.template
+        values = self.values
+        deferred = getattr(deriva_ctx, 'ermrest_deferred_query', None)
+        if compiled_queries.prepare_after > 0 and template.uses >= compiled_queries.prepare_after \
+           and output_file is None \
+           and not (deferred is not None and content_type in [ 'application/json', 'application/x-json-stream' ]):
+            # hot query shape runs as a prepared statement
+            sql, argtypes, args = template.bind_params(values)
+            return execute_get(conn, cur, sql, content_type=content_type, params=(argtypes, args))
+        return execute_get(conn, cur, template.bind(values), content_type=content_type, output_file=output_file)
@@ -32,8 +32,9 @@ from webauthn2.util import deriva_ctx, deriva_debug
 from psycopg2._json import JSON_OID, JSONB_OID
 
 from ..exception import *
+from .. import sanepg2
 from ..util import sql_identifier, sql_literal, random_name
-from ..model.type import text_type, json_type, aggfuncs
+from ..model.type import text_type, int8_type, json_type, aggfuncs
 from ..model import predicate
 
 class _FakeEntityElem (object):
@@ -47,8 +48,34 @@ class _NullEntityElem (object):
     def sql_wheres(self, prefix=''):
         return []
 
+_model_snaptime_stmt = sanepg2.prepared_statement(
+    'ermrest_model_snaptime',
+    "SELECT ts FROM _ermrest.model_last_modified ORDER BY ts DESC LIMIT 1",
+)
+
+_catalog_snaptime_sql = """
+SELECT %(prefix)s GREATEST(
+  (SELECT ts FROM _ermrest.model_last_modified ORDER BY ts DESC LIMIT 1),
+  (SELECT ts FROM _ermrest.table_last_modified ORDER BY ts DESC LIMIT 1)
+) %(suffix)s
+"""
+
+_catalog_snaptime_stmt = sanepg2.prepared_statement(
+    'ermrest_catalog_snaptime',
+    _catalog_snaptime_sql % {'prefix': '', 'suffix': ''},
+)
+
+_catalog_snaptime_encoded_stmt = sanepg2.prepared_statement(
+    'ermrest_catalog_snaptime_encoded',
+    _catalog_snaptime_sql % {'prefix': '_ermrest.tstzencode(', 'suffix': ')'},
+)
+
 def _set_statement_timeout(cur):
-    """Try to set a sensible timeout for the next statement we will execute."""
+    """Try to set a sensible timeout for the next statement we will execute.
+
+       With a sanepg2 cursor, the setting is deferred and sent in the
+       same round trip as that next statement.
+    """
     try:
         request_timeout_s = float(deriva_ctx.ermrest_config.get('request_timeout_s', '55'))
         elapsed = datetime.datetime.now(timezone.utc) - deriva_ctx.ermrest_start_time
@@ -56,7 +83,10 @@ def _set_statement_timeout(cur):
         if remaining_time_s < 0:
             raise rest.BadRequest('Query run time limit exceeded.')
         timeout_ms = int(1000.0 * max(remaining_time_s, 0.001))
-        cur.execute("SELECT set_config('statement_timeout', %s, true);" % sql_literal(timeout_ms))
+        if isinstance(cur, sanepg2.cursor):
+            cur.set_statement_timeout(timeout_ms)
+        else:
+            cur.execute("SELECT set_config('statement_timeout', %s, true);" % sql_literal(timeout_ms))
     except Exception as e:
         deriva_debug(e)
         pass
@@ -148,22 +178,12 @@ def current_catalog_snaptime(cur, encode=False):
          False (default): return raw snaptime
          True: encode as a simple URL-safe string as time since EPOCH
     """
-    cur.execute("""
-SELECT %(prefix)s GREATEST(
-  (SELECT ts FROM _ermrest.model_last_modified ORDER BY ts DESC LIMIT 1),
-  (SELECT ts FROM _ermrest.table_last_modified ORDER BY ts DESC LIMIT 1)
-) %(suffix)s;
-""" % {
-    'prefix': '_ermrest.tstzencode(' if encode else '',
-    'suffix': ')' if encode else '',
-})
+    cur.connection.execute_prepared(cur, _catalog_snaptime_encoded_stmt if encode else _catalog_snaptime_stmt)
     return cur.fetchone()[0]
 
 def current_model_snaptime(cur):
     """The current model snaptime is the most recent change to the live model."""
-    cur.execute("""
-SELECT ts FROM _ermrest.model_last_modified ORDER BY ts DESC LIMIT 1;
-""")
+    cur.connection.execute_prepared(cur, _model_snaptime_stmt)
     return cur.fetchone()[0]
 
 def normalized_history_snaptime(cur, snapwhen, encoded=True):
@@ -197,7 +217,49 @@ SELECT GREATEST(
 })
     return cur.fetchone()[0]
 
-def make_row_thunk(conn, cur, content_type, drop_tables=[], ):
+def _stream_config(key, default):
+    try:
+        return int(deriva_ctx.ermrest_config.get(key, default))
+    except AttributeError:
+        # outside of a web request
+        return default
+
+def _row_batches(cur, fetch_rows):
+    """Yield lists of up to fetch_rows rows until cur is exhausted."""
+    while True:
+        rows = cur.fetchmany(fetch_rows)
+        if not rows:
+            break
+        yield rows
+
+def _text_blocks(texts, block_bytes):
+    """Yield text blocks of roughly block_bytes joined from texts."""
+    parts = []
+    size = 0
+    for text in texts:
+        parts.append(text)
+        size += len(text)
+        if size >= block_bytes:
+            yield ''.join(parts)
+            parts = []
+            size = 0
+    if parts:
+        yield ''.join(parts)
+
+def make_row_thunk(conn, cur, content_type, drop_tables=[], fetch_rows=None, block_bytes=None):
+    """Return a thunk generating results from cur.
+
+       Rows are fetched fetch_rows at a time. For text content types,
+       serialized rows are joined into text blocks of roughly
+       block_bytes so that each yielded item is a large output chunk.
+       The defaults come from the stream_fetch_rows and
+       stream_block_bytes configuration settings.
+    """
+    if fetch_rows is None:
+        fetch_rows = _stream_config('stream_fetch_rows', 1000)
+    if block_bytes is None:
+        block_bytes = _stream_config('stream_block_bytes', 65536)
+
     def row_thunk():
         """Allow caller to lazily expand cursor after commit.
 
@@ -206,27 +268,34 @@ def make_row_thunk(conn, cur, content_type, drop_tables=[], ):
            cursor fetch commands.
 
         """
-        
+        batches = _row_batches(cur, fetch_rows)
+
         if content_type == 'text/csv':
-            hdr = True
-            for row in cur:
-                if hdr:
-                    # need to defer accessing cur.description until after fetching 1st row
-                    yield row_to_csv([ col.name for col in cur.description ]) + '\n'
-                    hdr = False
-                yield row_to_csv(row, cur.description) + '\n'
+            def csv_texts():
+                hdr = True
+                for rows in batches:
+                    if hdr:
+                        # need to defer accessing cur.description until after fetching 1st row
+                        yield row_to_csv([ col.name for col in cur.description ]) + '\n'
+                        hdr = False
+                    for row in rows:
+                        yield row_to_csv(row, cur.description) + '\n'
+            for block in _text_blocks(csv_texts(), block_bytes):
+                yield block
 
         elif content_type in [ 'application/json', 'application/x-json-stream' ]:
-            for row in cur:
-                yield row[0] + '\n'
+            for block in _text_blocks((row[0] + '\n' for rows in batches for row in rows), block_bytes):
+                yield block
 
         elif content_type is tuple:
-            for row in cur:
-                yield row
+            for rows in batches:
+                for row in rows:
+                    yield row
 
         elif content_type is dict:
-            for row in cur:
-                yield row_to_dict(cur, row)
+            for rows in batches:
+                for row in rows:
+                    yield row_to_dict(cur, row)
 
         for table in drop_tables:
             _set_statement_timeout(cur)
@@ -237,7 +306,7 @@ def make_row_thunk(conn, cur, content_type, drop_tables=[], ):
         
     return row_thunk
 
-def page_filter_sql(keynames, descendings, types, boundary, is_before):
+def page_filter_sql(keynames, descendings, types, boundary, is_before, nullables=None, keyexprs=None):
     """Return SQL WHERE clause to filter by page boundary.
 
        Keycols, descendings, types, boundary are arrays of length N
@@ -257,14 +326,39 @@ def page_filter_sql(keynames, descendings, types, boundary, is_before):
        is_before: True for '@before(boundary)', False for
          '@after(boundary)'.
 
+       nullables: False for each column known to be NOT NULL in the
+         result set, or None if all columns may be NULL
+
+       keyexprs: SQL expressions for the columns, or None to refer to
+         them by keynames
+
+       When all columns sort in the same direction and neither the
+       columns nor the boundary values can be NULL, the result is a
+       single row-value comparison such as (a, b) > (x, y), which
+       Postgres can answer with one btree index range scan. Otherwise
+       the result is a lexicographic expansion with NULL handling.
+
     """
     assert len(keynames) == len(descendings)
     assert len(keynames) == len(boundary)
+
+    if keyexprs is None:
+        keyexprs = [ sql_identifier(keyname) for keyname in keynames ]
+
+    if nullables is not None \
+       and len(set(descendings)) == 1 \
+       and not [ n for n in nullables if n ] \
+       and not [ b for b in boundary if b.is_null() ]:
+        return '(%s) %s (%s)' % (
+            ', '.join(keyexprs),
+            '<' if descendings[0] != is_before else '>',
+            ', '.join([ boundary[i].sql_literal(types[i]) for i in range(len(keynames)) ]),
+        )
     
-    def helper(keynames, descendings, types, boundary):
+    def helper(fields, descendings, types, boundary):
         # cover non-null/non-null total orderings
         term = '%(field)s %(op)s %(boundary)s' % {
-            'field': sql_identifier(keynames[0]),
+            'field': fields[0],
             'op': { # (descending, is_before)
                 (True,  True):  '>', # field is before boundary descending
                 (True,  False): '<', # field is after boundary descending
@@ -284,25 +378,39 @@ def page_filter_sql(keynames, descendings, types, boundary, is_before):
         ntestkey = (boundary[0].is_null(), descendings[0], is_before)
         if ntestkey in nulltests:
             term += ' OR %(field)s %(ntest)s' % {
-                'field': sql_identifier(keynames[0]),
+                'field': fields[0],
                 'ntest': nulltests[ntestkey],
             }
 
-        if len(keynames) == 1:
+        if len(fields) == 1:
             return term
         else:
             # if row field matches boundary, check secondary sort order
             return '(%s) OR (%s IS NOT DISTINCT FROM %s AND (%s))' % (
                 term,
-                sql_identifier(keynames[0]),
+                fields[0],
                 boundary[0].sql_literal(types[0]) if not boundary[0].is_null() else 'NULL',
-                helper(keynames[1:], descendings[1:], types[1:], boundary[1:])
+                helper(fields[1:], descendings[1:], types[1:], boundary[1:])
             )
 
-    result = helper(keynames, descendings, types, boundary)
+    result = helper(keyexprs, descendings, types, boundary)
     return result
 
 
+def _sql_select(distinct, selects, tables, wheres):
+    """Return SQL SELECT query text for parts as from EntityPath.sql_get_parts()."""
+    return """
+SELECT 
+  %(distinct_on)s
+  %(selects)s
+FROM %(tables)s
+%(where)s
+""" % dict(distinct_on = distinct,
+           selects     = selects,
+           tables      = ' '.join(tables),
+           where       = wheres and ('WHERE ' + ' AND '.join(['(%s)' % w for w in wheres])) or ''
+           )
+
 def sort_components(sortvec, is_before):
     """Return (sortvec, sort1, sort2) SQL clauses.
 
@@ -1150,6 +1258,27 @@ class EntityElem (object):
 
         return self.keyref.join_sql(refop, '%st%d' % (prefix, ltnum), '%st%d' % (prefix, self.pos))
 
+    def link_parent_pos(self):
+        """Return position of the left-hand element this element joins to, or None for the root."""
+        if not self.keyref:
+            return None
+        if self.keyref_alias:
+            return self.epath.aliases[self.keyref_alias]
+        return self.context_pos
+
+    def link_column_names(self):
+        """Return (parent column names, own column names) equated by the join, or None.
+
+           None means the join condition is not a simple column
+           equality, e.g. a disjunction of several links.
+        """
+        if not hasattr(self.keyref, '_from_column_names'):
+            return None
+        if self.refop == '=@':
+            return self.keyref._from_column_names(), self.keyref._to_column_names()
+        else:
+            return self.keyref._to_column_names(), self.keyref._from_column_names()
+
     def sql_wheres(self, prefix=''):
         """Generate SQL row conditions for filtering this element in the epath.
            
@@ -1674,19 +1803,68 @@ class AnyPath (object):
             sortvec, sort1, sort2 = (None, None, None)
         return sortvec, sort1, sort2
 
+    def _get_page_filters(self, sortvec, keyexprs=None):
+        """Return list of SQL conditions for page keys of sortvec.
+
+           keyexprs: SQL expression for each output column name, if
+             the conditions cannot refer to output columns by name
+        """
+        a, b, c, d = zip(*sortvec)
+        if keyexprs is not None:
+            keyexprs = [ keyexprs[keyname] for keyname in a ]
+        filters = []
+        if self.after is not None:
+            filters.append(page_filter_sql(a, b, c, self.after, is_before=False, nullables=d, keyexprs=keyexprs))
+        if self.before is not None:
+            filters.append(page_filter_sql(a, b, c, self.before, is_before=True, nullables=d, keyexprs=keyexprs))
+        return filters
+
     def _get_page_sql(self, sortvec, output_type_overrides={}):
         if sortvec is not None:
-            a, b, c = zip(*sortvec)
-            if self.after is not None:
-                page = 'WHERE (%s)' % page_filter_sql(a, b, c, self.after, is_before=False)
-                if self.before is not None:
-                    page = '%s AND (%s)' % (page, page_filter_sql(a, b, c, self.before, is_before=True))
-            elif self.before is not None:
-                page = 'WHERE (%s)' % page_filter_sql(a, b, c, self.before, is_before=True)
-            else:
-                page = ''
+            filters = self._get_page_filters(sortvec)
+            page = filters and ('WHERE ' + ' AND '.join([ '(%s)' % f for f in filters ])) or ''
         return page
 
+    def _sql_sorted(self, parts, keyexprs, limit):
+        """Generate SQL query for parts with sort, page keys and limit applied.
+
+           parts: (distinct, selects, tables, wheres) as from EntityPath.sql_get_parts()
+           keyexprs: SQL expression for each output column name whose
+             output is that expression unchanged
+           limit: maximum number of rows or None
+
+           Without DISTINCT ON, page conditions, ORDER BY and LIMIT
+           go into the query itself, so Postgres can plan a top-N sort
+           or an ordered index scan. DISTINCT ON needs its own
+           ordering, so sort and page are applied by an outer query.
+           So are sort keys missing from keyexprs, e.g. arrays output
+           as JSON, since ORDER BY would see the converted output
+           while page conditions would see the raw column.
+        """
+        distinct, selects, tables, wheres = parts
+        sortvec, sort1, sort2 = self._get_sortvec()
+        limit = 'LIMIT %d' % limit if limit is not None else ''
+        if sort1 is None:
+            return "%s %s" % (_sql_select(distinct, selects, tables, wheres), limit)
+        elif distinct or [ key for key in sortvec if key[0] not in keyexprs ]:
+            sql = "SELECT * FROM (%s) s %s ORDER BY %s %s" % (
+                _sql_select(distinct, selects, tables, wheres),
+                self._get_page_sql(sortvec),
+                sort1,
+                limit
+            )
+        else:
+            sql = "%s ORDER BY %s %s" % (
+                _sql_select(distinct, selects, tables, wheres + self._get_page_filters(sortvec, keyexprs)),
+                sort1,
+                limit
+            )
+        if sort2 is not None:
+            if not limit:
+                raise BadSyntax('Page @before(...) modifier not allowed without limit parameter.')
+            sql = "SELECT * FROM (%s) s ORDER BY %s" % (sql, sort2)
+        return sql
+
     def _sql_get_agg_attributes(self, allow_extra=True):
         """Process attribute lists for aggregation APIs.
         """
@@ -1745,6 +1923,11 @@ class AnyPath (object):
            output_file writing.
         """
 
+        sql = self.sql_get_checked(content_type, limit=limit, arrays_to_json=arrays_to_json)
+        return execute_get(conn, cur, sql, content_type=content_type, output_file=output_file)
+
+    def sql_get_checked(self, content_type, limit=None, arrays_to_json=False):
+        """Enforce base entity access and generate SQL query for get()."""
         # we defer base entity enforcement to allow insert-only use cases
         if hasattr(self, '_path'):
             # EntityPath
@@ -1752,22 +1935,43 @@ class AnyPath (object):
         elif hasattr(self, 'epath'):
             self.epath._path[0].table.enforce_right('select')
 
-        sql = self.sql_get(row_content_type=content_type, limit=limit, dynauthz=True, arrays_to_json=arrays_to_json)
+        return self.sql_get(row_content_type=content_type, limit=limit, dynauthz=True, arrays_to_json=arrays_to_json)
 
-        #deriva_debug(sql)
+def execute_get(conn, cur, sql, content_type='text/csv', output_file=None, params=None):
+    """Run SQL query generated for AnyPath.get() and return its results.
 
-        if output_file:
-            # efficiently send results to file
-            _set_statement_timeout(cur)
-            serialize(cur, sql, content_type, output_file)
-            return output_file
-        else:
-            # generate rows to caller
-            sql = preserialize(sql, content_type)
-            #deriva_debug(sql)
-            _set_statement_timeout(cur)
-            cur.execute(sql)
-            return make_row_thunk(None, cur, content_type)()
+       params: (argtypes, args) if sql refers to $1, $2, ... parameters
+
+       Other arguments and results are as for AnyPath.get().
+
+       Queries with params run as prepared statements of conn and
+       cannot be combined with output_file.
+    """
+    #deriva_debug(sql)
+
+    if params is not None:
+        assert output_file is None
+        sql = preserialize(sql, content_type)
+        _set_statement_timeout(cur)
+        conn.execute_statement(cur, sql, *params)
+        return make_row_thunk(None, cur, content_type)()
+
+    if output_file:
+        # efficiently send results to file
+        _set_statement_timeout(cur)
+        serialize(cur, sql, content_type, output_file)
+        return output_file
+    else:
+        # generate rows to caller
+        sql = preserialize(sql, content_type)
+        deferred = getattr(deriva_ctx, 'ermrest_deferred_query', None)
+        if deferred is not None and content_type in [ 'application/json', 'application/x-json-stream' ]:
+            # let the ASGI entry point run this query asynchronously
+            return deferred.bind(cur, sql)
+        #deriva_debug(sql)
+        _set_statement_timeout(cur)
+        cur.execute(sql)
+        return make_row_thunk(None, cur, content_type)()
 
 class EntityPath (AnyPath):
     """Hierarchical ERM data access to whole entities, i.e. table rows.
@@ -1895,11 +2099,124 @@ class EntityPath (AnyPath):
         table = self.current_entity_table()
         column = table.columns.get_enumerable(key.keyname)
         # select access was already enforced for enumerable output columns
-        return (key.keyname, key.descending, column.type)
+        return (key.keyname, key.descending, column.type, self._nullable(column))
+
+    def _nullable(self, column):
+        """Return True if column may be NULL in the path results.
+
+           Only NOT NULL constraints which postgres enforces on a base
+           table count. Pseudo not-nulls, e.g. on view columns, are
+           not enforced. Outer joins can null-extend any column, so
+           they are not analyzed further.
+        """
+        table = getattr(column, 'table', None)
+        if not getattr(column, 'catalog_notnull', False) or table is None or table.kind != 'r':
+            return True
+        return bool([ elem for elem in self._path if elem.outer_type is not None ])
+
+    def _duplicate_free(self):
+        """Return True if the path joins at most one row of each element to each context row.
+
+           Each link is followed away from the context element. The
+           link preserves context rows when its join columns on the far
+           side cover a database-enforced unique key. Pseudo keys are
+           not enforced and so prove nothing.
+
+           Right and full outer joins, outer joins back towards the
+           context, and links which are not simple column equalities
+           are never considered duplicate-free.
+        """
+        # model.key imports this module indirectly
+        from ..model.key import Unique
+
+        context_pos = self.current_entity_position()
+        towards_root = set()
+        pos = context_pos
+        while pos is not None:
+            towards_root.add(pos)
+            pos = self._path[pos].link_parent_pos()
+
+        for elem in self._path[1:]:
+            names = elem.link_column_names()
+            if names is None:
+                return False
+            parent = self._path[elem.link_parent_pos()]
+            if elem.pos in towards_root:
+                # context is at or below elem, so parent is the far side
+                if elem.outer_type is not None:
+                    return False
+                far, far_names = parent, names[0]
+            else:
+                if elem.outer_type not in {None, 'left'}:
+                    return False
+                far, far_names = elem, names[1]
+            far_names = set(far_names)
+            if not [
+                    unique
+                    for unique in far.table.uniques.values()
+                    if isinstance(unique, Unique)
+                    and unique.columns
+                    and set([ c.name for c in unique.columns ]).issubset(far_names)
+            ]:
+                return False
+        return True
+
+    def _sql_semijoin_parts(self, dynauthz, access_type, prefix, dynauthz_testcol):
+        """Return (table, condition) selecting context rows with EXISTS semi-join over the other path elements.
+
+           Only valid for inner joins, when no other element is
+           projected. Filters all move into the EXISTS subquery where
+           they may still reference the context element.
+        """
+        context_pos = self.current_entity_position()
+        context_elem = self._path[context_pos]
+        others = [ elem for elem in self._path if elem.pos != context_pos ]
+
+        wheres = []
+        if context_elem.keyref:
+            wheres.append(context_elem.sql_join_condition(prefix))
+
+        tables = []
+        for elem in others:
+            if not tables and elem.keyref:
+                # first subquery element is correlated to context via WHERE
+                tables.append(elem.table.sql_name(dynauthz=True if dynauthz is not None else None, access_type='select', alias='%st%d' % (prefix, elem.pos)))
+                wheres.append(elem.sql_join_condition(prefix))
+            else:
+                tables.append(elem.sql_table_elem(dynauthz=True if dynauthz is not None else None, access_type='select', prefix=prefix))
+
+        for elem in self._path:
+            wheres.extend( elem.sql_wheres(prefix=prefix) )
+
+        return (
+            context_elem.table.sql_name(dynauthz=dynauthz, access_type=access_type, alias='%st%d' % (prefix, context_pos), dynauthz_testcol=dynauthz_testcol),
+            """EXISTS (
+  SELECT 1
+  FROM %(tables)s
+  %(where)s
+)""" % dict(tables = ' '.join(tables),
+            where  = wheres and ('WHERE ' + ' AND '.join(['(%s)' % w for w in wheres])) or '')
+        )
 
     def sql_get(self, selects=None, distinct_on=True, row_content_type='application/json', limit=None, dynauthz=None, access_type='select', prefix='', enforce_client=True, dynauthz_testcol=None, arrays_to_json=False):
         """Generate SQL query to get the entities described by this epath.
 
+           The query will be of the form documented for
+           sql_get_parts(), with sort, page and limit clauses added.
+
+        """
+        parts = self.sql_get_parts(selects=selects, distinct_on=distinct_on, dynauthz=dynauthz, access_type=access_type, prefix=prefix, enforce_client=enforce_client, dynauthz_testcol=dynauthz_testcol, arrays_to_json=arrays_to_json)
+        context_pos = self.current_entity_position()
+        keyexprs = {
+            col.name: "%st%d.%s" % (prefix, context_pos, sql_identifier(col.name))
+            for col in self.current_entity_table().columns_in_order()
+            if not (arrays_to_json and col.type.is_array)
+        }
+        return self._sql_sorted(parts, keyexprs, limit)
+
+    def sql_get_parts(self, selects=None, distinct_on=True, dynauthz=None, access_type='select', prefix='', enforce_client=True, dynauthz_testcol=None, arrays_to_json=False):
+        """Return (distinct, selects, tables, wheres) for a query of the entities described by this epath.
+
            The query will be of the form:
 
               SELECT 
@@ -1912,9 +2229,13 @@ class EntityPath (AnyPath):
            
            encoding path references and filter conditions.
 
+           The distinct result is the DISTINCT ON clause or an empty
+           string when the query needs no deduplication.
+
         """
         context_table = self._path[self._context_index].table
         context_pos = self.current_entity_position()
+        context_only = selects is None
 
         if selects is None:
             # non-enumerable columns will be omitted from entity results when enforcing
@@ -1975,33 +2296,22 @@ class EntityPath (AnyPath):
 
         if len(self._path) == 1:
             distinct_on = False
-            
-        sql = """
-SELECT 
-  %(distinct_on)s
-  %(selects)s
-FROM %(tables)s
-%(where)s
-""" % dict(distinct_on = distinct_on and ('DISTINCT ON (%s)' % ', '.join(distinct_on_cols)) or '',
-           selects     = selects,
-           tables      = ' '.join(tables),
-           where       = wheres and ('WHERE ' + ' AND '.join(['(%s)' % w for w in wheres])) or ''
-           )
-	
-	# This subquery is ugly and inefficient but necessary due to DISTINCT ON above
-        sortvec, sort1, sort2 = self._get_sortvec()
-        limit = 'LIMIT %d' % limit if limit is not None else ''
-        if sort1 is not None:
-            page = self._get_page_sql(sortvec)
-            sql = "SELECT * FROM (%s) s %s ORDER BY %s %s" % (sql, page, sort1, limit)
-            if sort2 is not None:
-                if not limit:
-                    raise BadSyntax('Page @before(...) modifier not allowed without limit parameter.')
-                sql = "SELECT * FROM (%s) s ORDER BY %s" % (sql, sort2)
-        else:
-            sql = "%s %s" % (sql, limit)
+        elif distinct_on and pkeys and self._duplicate_free():
+            # joins cannot repeat context rows so skip the sort or hash dedupe
+            distinct_on = False
 
-        return sql
+        if distinct_on and pkeys and context_only \
+           and not [ elem for elem in self._path if elem.outer_type is not None ]:
+            # only context columns are projected so other elements just filter
+            table, exists = self._sql_semijoin_parts(dynauthz, access_type, prefix, dynauthz_testcol)
+            return ('', selects, [ table ], [ exists ])
+
+        return (
+            distinct_on and ('DISTINCT ON (%s)' % ', '.join(distinct_on_cols)) or '',
+            selects,
+            tables,
+            wheres,
+        )
 
     def sql_delete(self):
         """Generate SQL statement to delete the entities described by this epath.
@@ -2257,7 +2567,7 @@ class AttributePath (AnyPath):
     def _get_sort_element(self, key):
         if key.keyname not in self.outputs:
             raise BadData('Sort key "%s" not among output columns.' % key.keyname)
-        return (key.keyname, key.descending, self.output_types[key.keyname])
+        return (key.keyname, key.descending, self.output_types[key.keyname], key.keyname not in self.output_notnull)
 
     def sql_get(self, split_sort=False, distinct_on=True, row_content_type='application/json', limit=None, dynauthz=None, access_type='select', prefix='', enforce_client=True, arrays_to_json=False):
         """Generate SQL query to get the resources described by this apath.
@@ -2280,8 +2590,11 @@ class AttributePath (AnyPath):
 
         outputs = set()
         output_types = {}
+        output_notnull = set()
+        output_exprs = {}
 
         for attribute, col, base in self.attributes:
+            notnull = False
             if base == self.epath:
                 # column in final entity path element
                 alias = "t%d" % self.epath.current_entity_position()
@@ -2300,11 +2613,12 @@ class AttributePath (AnyPath):
                 if typname not in {'int2', 'int4', 'int8', 'float', 'float4', 'float8', 'numeric', 'timestamptz', 'timestamp', 'date'}:
                     raise ConflictModel('Binning not supported on column type %s.' % col.type)
 
+                # render through Value.sql_literal so compiled queries slot these too
                 parts = {
                     'val':   "%s.%s" % (alias, col.sql_name()),
-                    'nbins': sql_literal(attribute.nbins),
-                    'minv':  col.type.sql_literal(str(attribute.minv)),
-                    'maxv':  col.type.sql_literal(str(attribute.maxv)),
+                    'nbins': attribute.nbins.sql_literal(int8_type),
+                    'minv':  attribute.minv.sql_literal(col.type),
+                    'maxv':  attribute.maxv.sql_literal(col.type),
                 }
 
                 bexpr = lambda e: e
@@ -2389,6 +2703,7 @@ END
                 select = "True"
             else:
                 select = "%s.%s" % (alias, col.sql_name())
+                notnull = not self.epath._nullable(col)
 
             if enforce_client \
                and col is not None \
@@ -2407,50 +2722,45 @@ END
                 outputs.add(str(attribute.alias))
                 if arrays_to_json:
                     output_types[str(attribute.alias)] = json_type
-                    selects.append('array_to_json(%s) AS %s' % (select, sql_identifier(attribute.alias)))
+                    output_exprs[str(attribute.alias)] = 'array_to_json(%s)' % select
                 else:
                     output_types[str(attribute.alias)] = col.type
-                    selects.append('%s AS %s' % (select, sql_identifier(attribute.alias)))
+                    output_exprs[str(attribute.alias)] = select
+                    if notnull:
+                        output_notnull.add(str(attribute.alias))
+                selects.append('%s AS %s' % (output_exprs[str(attribute.alias)], sql_identifier(attribute.alias)))
             else:
                 if col.name in outputs:
                     raise BadSyntax('Output column name "%s" appears more than once.' % col.name)
                 outputs.add(col.name)
                 if arrays_to_json and col.type.is_array:
                     output_types[col.name] = json_type
-                    selects.append('array_to_json(%s) AS %s' % (select, col.sql_name()))
+                    output_exprs[col.name] = 'array_to_json(%s)' % select
                 else:
                     output_types[col.name] = col.type
-                    selects.append('%s AS %s' % (select, col.sql_name()))
+                    output_exprs[col.name] = select
+                    if notnull:
+                        output_notnull.add(col.name)
+                selects.append('%s AS %s' % (output_exprs[col.name], col.sql_name()))
 
         # HACK: _get_sortvec() calls _get_sort_element() which looks at self.outputs and self.output_types
         self.outputs = outputs
         self.output_types = output_types
+        self.output_notnull = output_notnull
         sortvec, sort1, sort2 = self._get_sortvec()
-        page = ''
-        if sort1 is not None:
-            page = self._get_page_sql(sortvec)
 
         selects = ', '.join(selects)
 
-        limit = 'LIMIT %d' % limit if limit is not None else ''
-
         if split_sort:
             # let the caller compose the query and the sort clauses
+            page = ''
+            if sort1 is not None:
+                page = self._get_page_sql(sortvec)
+            limit = 'LIMIT %d' % limit if limit is not None else ''
             return (self.epath.sql_get(selects=selects, distinct_on=distinct_on, dynauthz=dynauthz, access_type=access_type, prefix=prefix, enforce_client=enforce_client, arrays_to_json=arrays_to_json), page, sort1, limit, sort2)
         else:
-            sql = self.epath.sql_get(selects=selects, distinct_on=distinct_on, dynauthz=dynauthz, access_type=access_type, prefix=prefix, enforce_client=enforce_client, arrays_to_json=arrays_to_json)
-                
-            if sort1 is not None:
-                sql = "SELECT * FROM (%s) s %s ORDER BY %s %s" % (sql, page, sort1, limit)
-
-                if sort2 is not None:
-                    if not limit:
-                        raise BadSyntax('Page @before(...) modifier not allowed without limit parameter.')
-                    sql = "SELECT * FROM (%s) s ORDER BY %s" % (sql, sort2)
-            else:
-                sql = "%s %s" % (sql, limit)        
-
-            return sql
+            parts = self.epath.sql_get_parts(selects=selects, distinct_on=distinct_on, dynauthz=dynauthz, access_type=access_type, prefix=prefix, enforce_client=enforce_client, arrays_to_json=arrays_to_json)
+            return self._sql_sorted(parts, output_exprs, limit)
 
     def sql_delete(self, del_columns, equery=None):
         """Generate SQL statement to delete the attributes described by this apath.
@@ -2564,13 +2874,15 @@ class AttributeGroupPath (AnyPath):
         self.before = before
             
     def _get_sort_element(self, key):
+        nullable = True
         if key.keyname in self.output_type_overrides:
             otype = self.output_type_overrides[key.keyname]
         elif key.keyname in self.apath.outputs:
             otype = self.apath.output_types[key.keyname]
+            nullable = key.keyname not in self.apath.output_notnull
         else:
             raise BadData('Sort key "%s" not among output columns.' % key.keyname)
-        return (key.keyname, key.descending, otype)
+        return (key.keyname, key.descending, otype, nullable)
 
     def sql_get(self, row_content_type='application/json', limit=None, dynauthz=None, access_type='select', prefix='', enforce_client=True, arrays_to_json=False):
         """Generate SQL query to get the resources described by this apath.
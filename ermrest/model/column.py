@@ -55,6 +55,7 @@ class Column (object):
         self.type = type
         self.default_value = default_value
         self.nullok = nullok if nullok is not None else True
+        self.catalog_notnull = False # NOT NULL enforced by postgres, unlike pseudo not-nulls
         self.comment = comment
         self.annotations = AltDict(lambda k: exception.NotFound(u'annotation "%s" on column %s' % (k, self)))
         self.annotations.update(annotations)
@@ -25,9 +25,10 @@ information_schema of a relational database. It represents the model as
 needed by other modules of the ermrest project.
 """
 
+import psycopg2
 from webauthn2.util import deriva_ctx, deriva_debug
 
-from .. import exception
+from .. import exception, sanepg2
 from ..util import table_exists, view_exists, column_exists, sql_literal, sql_identifier, OrderedFrozenSet
 from .misc import frozendict, annotatable_classes, hasacls_classes, hasdynacls_classes, AclBinding, current_model_snaptime
 from .schema import Model, Schema
@@ -35,17 +36,212 @@ from .type import TypesEngine
 from .column import Column
 from .table import Table
 from .key import Unique, ForeignKey, KeyReference, PseudoUnique, PseudoKeyReference
+from .snapshot import model_snapshots
 
-def introspect(cur, config=None, snapwhen=None, amendver=None):
+_dynacl_sources = [
+    ('tables', 'known_table_dynacls', 'table_rid'),
+    ('columns', 'known_column_dynacls', 'column_rid'),
+    ('fkeyrefs', 'known_fkey_dynacls', 'fkey_rid'),
+    ('pfkeyrefs', 'known_pseudo_fkey_dynacls', 'fkey_rid'),
+]
+
+def introspect(cur, config=None, snapwhen=None, amendver=None, snapshot_key=None, base=None):
     """Introspects a Catalog (i.e., a database).
     
     This function (currently) does not attempt to catch any database 
     (or other) exceptions.
     
     The 'conn' parameter must be an open connection to a database.
+
+    The optional 'snapshot_key' identifies this catalog model version
+    in the shared model snapshot store. Stored introspection rows are
+    used instead of querying the catalog, and fresh rows are stored
+    after a successful introspection.
+
+    The optional 'base' is a (snapshot_key, snapwhen) pair for an
+    earlier version of the same live model. If its rows are in the
+    snapshot store, only the model elements changed since then are
+    fetched from the catalog.
     
     Returns the introspected Model instance.
     """
+    if snapwhen is None:
+        snapwhen = current_model_snaptime(cur)
+        assert amendver is None
+    else:
+        assert amendver is not None
+
+    rows = model_snapshots.load(snapshot_key) if snapshot_key is not None else None
+    if rows is not None:
+        return build_model(cur, rows, config, snapwhen, amendver)
+
+    if base is not None:
+        rows = _introspect_delta(cur, base, snapwhen)
+    if rows is None:
+        rows = introspect_rows(cur, snapwhen)
+    model = build_model(cur, rows, config, snapwhen, amendver)
+    if snapshot_key is not None:
+        model_snapshots.store(snapshot_key, rows)
+    return model
+
+def _introspect_delta(cur, base, snapwhen):
+    """Return rows for snapwhen patched from the base snapshot, or None."""
+    base_key, base_snapwhen = base
+    if base_snapwhen is None or not (base_snapwhen < snapwhen):
+        return None
+    max_changes = int(deriva_ctx.ermrest_config.get('model_cache', {}).get('delta_max_changes', 100))
+    if max_changes <= 0:
+        return None
+    base_rows = model_snapshots.load(base_key)
+    if base_rows is None:
+        return None
+    cur.execute("SAVEPOINT ermrest_model_delta;")
+    try:
+        rows = introspect_delta_rows(cur, base_rows, base_snapwhen, snapwhen, max_changes)
+    except psycopg2.Error as te:
+        # e.g. history tables of an older catalog schema
+        cur.execute("ROLLBACK TO SAVEPOINT ermrest_model_delta;")
+        deriva_debug('ERMrest incremental model refresh failed: %s' % te)
+        return None
+    cur.execute("RELEASE SAVEPOINT ermrest_model_delta;")
+    return rows
+
+def introspect_rows(cur, snapwhen, sources=None):
+    """Fetch the catalog model rows needed by build_model().
+
+       The optional 'sources' limits the fetch to a subset of
+       'catalog', 'schemas', 'types', 'tables', 'keys',
+       'pseudo_keys', 'fkeys', 'pseudo_fkeys', and 'dynacls'.
+
+       Returns a dict of JSON-serializable row lists by source.
+    """
+    when = sql_literal(snapwhen)
+    rows = dict()
+    if sources is None:
+        sources = {'catalog', 'schemas', 'types', 'tables', 'keys', 'pseudo_keys', 'fkeys', 'pseudo_fkeys', 'dynacls'}
+
+    if 'catalog' in sources:
+        cur.execute("SELECT * FROM _ermrest.known_catalog_denorm(%s);" % when)
+        rows['catalog'] = list(cur.fetchone())
+
+    if 'schemas' in sources:
+        # get schemas (including empty ones)
+        cur.execute("SELECT * FROM _ermrest.known_schemas_denorm(%s)" % when)
+        rows['schemas'] = [ list(row) for row in cur ]
+
+    if 'types' in sources:
+        # get possible column types (including unused ones)
+        cur.execute("""
+SELECT * FROM _ermrest.known_types(%s)
+ORDER BY array_element_type_rid NULLS FIRST, domain_element_type_rid NULLS FIRST;
+""" % when)
+        rows['types'] = [ list(row) for row in cur ]
+
+    # get tables, views, etc. (including empty zero-column ones), keys, and fkeys
+    for source in ['tables', 'keys', 'pseudo_keys', 'fkeys', 'pseudo_fkeys']:
+        if source in sources:
+            cur.execute("SELECT * FROM _ermrest.known_%s_denorm(%s);" % (source, when))
+            rows[source] = [ list(row) for row in cur ]
+
+    if 'dynacls' not in sources:
+        return rows
+
+    for resourceset, sqlfunc, grpcol in _dynacl_sources:
+        cur.execute("""
+SELECT 
+  %(grpcol)s,
+  jsonb_object_agg(a.binding_name, a.binding) AS dynacls
+FROM _ermrest.%(sqlfunc)s(%(when)s) a 
+GROUP BY a.%(grpcol)s ;
+""" % {
+    'sqlfunc': sqlfunc,
+    'grpcol': grpcol,
+    'when': when,
+})
+        rows[sqlfunc] = [ list(row) for row in cur ]
+
+    return rows
+
+# (rows source, history table, expression for the affected source RID)
+_delta_sources = [
+    ('tables', 'known_tables', 's."RID"'),
+    ('tables', 'known_table_annotations', "s.rowdata->>'table_rid'"),
+    ('tables', 'known_table_acls', "s.rowdata->>'table_rid'"),
+    ('tables', 'known_columns', "s.rowdata->>'table_rid'"),
+] + [
+    # column details are embedded in their table rows
+    ('tables', htable, """(
+  SELECT c.rowdata->>'table_rid'
+  FROM _ermrest_history.known_columns c
+  WHERE c."RID" = s.rowdata->>'column_rid'
+  LIMIT 1
+)""")
+    for htable in ['known_column_annotations', 'known_column_acls', 'known_pseudo_notnulls']
+] + [
+    (source, htable, rid)
+    for source, prefix, ridcol in [
+            ('keys', 'known_key', 'key_rid'),
+            ('pseudo_keys', 'known_pseudo_key', 'key_rid'),
+            ('fkeys', 'known_fkey', 'fkey_rid'),
+            ('pseudo_fkeys', 'known_pseudo_fkey', 'fkey_rid'),
+    ]
+    for htable, rid in [
+            (prefix + 's', 's."RID"'),
+            (prefix + '_columns', "s.rowdata->>'%s'" % ridcol),
+            (prefix + '_annotations', "s.rowdata->>'%s'" % ridcol),
+    ] + ([ (prefix + '_acls', "s.rowdata->>'%s'" % ridcol) ] if source in {'fkeys', 'pseudo_fkeys'} else [])
+]
+
+def introspect_delta_rows(cur, base_rows, base_snapwhen, snapwhen, max_changes):
+    """Derive rows for snapwhen by patching rows of an earlier model version.
+
+       Table, key, and foreign key rows are only re-fetched for
+       entities with _ermrest_history records starting or ending after
+       base_snapwhen. The small catalog, schema, type, and dynamic ACL
+       row sets are always re-fetched.
+
+       Returns None if more than max_changes entities changed, in
+       which case full introspection is cheaper.
+    """
+    parts = {
+        'base': sql_literal(base_snapwhen),
+        'when': sql_literal(snapwhen),
+    }
+    cur.execute(' UNION '.join([
+        """
+SELECT %(source)s, %(rid)s
+FROM _ermrest_history.%(htable)s s
+WHERE (lower(s.during) > %(base)s::timestamptz AND lower(s.during) <= %(when)s::timestamptz)
+   OR (upper(s.during) > %(base)s::timestamptz AND upper(s.during) <= %(when)s::timestamptz)
+""" % dict(parts, source=sql_literal(source), rid=rid, htable=sql_identifier(htable))
+        for source, htable, rid in _delta_sources
+    ]) + ';')
+    changed = dict()
+    for source, rid in cur:
+        if rid is not None:
+            changed.setdefault(source, set()).add(rid)
+    if sum([ len(rids) for rids in changed.values() ]) > max_changes:
+        return None
+
+    fresh = introspect_rows(cur, snapwhen, sources={'catalog', 'schemas', 'types', 'dynacls'})
+    rows = dict(base_rows)
+    rows.update(fresh)
+    for source, rids in changed.items():
+        cur.execute('SELECT * FROM _ermrest.known_%s_denorm(%s) WHERE "RID" = ANY (%s::text[]);' % (
+            source,
+            parts['when'],
+            sql_literal(list(rids)),
+        ))
+        rows[source] = [ row for row in base_rows[source] if row[0] not in rids ] + [ list(row) for row in cur ]
+    sanepg2.request_stat_add('model_delta_refreshes')
+    return rows
+
+def build_model(cur, rows, config, snapwhen, amendver):
+    """Construct a Model from rows produced by introspect_rows().
+
+       The 'cur' is only used to prune invalid pseudo constraints and
+       ACL bindings, which are found while building the model.
+    """
     # Dicts to re-use singleton objects
     schemas  = dict()
     typesengine = TypesEngine(config)
@@ -56,14 +252,7 @@ def introspect(cur, config=None, snapwhen=None, amendver=None):
     fkeyrefs  = dict()
     pfkeyrefs = dict()
 
-    if snapwhen is None:
-        snapwhen = current_model_snaptime(cur)
-        assert amendver is None
-    else:
-        assert amendver is not None
-
-    cur.execute("SELECT * FROM _ermrest.known_catalog_denorm(%s);" % sql_literal(snapwhen))
-    annotations, acls = cur.fetchone()
+    annotations, acls = rows['catalog']
     model = Model(snapwhen, amendver, annotations, acls)
 
     #
@@ -71,16 +260,11 @@ def introspect(cur, config=None, snapwhen=None, amendver=None):
     #
     
     # get schemas (including empty ones)
-    cur.execute("SELECT * FROM _ermrest.known_schemas_denorm(%s)" % sql_literal(snapwhen))
-    for rid, schema_name, comment, annotations, acls in cur:
+    for rid, schema_name, comment, annotations, acls in rows['schemas']:
         schemas[rid] = Schema(model, schema_name, comment, annotations, acls, rid)
 
     # get possible column types (including unused ones)
-    cur.execute("""
-SELECT * FROM _ermrest.known_types(%s)
-ORDER BY array_element_type_rid NULLS FIRST, domain_element_type_rid NULLS FIRST;
-""" % sql_literal(snapwhen))
-    for rid, schema_rid, type_name, array_element_type_rid, domain_element_type_rid, domain_notnull, domain_default, comment in cur:
+    for rid, schema_rid, type_name, array_element_type_rid, domain_element_type_rid, domain_notnull, domain_default, comment in rows['types']:
         # TODO: track schema and comments?
         if domain_element_type_rid is not None:
             typesengine.add_domain_type(rid, type_name, domain_element_type_rid, domain_default, domain_notnull, comment)
@@ -90,8 +274,7 @@ ORDER BY array_element_type_rid NULLS FIRST, domain_element_type_rid NULLS FIRST
             typesengine.add_base_type(rid, type_name, comment)
 
     # get tables, views, etc. (including empty zero-column ones)
-    cur.execute("SELECT * FROM _ermrest.known_tables_denorm(%s)" % sql_literal(snapwhen))
-    for rid, schema_rid, table_name, table_kind, comment, annotations, acls, coldocs in cur:
+    for rid, schema_rid, table_name, table_kind, comment, annotations, acls, coldocs in rows['tables']:
         tcols = []
         for i in range(len(coldocs)):
             cdoc = coldocs[i]
@@ -130,6 +313,7 @@ ORDER BY array_element_type_rid NULLS FIRST, domain_element_type_rid NULLS FIRST
                 ))
             col.rid = cdoc['RID']
             col.column_num = cdoc['column_num']
+            col.catalog_notnull = cdoc.get('catalog_not_null', False)
             tcols.append(col)
             columns[col.rid] = col
 
@@ -160,8 +344,7 @@ ORDER BY array_element_type_rid NULLS FIRST, domain_element_type_rid NULLS FIRST
             ))
         pkeys[pk_colset] = pk
 
-    cur.execute("SELECT * FROM _ermrest.known_keys_denorm(%s);" % sql_literal(snapwhen))
-    for rid, schema_rid, constraint_name, table_rid, column_rids, comment, annotations in cur:
+    for rid, schema_rid, constraint_name, table_rid, column_rids, comment, annotations in rows['keys']:
         name_pair = (schemas[schema_rid].name, constraint_name)
         _introspect_pkey(
             constraint_name, 
@@ -169,9 +352,8 @@ ORDER BY array_element_type_rid NULLS FIRST, domain_element_type_rid NULLS FIRST
             lambda pk_colset: Unique(pk_colset, name_pair, comment, annotations, rid)
         )
 
-    cur.execute("SELECT * FROM _ermrest.known_pseudo_keys_denorm(%s);" % sql_literal(snapwhen))
     pruned_any = False
-    for rid, constraint_name, table_rid, column_rids, comment, annotations in cur:
+    for rid, constraint_name, table_rid, column_rids, comment, annotations in rows['pseudo_keys']:
         name_pair = ("", (constraint_name if constraint_name is not None else rid))
         try:
             _introspect_pkey(
@@ -243,9 +425,8 @@ SELECT _ermrest.model_version_bump();
         fk.references[fk_ref_map] = fkr
         return fkr
 
-    cur.execute("SELECT * FROM _ermrest.known_fkeys_denorm(%s);" % sql_literal(snapwhen))
     for rid, schema_rid, constraint_name, fk_table_rid, fk_col_rids, pk_table_rid, pk_col_rids, \
-        delete_rule, update_rule, comment, annotations, acls in cur:
+        delete_rule, update_rule, comment, annotations, acls in rows['fkeys']:
         name_pair = (schemas[schema_rid].name, constraint_name)
         fkeyrefs[rid] = _introspect_fkr(
             constraint_name,
@@ -253,9 +434,8 @@ SELECT _ermrest.model_version_bump();
             lambda fk, pk, fk_ref_map: KeyReference(fk, pk, fk_ref_map, delete_rule, update_rule, name_pair, annotations, comment, acls, rid=rid)
         )
 
-    cur.execute("SELECT * FROM _ermrest.known_pseudo_fkeys_denorm(%s);" % sql_literal(snapwhen))
     for rid, constraint_name, fk_table_rid, fk_col_rids, pk_table_rid, pk_col_rids, \
-        comment, annotations, acls in cur:
+        comment, annotations, acls in rows['pseudo_fkeys']:
         name_pair = ("", (constraint_name if constraint_name is not None else rid))
         try:
             pfkeyrefs[rid] = _introspect_fkr(
@@ -284,26 +464,15 @@ SELECT _ermrest.model_version_bump();
             pruned_any = True
 
     # AclBinding constructor needs whole model to validate binding projections...
-    for resourceset, sqlfunc, grpcol in [
-            (tables, 'known_table_dynacls', 'table_rid'),
-            (columns, 'known_column_dynacls', 'column_rid'),
-            (fkeyrefs, 'known_fkey_dynacls', 'fkey_rid'),
-            (pfkeyrefs, 'known_pseudo_fkey_dynacls', 'fkey_rid'),
-    ]:
-        cur.execute("""
-SELECT 
-  %(grpcol)s,
-  jsonb_object_agg(a.binding_name, a.binding) AS dynacls
-FROM _ermrest.%(sqlfunc)s(%(when)s) a 
-GROUP BY a.%(grpcol)s ;
-""" % {
-    'sqlfunc': sqlfunc,
-    'grpcol': grpcol,
-    'when': sql_literal(snapwhen),
-})
-        rows = list(cur) # pre-fetch the result in case we use cursor in constructor code below...
-        for rid, dynacls in rows:
-            resource = resourceset[rid]
+    resourcesets = {
+        'tables': tables,
+        'columns': columns,
+        'fkeyrefs': fkeyrefs,
+        'pfkeyrefs': pfkeyrefs,
+    }
+    for resourceset, sqlfunc, grpcol in _dynacl_sources:
+        for rid, dynacls in rows[sqlfunc]:
+            resource = resourcesets[resourceset][rid]
             new_dynacls = {}
             for binding_name, binding_doc in dynacls.items():
                 try:
@@ -18,9 +18,11 @@
 import json
 import hashlib
 import base64
+import threading
+from collections import OrderedDict
 from webauthn2.util import deriva_ctx
 
-from .. import exception
+from .. import exception, sanepg2
 from ..util import sql_identifier, sql_literal, table_exists, constraint_exists
 from .. import ermpath
 from .type import _default_config
@@ -43,6 +45,59 @@ def _get_ermrest_config():
     except:
         return _default_config
 
+class RightsCache (object):
+    """Bounded, thread-safe LRU of access decisions for one Model.
+
+       The cache lives on a Model so that it is shared by all requests
+       using that cached model and discarded along with it when the
+       catalog moves to a new model snaptime or amendver.
+    """
+    missing = object()
+
+    def __init__(self, maxsize=None):
+        if maxsize is None:
+            maxsize = int(_get_ermrest_config().get('acl_cache_size', 100000))
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Return cached decision or RightsCache.missing."""
+        with self._lock:
+            try:
+                result = self._entries[key]
+            except KeyError:
+                return self.missing
+            self._entries.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def clear_rights_caches(resource):
+    """Discard memoized access decisions after an ACL change on resource.
+
+       Only the rights_cache of the Model containing resource is
+       cleared. A resource not yet attached to a model has no shared
+       decisions to discard.
+    """
+    deriva_ctx.ermrest_model_rights_cache.clear()
+    while resource is not None and not isinstance(getattr(resource, 'rights_cache', None), RightsCache):
+        for parent in ['model', 'schema', 'table', 'foreign_key', None]:
+            if parent is None or getattr(resource, parent, None) is not None:
+                break
+        resource = getattr(resource, parent) if parent is not None else None
+    if resource is not None:
+        resource.rights_cache.clear()
+
 def enforce_63byte_id(s, prefix="Identifier"):
     if isinstance(s, Name):
         s = s.one_str()
@@ -510,9 +565,26 @@ def keying(restype, keying):
     return helper
 
 def cache_rights(orig_method):
+    """Decorator to memoize access decisions.
+
+       Live decisions are shared across requests in the rights_cache
+       of the request's Model. Historical decisions also depend on
+       per-request state, so they are only memoized for the request.
+    """
     def helper(self, aclname, roles=None, anon_mutation_ok=False):
-        key = (self, orig_method, aclname, frozenset(roles) if roles is not None else None, anon_mutation_ok)
-        if key in deriva_ctx.ermrest_model_rights_cache:
+        if roles is None:
+            roles = deriva_ctx.ermrest_client_roles
+        key = (self, orig_method, aclname, frozenset(roles), anon_mutation_ok)
+        model = getattr(deriva_ctx, 'ermrest_catalog_model', None)
+        if model is not None and getattr(deriva_ctx, 'ermrest_history_snaptime', None) is None:
+            result = model.rights_cache.get(key)
+            if result is RightsCache.missing:
+                sanepg2.request_stat_add('acl_cache_misses')
+                result = orig_method(self, aclname, roles)
+                model.rights_cache.put(key, result)
+            else:
+                sanepg2.request_stat_add('acl_cache_hits')
+        elif key in deriva_ctx.ermrest_model_rights_cache:
             result = deriva_ctx.ermrest_model_rights_cache[key]
         else:
             result = orig_method(self, aclname, roles)
@@ -649,6 +721,7 @@ def hasacls(acls_supported, rights_supported, getparent):
                 raise exception.ConflictData('ACL name %s not supported on %s.' % (aclname, self))
         self.delete_acl(cur, None, purging=True) # enforces owner rights for us...
         self.acls.update(doc)
+        clear_rights_caches(self)
         self.enforce_right('owner') # integrity check using Python data...
         for aclname, members in self.acls.items():
             if aclname not in {'enumerate', 'select'} \
@@ -691,6 +764,7 @@ INSERT INTO _ermrest.known_%(restype)s_acls (%(cols)s acl, members) VALUES %(val
         oldvalue = self.acls.get(aclname)
 
         self.acls[aclname] = members
+        clear_rights_caches(self)
         self.enforce_right('owner') # integrity check using Python data...
 
         interp = self._interp_acl(aclname, members)
@@ -713,6 +787,7 @@ ON CONFLICT (%(cols)s) DO UPDATE SET members = %(newval)s;
                 self.acls.clear()
             elif aclname in self.acls:
                 del self.acls[aclname]
+            clear_rights_caches(self)
 
             if not purging:
                 self.enforce_right('owner') # integrity check... can't disown except when purging
@@ -847,6 +922,7 @@ def hasdynacls(dynacl_types_supported):
         doc = dict(doc)
         self.delete_dynacl(cur, None) # enforces owner rights for us...
         self.dynacls.update(doc)
+        clear_rights_caches(self)
         interp = self._interp_dynacl(None)
         if doc:
             if interp['cols']:
@@ -876,6 +952,7 @@ INSERT INTO _ermrest.known_%(restype)s_dynacls (%(cols)s binding_name, binding)
             self.dynacls[name] = False
         else:
             self.dynacls[name] = AclBinding(deriva_ctx.ermrest_catalog_model, self, name, binding)
+        clear_rights_caches(self)
 
         interp = self._interp_dynacl(name, binding)
         cur.execute("""
@@ -894,6 +971,7 @@ ON CONFLICT (%(cols)s) DO UPDATE SET binding = %(newval)s::jsonb;
             self.dynacls.clear()
         elif name in self.dynacls:
             del self.dynacls[name]
+        clear_rights_caches(self)
 
         cur.execute("""
 SELECT _ermrest.model_version_bump();
@@ -396,7 +396,7 @@ class RegexpPredicate (BinaryTextPredicate):
     sqlop = '~'
 
 @op('ciregexp')
-class RegexpPredicate (BinaryTextPredicate):
+class CIRegexpPredicate (BinaryTextPredicate):
     sqlop = '~*'
 
 @op('ts')
@@ -20,7 +20,7 @@ from webauthn2.util import deriva_ctx, deriva_debug
 
 from .. import exception
 from ..util import sql_identifier, sql_literal, view_exists, service_features
-from .misc import AltDict, AclDict, keying, annotatable, hasacls, enforce_63byte_id, current_request_snaptime
+from .misc import AltDict, AclDict, RightsCache, keying, annotatable, hasacls, enforce_63byte_id, current_request_snaptime
 from .table import Table
 from .name import Name
 
@@ -40,7 +40,7 @@ class Model (object):
     def __init__(self, snapwhen, amendver, annotations={}, acls={}):
         self.snaptime = snapwhen
         self.amendver = amendver
-        self.last_access = None # hack: slot to track LRU state for model_cache
+        self.rights_cache = RightsCache() # access decisions shared by requests using this model
         self.schemas = AltDict(
             lambda k: exception.ConflictModel(u"Schema %s does not exist." % k),
             lambda k, v: enforce_63byte_id(k, "Schema")
@@ -93,6 +93,32 @@ class Model (object):
         for schema in self.schemas.values():
             schema.check_primary_keys(require, warn)
 
+    def estimated_size(self):
+        """Return a rough estimate of memory held by this model, in bytes.
+
+           Counts a fixed overhead per model element plus the JSON size
+           of its annotations and policies.
+        """
+        def element_size(elem):
+            size = 2048
+            for attr in ('annotations', 'acls', 'dynacls'):
+                doc = getattr(elem, attr, None)
+                if doc:
+                    size += len(json.dumps(doc, default=str))
+            return size
+
+        size = element_size(self)
+        for schema in self.schemas.values():
+            size += element_size(schema)
+            for table in schema.tables.values():
+                size += element_size(table)
+                size += sum([ element_size(column) for column in table.columns.values() ])
+                size += sum([ element_size(key) for key in table.uniques.values() ])
+                for fkey in table.fkeys.values():
+                    size += element_size(fkey)
+                    size += sum([ element_size(fkr) for fkr in fkey.references.values() ])
+        return size
+
     def lookup_table(self, tname):
         """Lookup an unqualified table name if and only if it is unambiguous across schemas."""
         tables = set()
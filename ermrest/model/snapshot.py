@@ -0,0 +1,144 @@
+
+#
+# Copyright 2026 University of Southern California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Shared store of catalog model introspection snapshots.
+
+A model version is immutable once its snaptime is known, so the rows
+fetched by introspect_rows() for (catalog, snaptime, amendver) can be
+reused by every service process on the host. A process which has not
+yet seen that model version loads the snapshot file instead of running
+the _ermrest.known_* queries.
+
+Snapshots are plain JSON files, written atomically and pruned by age
+of last use.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+from webauthn2.util import deriva_debug
+
+from .. import sanepg2
+
+class ModelSnapshotStore (object):
+    """Directory of model introspection snapshots shared by service processes.
+
+       Configuration is the "model_snapshots" section of ermrest_config.json:
+
+         path: snapshot directory (default in the temp dir); null disables snapshots
+         max_files: number of snapshots kept, least recently used are removed
+    """
+    defaults = {
+        'path': os.path.join(tempfile.gettempdir(), 'ermrest-model-snapshots-%d' % os.getuid()),
+        'max_files': 256,
+    }
+
+    def __init__(self, config={}):
+        self._lock = threading.Lock()
+        self.configure(config)
+
+    def configure(self, config):
+        """Apply store configuration, falling back to defaults for missing keys."""
+        with self._lock:
+            self.config = dict(self.defaults)
+            self.config.update(config if config else {})
+            self.path = self.config['path']
+            self.max_files = int(self.config['max_files'])
+            self._stores = 0
+
+    def _key_doc(self, key):
+        # e.g. tuples become lists as they would in a stored document
+        return json.loads(json.dumps(key, default=str))
+
+    def _filename(self, key):
+        digest = hashlib.sha256(json.dumps(self._key_doc(key)).encode('utf8')).hexdigest()
+        return os.path.join(self.path, '%s.json' % digest)
+
+    def load(self, key):
+        """Return stored rows for key or None.
+
+           key: JSON-serializable model identity, e.g. (descriptor, (snapwhen, amendver))
+        """
+        if not self.path or self.max_files <= 0:
+            return None
+        fname = self._filename(key)
+        try:
+            if os.stat(self.path).st_uid != os.getuid():
+                # only trust snapshots written by the service itself
+                deriva_debug('ERMrest model snapshot directory %s has foreign owner.' % self.path)
+                return None
+            with open(fname, 'r', encoding='utf-8') as f:
+                doc = json.load(f)
+            if doc.get('key') != self._key_doc(key):
+                # digest collision or foreign file
+                return None
+            # track use for pruning
+            os.utime(fname)
+        except FileNotFoundError:
+            sanepg2.request_stat_add('model_snapshot_misses')
+            return None
+        except (OSError, ValueError) as te:
+            deriva_debug('ERMrest model snapshot %s unusable: %s' % (fname, te))
+            return None
+        sanepg2.request_stat_add('model_snapshot_hits')
+        return doc['rows']
+
+    def store(self, key, rows):
+        """Store rows for key, replacing any previous snapshot."""
+        if not self.path or self.max_files <= 0:
+            return
+        fname = self._filename(key)
+        try:
+            os.makedirs(self.path, mode=0o700, exist_ok=True)
+            # rows must round-trip exactly, so no lossy default conversion here
+            content = json.dumps({'key': self._key_doc(key), 'rows': rows}, separators=(',', ':'))
+            fd, tmpname = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.replace(tmpname, fname)
+            except:
+                os.unlink(tmpname)
+                raise
+        except (OSError, TypeError, ValueError) as te:
+            deriva_debug('ERMrest model snapshot %s not stored: %s' % (fname, te))
+            return
+        with self._lock:
+            self._stores += 1
+            prune = self._stores % 16 == 1
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Remove least recently used snapshots beyond max_files."""
+        try:
+            entries = []
+            for entry in os.scandir(self.path):
+                if entry.name.endswith('.json'):
+                    entries.append((entry.stat().st_mtime, entry.path))
+            entries.sort(reverse=True)
+            for mtime, fname in entries[self.max_files:]:
+                os.unlink(fname)
+        except OSError as te:
+            deriva_debug('ERMrest model snapshot pruning failed: %s' % te)
+
+# shared by all threads of the service process
+model_snapshots = ModelSnapshotStore()
@@ -0,0 +1,207 @@
+
+#
+# Copyright 2026 University of Southern California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""ERMREST client and group registration cache.
+
+Every catalog request makes sure its client and group identities are
+registered in ERMrest_Client and ERMrest_Group. The cache remembers
+identities already known to be registered, so that unchanged
+identities do not touch the catalog database.
+
+Entries are kept in a small SQLite file shared by all service
+processes on the host. The file is only used if it and its directory
+belong to the service user. Keys are digests of the catalog and the full
+identity object, so a changed display name or email is simply a miss.
+
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from webauthn2.util import deriva_debug
+
+from . import sanepg2
+
+def registration_cache_key(kind, catalog, obj):
+    """Return digest key for identity obj of kind registered in catalog.
+
+       kind: 'client' or 'group'
+       catalog: str of the catalog storage descriptor
+       obj: JSON-serializable identity object
+    """
+    content = json.dumps([kind, catalog, obj], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf8')).hexdigest()
+
+class RegistrationCache (object):
+    """Expiring set of registration keys shared across service processes.
+
+       Configuration is the "registration_cache" section of
+       ermrest_config.json:
+
+         path: SQLite file shared by processes (default in a private dir under the temp dir); null for per-process only
+         ttl_s: maximum age of an entry
+         size: maximum number of entries
+
+       If the shared file cannot be used, the cache falls back to a
+       per-process LRU with the same limits. A file or directory which
+       other users could have written is never used.
+    """
+    defaults = {
+        'path': os.path.join(tempfile.gettempdir(), 'ermrest-registration-cache-%d' % os.getuid(), 'registration.sqlite3'),
+        'ttl_s': 300,
+        'size': 10000,
+    }
+
+    def __init__(self, config={}):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.configure(config)
+
+    def configure(self, config):
+        """Apply cache configuration, falling back to defaults for missing keys."""
+        self.config = dict(self.defaults)
+        self.config.update(config if config else {})
+        self.path = self.config['path']
+        self.ttl_s = float(self.config['ttl_s'])
+        self.size = int(self.config['size'])
+        # drop connections to any previously configured file
+        self._local = threading.local()
+
+    def _trusted(self):
+        """Return True if the shared file can only have been written by the service user.
+
+           The directory is created with mode 0700 if missing. It must
+           belong to the service user or root and the file to the
+           service user, neither writable by group or others.
+        """
+        dname = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(dname, mode=0o700, exist_ok=True)
+        dstat = os.stat(dname)
+        if dstat.st_uid not in {os.getuid(), 0} or dstat.st_mode & 0o022:
+            return False
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            fstat = os.fstat(fd)
+        finally:
+            os.close(fd)
+        if fstat.st_uid != os.getuid() or fstat.st_mode & 0o022:
+            return False
+        return True
+
+    def _connection(self):
+        """Return this thread's SQLite connection or None if no shared file is in use."""
+        if not self.path:
+            return None
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        if not self._trusted():
+            deriva_debug('ERMrest registration cache %s has foreign owner or mode, using per-process cache.' % self.path)
+            self.path = None
+            return None
+        # never share a SQLite connection across fork
+        conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute("""
+CREATE TABLE IF NOT EXISTS registration (
+  key text PRIMARY KEY,
+  expires real NOT NULL
+) WITHOUT ROWID
+""")
+        conn.execute('CREATE INDEX IF NOT EXISTS registration_expires_idx ON registration (expires)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _shared(self, func):
+        """Run func(conn) on the shared file, returning None if unavailable."""
+        try:
+            conn = self._connection()
+            if conn is not None:
+                return func(conn)
+        except (sqlite3.Error, OSError) as te:
+            deriva_debug('ERMrest registration cache %s unavailable: %s' % (self.path, te))
+            self._local.conn = None
+        return None
+
+    def has_key(self, key, count=True):
+        """Return True if key was inserted less than ttl_s ago.
+
+           count: add the hit or miss to the request stats
+        """
+        if self.ttl_s <= 0 or self.size <= 0:
+            return False
+        now = time.time()
+        def probe(conn):
+            return conn.execute(
+                'SELECT True FROM registration WHERE key = ? AND expires > ?',
+                (key, now)
+            ).fetchone() is not None
+        found = self._shared(probe)
+        if found is None:
+            with self._lock:
+                expires = self._entries.get(key)
+                found = expires is not None and expires > now
+                if found:
+                    self._entries.move_to_end(key)
+        if count:
+            sanepg2.request_stat_add('registration_cache_hits' if found else 'registration_cache_misses')
+        return found
+
+    def insert(self, keys):
+        """Record keys as registered, evicting expired and oldest entries."""
+        if self.ttl_s <= 0 or self.size <= 0 or not keys:
+            return
+        now = time.time()
+        expires = now + self.ttl_s
+        def insert(conn):
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO registration (key, expires) VALUES (?, ?)',
+                    [ (key, expires) for key in keys ]
+                )
+                conn.execute('DELETE FROM registration WHERE expires <= ?', (now,))
+                count = conn.execute('SELECT count(*) FROM registration').fetchone()[0]
+                if count > self.size:
+                    conn.execute("""
+DELETE FROM registration
+WHERE key IN (SELECT key FROM registration ORDER BY expires LIMIT ?)
+""", (count - self.size,))
+                conn.execute('COMMIT')
+            except:
+                conn.execute('ROLLBACK')
+                raise
+            return True
+        if self._shared(insert) is None:
+            with self._lock:
+                for key in keys:
+                    self._entries.pop(key, None)
+                    self._entries[key] = expires
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+
+# shared by all threads of the service process
+registration_cache = RegistrationCache()
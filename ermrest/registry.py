@@ -27,7 +27,11 @@ that may be more sophisticated than the SimpleRegistry implementation.
 """
 
 import json
-from webauthn2.util import deriva_ctx
+import copy
+import time
+import threading
+import psycopg2
+from webauthn2.util import deriva_ctx, deriva_debug
 
 from .util import *
 from . import sanepg2
@@ -48,7 +52,11 @@ def get_registry(config):
 
     return SimpleRegistry(
         dsn=config.get("dsn"),
-        acls=config.get("acls")
+        acls=config.get("acls"),
+        standby_dsns=config.get("standby_dsns"),
+        lookup_cache_ttl_s=config.get("lookup_cache_ttl_s", 60),
+        lookup_probe_interval_s=config.get("lookup_probe_interval_s", 1.0),
+        healthcheck_interval_s=config.get("healthcheck_interval_s", 5.0),
         )
 
 class NoChange (object):
@@ -58,6 +66,12 @@ class NoChange (object):
 # sentinel singletone
 _nochange = NoChange()
 
+# the registry is itself a catalog, so any registry change bumps this version
+_registry_version_stmt = sanepg2.prepared_statement(
+    'ermrest_registry_version',
+    "SELECT ts FROM _ermrest.table_last_modified ORDER BY ts DESC LIMIT 1",
+)
+
 class Registry(object):
     """A registry of ERMREST catalogs.
 
@@ -100,6 +114,23 @@ class Registry(object):
         """Do basic health-check and return True or raise error."""
         raise NotImplementedError()
 
+    def cached_healthcheck(self):
+        """Return recent health-check status as a dict.
+
+           'healthy': True if the last health-check passed
+           'age_s': seconds since the last health-check
+
+           Implementations may reuse a recent result rather than
+           checking on every call.
+        """
+        try:
+            self.healthcheck()
+            healthy = True
+        except Exception as e:
+            deriva_debug('Registry health-check failed: %s' % e)
+            healthy = False
+        return {'healthy': healthy, 'age_s': 0.0}
+
     def lookup(self, id=None):
         """Lookup a registry and retrieve its description.
 
@@ -146,20 +177,53 @@ class SimpleRegistry(Registry):
     """
     nochange = _nochange
 
-    def __init__(self, dsn, acls):
+    def __init__(self, dsn, acls, standby_dsns=None, lookup_cache_ttl_s=60, lookup_probe_interval_s=1.0, healthcheck_interval_s=5.0):
         """Initialized the SimpleRegistry.
+
+           standby_dsns: optional list of hot standby DSNs for lookups
+           lookup_cache_ttl_s: max age of cached lookup results (0 disables cache)
+           lookup_probe_interval_s: min interval between registry version probes
+           healthcheck_interval_s: interval between background health-checks
         """
         super(SimpleRegistry, self).__init__(acls)
         self.dsn = dsn
-
-    def pooled_perform(self, body, post_commit=lambda x: x):
-        pc = sanepg2.PooledConnection(self.dsn)
+        self.standby_dsns = list(standby_dsns) if standby_dsns else []
+        self.lookup_cache_ttl_s = float(lookup_cache_ttl_s)
+        self.lookup_probe_interval_s = float(lookup_probe_interval_s)
+        self._cache = {} # (id, dangling) -> (entries, cached_at)
+        self._cache_lock = threading.Lock()
+        self._cache_generation = 0
+        self._cache_version = None
+        self._cache_probed = 0
+        self._probe_lock = threading.Lock()
+        self.healthcheck_interval_s = float(healthcheck_interval_s)
+        self._health = None # (healthy, checked_at)
+        self._health_lock = threading.Lock()
+        self._health_monitor = None
+
+    def pooled_perform(self, body, post_commit=lambda x: x, dsn=None, standby=False):
+        pc = sanepg2.PooledConnection(dsn if dsn is not None else self.dsn, standby=standby)
         try:
             return pc.perform(body, post_commit)
         finally:
             if pc is not None:
                 pc.final()
 
+    def standby_perform(self, body, post_commit=lambda x: x):
+        """Perform read-only body on a standby, returning None if none is usable.
+
+           A body returning None marks its standby as unusable, e.g. lagging.
+        """
+        for dsn in self.standby_dsns:
+            try:
+                result = self.pooled_perform(body, post_commit, dsn=dsn, standby=True)
+            except psycopg2.Error as te:
+                deriva_debug('Skipping registry standby after error: %s' % te)
+                continue
+            if result is not None:
+                return result
+        return None
+
     def healthcheck(self):
         """Do basic health-check and return True or raise error."""
         def body(conn, cur):
@@ -176,6 +240,80 @@ WHERE id = '1';
 
         return self.pooled_perform(body)
 
+    def _refresh_health(self):
+        try:
+            self.healthcheck()
+            healthy = True
+        except Exception as e:
+            deriva_debug('Registry health-check failed: %s' % e)
+            healthy = False
+        with self._health_lock:
+            self._health = (healthy, time.time())
+            return self._health
+
+    def _health_monitor_loop(self):
+        while True:
+            time.sleep(self.healthcheck_interval_s)
+            self._refresh_health()
+
+    def _ensure_health_monitor(self):
+        # (re-)start after fork() which does not preserve the thread
+        monitor = self._health_monitor
+        if monitor is not None and monitor.is_alive():
+            return
+        with self._health_lock:
+            if self._health_monitor is monitor:
+                self._health_monitor = threading.Thread(target=self._health_monitor_loop, name='ermrest-registry-health', daemon=True)
+                self._health_monitor.start()
+
+    def cached_healthcheck(self):
+        """Return health-check status refreshed by a background thread.
+
+           A result older than three refresh intervals, e.g. because
+           the check itself is stuck, counts as unhealthy.
+        """
+        self._ensure_health_monitor()
+        with self._health_lock:
+            health = self._health
+        if health is None:
+            health = self._refresh_health()
+        healthy, checked_at = health
+        age_s = time.time() - checked_at
+        return {
+            'healthy': healthy and age_s < 3 * self.healthcheck_interval_s,
+            'age_s': age_s,
+        }
+
+    def invalidate(self):
+        """Discard cached lookup results, e.g. after a registry change."""
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_generation += 1
+
+    def _probe_version(self):
+        """Discard cached lookup results if the registry changed since the last probe.
+
+           At most one probe runs per lookup_probe_interval_s. Other
+           lookups during a probe keep using the cache.
+        """
+        if (time.time() - self._cache_probed) < self.lookup_probe_interval_s:
+            return
+        if not self._probe_lock.acquire(blocking=False):
+            return
+        try:
+            def body(conn, cur):
+                conn.execute_prepared(cur, _registry_version_stmt)
+                return cur.fetchone()[0]
+            version = self.pooled_perform(body)
+            with self._cache_lock:
+                if version != self._cache_version:
+                    self._cache.clear()
+                    self._cache_generation += 1
+                    self._cache_version = version
+                self._cache_probed = time.time()
+        finally:
+            self._probe_lock.release()
+
     def _lookup(self, conn, cur, id=None, dangling=None):
         cur.execute("""
 SELECT jsonb_build_object(
@@ -215,9 +353,46 @@ WHERE l.deleted_on IS NULL
         2. Aliased live augment (1) with non-null values for {alias_target, alias_created_on}
         3. Dangling aliases augment (2) with non-null values for {deleted_on}
         """
+        key = (id, dangling)
+        generation = None
+        bound = None
+        if self.lookup_cache_ttl_s > 0:
+            self._probe_version()
+            with self._cache_lock:
+                cached = self._cache.get(key)
+                generation = self._cache_generation
+                bound = self._cache_version
+            if cached is not None and (time.time() - cached[1]) < self.lookup_cache_ttl_s:
+                sanepg2.request_stat_add('registry_cache_hits')
+                return copy.deepcopy(cached[0])
+            sanepg2.request_stat_add('registry_cache_misses')
+
         def body(conn, cur):
             return self._lookup(conn, cur, id, dangling)
-        return self.pooled_perform(body)
+
+        def standby_body(conn, cur):
+            if bound is not None:
+                # a standby behind the last probed primary version is of no use
+                conn.execute_prepared(cur, _registry_version_stmt)
+                version = cur.fetchone()[0]
+                if version is None or version < bound:
+                    return None
+            return self._lookup(conn, cur, id, dangling)
+
+        entries = self.standby_perform(standby_body)
+        if entries is not None and bound is None and not entries:
+            # without a version bound, a lagging standby may not know a new entry yet
+            entries = None
+        cacheable = entries is None or bound is not None
+        if entries is None:
+            entries = self.pooled_perform(body)
+
+        if self.lookup_cache_ttl_s > 0 and cacheable:
+            with self._cache_lock:
+                # skip results which may predate a concurrent invalidation
+                if generation == self._cache_generation:
+                    self._cache[key] = (copy.deepcopy(entries), time.time())
+        return entries
 
     def _set_webauthn_context(self, cur):
         """Prepare registry DB connection for mutations on behalf of web client
@@ -255,20 +430,7 @@ SET "Display_Name" = excluded."Display_Name",
     'email': sql_literal(client_obj.get('email')),
     'client_obj': sql_literal(json.dumps(client_obj)),
 })
-        cur.execute("""
-SELECT set_config('webauthn2.client', %(client)s, false);
-SELECT set_config('webauthn2.client_json', %(client_obj)s, false);
-SELECT set_config('webauthn2.attributes', %(attributes)s, false);
-SELECT set_config('webauthn2.attributes_array', (ARRAY[%(attributes_list)s]::text[])::text, false);
-""" % {
-    'client': sql_literal(client),
-    'client_obj': sql_literal(json.dumps(client_obj)),
-    'attributes': sql_literal(json.dumps(attributes)),
-    'attributes_list': ','.join([
-        sql_literal(attr)
-        for attr in attributes
-    ]),
-})
+        cur.connection.set_webauthn_context(cur, client, client_obj, attributes)
 
     def claim_id(self, id=None, id_owner=None):
         """Claim and return a distinct catalog identifier.
@@ -316,7 +478,10 @@ RETURNING id;
 })
             return cur.fetchone()[0]
 
-        return self.pooled_perform(body, lambda x: x)
+        try:
+            return self.pooled_perform(body, lambda x: x)
+        finally:
+            self.invalidate()
 
     def register(self, id, descriptor=None, alias_target=_nochange, name=_nochange, description=_nochange, is_catalog=None, clone_source=_nochange, is_persistent=_nochange):
         """Register a catalog descriptor or alias target for an already claimed id.
@@ -479,7 +644,10 @@ WHERE id = %(id)s;
         def post_commit(entry):
             return entry
 
-        return self.pooled_perform(body, post_commit)
+        try:
+            return self.pooled_perform(body, post_commit)
+        finally:
+            self.invalidate()
 
     def unregister(self, id):
         """See Registry.unregister()"""
@@ -514,4 +682,7 @@ SELECT * FROM softdeleted_catalog;
             if not deleted:
                 raise KeyError("catalog identifier ("+id+") does not exist")
 
-        return self.pooled_perform(body, post_commit)
+        try:
+            return self.pooled_perform(body, post_commit)
+        finally:
+            self.invalidate()
@@ -21,7 +21,8 @@ This module provides a customized psycopg2 connection class that can
 be used as a connection_factory parameter to the normal
 psycopg2.connect() factory.  Also provided is a convenience pool()
 factory to create a ThreadedConnectionPool that will use this
-customized connection class.
+customized connection class, and a PoolManager which maintains
+bounded per-database pools under a global connection budget.
 
 The purpose of the customized connection class is to make it easier to
 use a sane combination of psycopg2 features:
@@ -42,32 +43,278 @@ result before serialization commences.
 import psycopg2
 import psycopg2.pool
 import sys
+import io
+import json
+import hashlib
 import traceback
-import datetime
-import math
+import time
+import threading
+import collections
 from webauthn2.util import deriva_debug, deriva_ctx
 
+# marker raised by _ermrest.table_audit() when it first logs rows in a transaction
+AUDIT_PENDING_NOTICE = 'ermrest_audit_pending'
+
+class _NoticeMonitor (object):
+    """Stand-in for connection.notices which watches for the audit marker.
+
+       Other notices are discarded rather than accumulated.
+    """
+    def __init__(self):
+        self.audit_pending = False
+
+    def append(self, notice):
+        if AUDIT_PENDING_NOTICE in notice:
+            self.audit_pending = True
+
+# name -> (argtypes, sql) for hot-path statements prepared lazily on each backend
+_prepared_statements = dict()
+
+# name -> seconds last observed for server-side PREPARE, to estimate savings
+_prepare_seconds = dict()
+
+def prepared_statement(name, sql, argtypes=()):
+    """Register fixed SQL to run as a named server-side prepared statement.
+
+       The sql refers to arguments as $1, $2, ... with types listed in
+       argtypes.  Returns name for use with connection.execute_prepared().
+    """
+    _prepared_statements[name] = (tuple(argtypes), sql)
+    return name
+
+def request_stat_add(key, value=1):
+    """Accumulate value into the per-request statistics, if any.
+
+       Statistics are reported with the final request log record.
+    """
+    stats = getattr(deriva_ctx, 'ermrest_request_stats', None)
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + value
+
+_set_webauthn_stmt = prepared_statement(
+    'ermrest_set_webauthn',
+    """
+SELECT
+  set_config('webauthn2.client', $1, false),
+  set_config('webauthn2.client_json', $2, false),
+  set_config('webauthn2.attributes', $3, false),
+  set_config('webauthn2.attributes_array', $4::text, false)
+""",
+    ['text', 'text', 'text', 'text[]'],
+)
+
+# bound on statements prepared per session by connection.execute_statement()
+max_session_statements = 64
+
+class cursor (psycopg2.extensions.cursor):
+    """Customized psycopg2 cursor which counts round trips and folds in statement timeouts.
+
+       A timeout set with set_statement_timeout() is sent as a SET
+       LOCAL prefix in the same round trip as the next statement,
+       rather than as a separate statement of its own.
+    """
+    def __init__(self, *args, **kwargs):
+        psycopg2.extensions.cursor.__init__(self, *args, **kwargs)
+        self._pending_timeout_ms = None
+
+    def set_statement_timeout(self, timeout_ms):
+        """Set statement_timeout for the rest of the transaction as part of the next statement."""
+        self._pending_timeout_ms = int(timeout_ms)
+
+    def _take_timeout_sql(self):
+        timeout_ms, self._pending_timeout_ms = self._pending_timeout_ms, None
+        if timeout_ms is None:
+            return None
+        return 'SET LOCAL statement_timeout = %d;\n' % timeout_ms
+
+    def execute(self, query, vars=None):
+        timeout_sql = self._take_timeout_sql()
+        if timeout_sql is not None:
+            if self.name is None:
+                query = timeout_sql + query
+            else:
+                # a named cursor can only declare a single statement
+                setcur = self.connection.cursor()
+                setcur.execute(timeout_sql)
+                setcur.close()
+        request_stat_add('round_trips')
+        return psycopg2.extensions.cursor.execute(self, query, vars)
+
+    def copy_expert(self, sql, file, size=8192):
+        timeout_sql = self._take_timeout_sql()
+        if timeout_sql is not None:
+            # COPY cannot share a multi-statement query
+            self.execute(timeout_sql)
+        request_stat_add('round_trips')
+        return psycopg2.extensions.cursor.copy_expert(self, sql, file, size)
+
 class connection (psycopg2.extensions.connection):
     """Customized psycopg2 connection factory with per-execution() cursor support.
 
     """
     def __init__(self, dsn):
         psycopg2.extensions.connection.__init__(self, dsn)
+        self.cursor_factory = cursor
         self._curnumber  = 1
+        self._notice_monitor = _NoticeMonitor()
+        self.notices = self._notice_monitor
+        # prepared statements only live as long as the backend session
+        self._prepared = set()
+        # LRU of statement names prepared by execute_statement()
+        self._session_statements = collections.OrderedDict()
+        # names whose PREPARE may or may not have happened before an error
+        self._session_statements_unsure = set()
+        # digests of webauthn2.* settings committed or pending in this session
+        self._webauthn_installed = None
+        self._webauthn_pending = None
+        # set by PooledConnection for connections to a hot standby
+        self.standby = False
         cur = self.cursor()
-        cur.execute("""
-CREATE TEMPORARY TABLE IF NOT EXISTS ermrest_audit_log (
-    id serial PRIMARY KEY,
-    ts timestamptz NOT NULL,
-    table_rid text NOT NULL,
-    op text NOT NULL,
-    detail jsonb
-)
-ON COMMIT DELETE ROWS;
-""")
+        # audit trigger signals pending log rows with a notice, so make sure we receive it
+        cur.execute("SET client_min_messages TO notice;")
         self.commit()
         del cur
 
+    @property
+    def audit_pending(self):
+        """True if audit triggers have logged rows in the current transaction."""
+        return self._notice_monitor.audit_pending
+
+    def commit(self):
+        self._notice_monitor.audit_pending = False
+        pending, self._webauthn_pending = self._webauthn_pending, None
+        if self.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            request_stat_add('round_trips')
+        try:
+            psycopg2.extensions.connection.commit(self)
+        except:
+            # we cannot tell what is installed after a failed commit
+            self._webauthn_installed = None
+            raise
+        if pending is not None:
+            self._webauthn_installed = pending
+
+    def rollback(self):
+        self._notice_monitor.audit_pending = False
+        self._webauthn_pending = None
+        if self.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            request_stat_add('round_trips')
+        psycopg2.extensions.connection.rollback(self)
+
+    def set_isolation_level(self, level):
+        # psycopg2 may roll back an open transaction here
+        self._notice_monitor.audit_pending = False
+        self._webauthn_pending = None
+        if self.standby and level == psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE:
+            # hot standby servers cannot run serializable transactions
+            level = psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ
+        psycopg2.extensions.connection.set_isolation_level(self, level)
+
+    def execute_prepared(self, cur, name, args=()):
+        """Run registered prepared statement name with args in cur.
+
+           The statement is prepared on first use by this connection.
+           Returns cur so results can be fetched from it.
+        """
+        if name not in self._prepared:
+            argtypes, sql = _prepared_statements[name]
+            t0 = time.perf_counter()
+            cur.execute('PREPARE %s%s AS %s' % (
+                name,
+                ('(%s)' % ', '.join(argtypes)) if argtypes else '',
+                sql,
+            ))
+            _prepare_seconds[name] = time.perf_counter() - t0
+            self._prepared.add(name)
+            request_stat_add('prepared_misses')
+        else:
+            request_stat_add('prepared_hits')
+            request_stat_add('prepared_saved_ms', round(1000.0 * _prepare_seconds.get(name, 0.0), 3))
+        if args:
+            cur.execute('EXECUTE %s(%s)' % (name, ', '.join([ '%s' for a in args ])), args)
+        else:
+            cur.execute('EXECUTE %s' % name)
+        return cur
+
+    def execute_statement(self, cur, sql, argtypes=(), args=()):
+        """Run generated sql with $1, $2, ... parameters as a prepared statement.
+
+           argtypes: SQL type names of the parameters
+           args: parameter values
+
+           The statement is named by a digest of sql and argtypes and
+           prepared on first use by this connection, so repeated query
+           shapes skip parsing and can settle on a generic plan. At most
+           max_session_statements are kept per connection, and the least
+           recently used are deallocated. Returns cur so results can be
+           fetched from it.
+        """
+        name = 'ermrest_q_%s' % hashlib.sha256(
+            json.dumps([sql, list(argtypes)]).encode('utf8')
+        ).hexdigest()[0:32]
+        if name in self._session_statements_unsure:
+            # PREPARE is not undone by rollback, so ask the server
+            self._session_statements_unsure.discard(name)
+            cur.execute('SELECT True FROM pg_prepared_statements WHERE name = %s', (name,))
+            if cur.fetchone() is not None:
+                self._session_statements[name] = True
+        # setup statements share the round trip of the EXECUTE
+        setup = []
+        stales = []
+        if name in self._session_statements:
+            self._session_statements.move_to_end(name)
+            request_stat_add('statement_prepared_hits')
+        else:
+            while len(self._session_statements) >= max(max_session_statements, 1):
+                stale, _ = self._session_statements.popitem(last=False)
+                stales.append(stale)
+                setup.append('DEALLOCATE %s;\n' % stale)
+            setup.append('PREPARE %s%s AS %s;\n' % (
+                name,
+                ('(%s)' % ', '.join(argtypes)) if argtypes else '',
+                sql,
+            ))
+            request_stat_add('statement_prepared_misses')
+        if args:
+            query = 'EXECUTE %s(%s)' % (name, ', '.join([ '%s' for a in args ]))
+            setup = [ part.replace('%', '%%') for part in setup ]
+        else:
+            query = 'EXECUTE %s' % name
+        try:
+            cur.execute(''.join(setup) + query, args if args else None)
+        except:
+            if setup:
+                self._session_statements_unsure.update(stales + [name])
+            raise
+        self._session_statements[name] = True
+        return cur
+
+    def set_webauthn_context(self, cur, client, client_obj, attributes):
+        """Install webauthn2.* session GUCs describing the web client.
+
+           client: client ID or None
+           client_obj: client descriptive object
+           attributes: list of attribute (role) IDs
+
+           These are session-level settings, so the send is skipped
+           when this connection already has the same values installed.
+           Since they revert if the transaction rolls back, a new
+           digest only counts as installed once it is committed.
+        """
+        args = (
+            client,
+            json.dumps(client_obj),
+            json.dumps(attributes),
+            list(attributes),
+        )
+        digest = hashlib.sha256(json.dumps(args[0:3]).encode()).digest()
+        current = self._webauthn_pending if self._webauthn_pending is not None else self._webauthn_installed
+        if digest == current:
+            request_stat_add('webauthn_reused')
+            return
+        self.execute_prepared(cur, _set_webauthn_stmt, args)
+        self._webauthn_pending = digest
+
     def execute(self, stmt, vars=None):
         """Name and create a server-side cursor with withhold=True and run statement in it.
 
@@ -93,67 +340,353 @@ def pool(minconn, maxconn, dsn):
     """
     return psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn=dsn, connection_factory=connection)
 
+class PoolExhausted (psycopg2.pool.PoolError):
+    """No pooled connection could be obtained within the configured wait.
+
+       The retry_after attribute suggests a client back-off in seconds.
+    """
+    def __init__(self, message, retry_after=None):
+        psycopg2.pool.PoolError.__init__(self, message)
+        self.retry_after = retry_after
+
+class PoolClosed (psycopg2.pool.PoolError):
+    """The pool was reaped or retired after it was looked up.
+
+       A fresh lookup by DSN returns a pool in service.
+    """
+    pass
+
+class BoundedPool (object):
+    """A per-DSN connection pool drawing on the budget of its PoolManager.
+
+       Idle connections are reused most-recently-released first so
+       that surplus connections age out and can be reaped.  All
+       bookkeeping is guarded by the manager's condition variable.
+    """
+    def __init__(self, manager, dsn, minconn, maxconn):
+        self.manager = manager
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        # idle entries are [conn, release_time] with most recent at the end
+        self.idle = collections.deque()
+        self.used = set()
+        self.opening = 0
+        self.closed = False
+        self.last_used = time.monotonic()
+
+    def size(self):
+        return len(self.idle) + len(self.used) + self.opening
+
+    def getconn(self):
+        """Get a connection, waiting for capacity if necessary.
+
+           Raises PoolExhausted if no connection is available within
+           the configured wait timeout or if the wait queue is full.
+        """
+        return self.manager._getconn(self)
+
+    def putconn(self, conn, close=False):
+        """Return a connection previously obtained with getconn()."""
+        self.manager._putconn(self, conn, close)
+
+    def closeall(self):
+        """Close idle connections and retire this pool.
+
+           Connections still in use are closed when they are returned.
+        """
+        self.manager._retire(self)
+
+def _close_quietly(conn):
+    try:
+        if not conn.closed:
+            conn.close()
+    except Exception:
+        pass
+
 class PoolManager (object):
-    """Manage a set of database connection pools keyed by database name.
+    """Manage a set of database connection pools keyed by DSN.
+
+       Each DSN gets a BoundedPool sized by configuration while all
+       pools share a global connection budget.  When the budget is
+       exhausted, the least-recently released idle connection of any
+       pool is evicted to make room.  Otherwise callers queue for a
+       bounded time before PoolExhausted is raised.  A background
+       reaper thread closes connections idle beyond max_idle_s.
+
+       Configuration keys (ermrest_config.json "connection_pool"):
+
+          catalog_min_connections: idle connections retained per active DSN
+          catalog_max_connections: connections allowed per DSN
+          max_connections: connections allowed across all DSNs
+          max_waiters: callers allowed to queue for a connection
+          wait_timeout_s: how long a caller may queue
+          retry_after_s: back-off suggested to clients on exhaustion
+          max_idle_s: idle time before a connection is reaped
+          reaper_interval_s: reaper thread wake-up interval
+          overrides: { dbname: { catalog_min_connections, catalog_max_connections }, ... }
 
     """
-    def __init__(self):
-        # map dsn -> [pool, timestamp]
+    defaults = {
+        "catalog_min_connections": 1,
+        "catalog_max_connections": 4,
+        "max_connections": 32,
+        "max_waiters": 32,
+        "wait_timeout_s": 5.0,
+        "retry_after_s": 5,
+        "max_idle_s": 60 * 5, # 5 minutes
+        "reaper_interval_s": 30,
+        "overrides": {},
+    }
+
+    def __init__(self, config={}):
+        # map dsn -> BoundedPool
         self.pools = dict()
-        self.max_idle_seconds = 60 * 5 # 5 minutes
+        self._cond = threading.Condition()
+        self._total = 0
+        self._waiters = 0
+        self._reaper = None
+        self.configure(config)
+
+    def configure(self, config):
+        """Apply pool configuration, falling back to defaults for missing keys."""
+        with self._cond:
+            self.config = dict(self.defaults)
+            self.config.update(config if config else {})
+            self.min_connections = int(self.config['catalog_min_connections'])
+            self.max_connections = int(self.config['catalog_max_connections'])
+            self.max_total = int(self.config['max_connections'])
+            self.max_waiters = int(self.config['max_waiters'])
+            self.wait_timeout_s = float(self.config['wait_timeout_s'])
+            self.retry_after_s = int(self.config['retry_after_s'])
+            self.max_idle_seconds = float(self.config['max_idle_s'])
+            self.reaper_interval_s = float(self.config['reaper_interval_s'])
+            if self.max_connections < 1 or self.max_total < 1:
+                raise ValueError('Connection pool limits must be positive.')
+            self._cond.notify_all()
+
+    def _pool_limits(self, dsn):
+        overrides = self.config.get('overrides') or {}
+        if overrides:
+            try:
+                dbname = psycopg2.extensions.parse_dsn(dsn).get('dbname')
+            except psycopg2.ProgrammingError:
+                dbname = None
+            override = overrides.get(dbname, {})
+        else:
+            override = {}
+        minconn = int(override.get('catalog_min_connections', self.min_connections))
+        maxconn = int(override.get('catalog_max_connections', self.max_connections))
+        return minconn, max(maxconn, 1)
 
     def __getitem__(self, dsn):
         """Lookup existing or create new pool for database on demand.
 
-           May fail transiently and caller should retry.
+           Creating a pool does not open any connections.
+
+        """
+        self._ensure_reaper()
+        with self._cond:
+            bpool = self.pools.get(dsn)
+            if bpool is None:
+                minconn, maxconn = self._pool_limits(dsn)
+                bpool = self.pools[dsn] = BoundedPool(self, dsn, minconn, maxconn)
+            # keep the reaper from dropping the pool before the caller uses it
+            bpool.last_used = time.monotonic()
+            return bpool
+
+    def stats(self):
+        """Return a summary of pool usage for diagnostics."""
+        with self._cond:
+            idle = sum([ len(p.idle) for p in self.pools.values() ])
+            return {
+                "pools": len(self.pools),
+                "connections": self._total,
+                "idle": idle,
+                "in_use": self._total - idle,
+                "waiters": self._waiters,
+                "max_connections": self.max_total,
+            }
+
+    def _exhausted(self, reason):
+        return PoolExhausted(
+            'Database connection pool exhausted (%s).' % reason,
+            retry_after=self.retry_after_s,
+        )
+
+    def _evict_lru_idle(self):
+        """Close least-recently released idle connection of any pool, returning True on success.
 
+           Caller must hold self._cond.
         """
-        # abandon old pools so they can be garbage collected
-        for key in list(self.pools.keys()):
+        victim_pool = None
+        for bpool in self.pools.values():
+            if bpool.idle and (victim_pool is None or bpool.idle[0][1] < victim_pool.idle[0][1]):
+                victim_pool = bpool
+        if victim_pool is None:
+            return False
+        conn, ts = victim_pool.idle.popleft()
+        self._total -= 1
+        # closing only sends a terminate message so it is fine under the lock
+        _close_quietly(conn)
+        return True
+
+    def _getconn(self, bpool):
+        deadline = time.monotonic() + self.wait_timeout_s
+        waiting = False
+        with self._cond:
             try:
-                pair = self.pools.pop(key)
-                delta = (datetime.datetime.now() - pair[1])
-                try:
-                    delta_seconds = delta.total_seconds()
-                except:
-                    delta_seconds = delta.seconds + delta.microseconds * math.pow(10,-6)
-                    
-                if delta_seconds < self.max_idle_seconds:
-                    # this pool is sufficiently active so put it back!
-                    boundpair = self.pools.setdefault(key, pair)
-                
-                if self.pools.get(key, [None])[0] != pair[0]:
-                    # our pool is not registered anymore
-                    pair[0].closeall()
-                        
-            except KeyError:
-                # another thread could have purged key before we got to it
-                pass
+                while True:
+                    if bpool.closed:
+                        raise PoolClosed('connection pool is closed')
+                    bpool.last_used = time.monotonic()
+                    if bpool.idle:
+                        conn, ts = bpool.idle.pop()
+                        bpool.used.add(conn)
+                        return conn
+                    if bpool.size() < bpool.maxconn \
+                       and (self._total < self.max_total or self._evict_lru_idle()):
+                        # reserve capacity then connect without holding the lock
+                        bpool.opening += 1
+                        self._total += 1
+                        break
+                    if not waiting:
+                        if self._waiters >= self.max_waiters:
+                            raise self._exhausted('wait queue full')
+                        self._waiters += 1
+                        waiting = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._exhausted('wait timeout')
+                    self._cond.wait(remaining)
+            finally:
+                if waiting:
+                    self._waiters -= 1
 
         try:
-            pair = self.pools[dsn]
-            pair[1] = datetime.datetime.now() # update timestamp
-            return pair[0]
-        except KeyError:
-            # atomically get/set pool
-            newpool = pool(1, 4, dsn)
-            boundpair = self.pools.setdefault(dsn, [newpool, datetime.datetime.now()])
-            if boundpair[0] is not newpool:
-                # someone beat us to it
-                newpool.closeall()
-            return boundpair[0]
-            
-
-pools = PoolManager()       
+            conn = connection(bpool.dsn)
+        except:
+            with self._cond:
+                bpool.opening -= 1
+                self._total -= 1
+                self._cond.notify_all()
+            raise
+
+        with self._cond:
+            bpool.opening -= 1
+            bpool.used.add(conn)
+        return conn
+
+    def _putconn(self, bpool, conn, close=False):
+        if not close and not conn.closed:
+            # like psycopg2.pool, discard broken connections and abort open transactions
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+
+        with self._cond:
+            if conn not in bpool.used:
+                raise psycopg2.pool.PoolError('trying to put unkeyed connection')
+            bpool.used.discard(conn)
+            if close or conn.closed or bpool.closed:
+                _close_quietly(conn)
+                self._total -= 1
+            else:
+                bpool.idle.append([conn, time.monotonic()])
+            self._cond.notify_all()
+
+    def _retire(self, bpool):
+        with self._cond:
+            bpool.closed = True
+            if self.pools.get(bpool.dsn) is bpool:
+                del self.pools[bpool.dsn]
+            while bpool.idle:
+                conn, ts = bpool.idle.popleft()
+                _close_quietly(conn)
+                self._total -= 1
+            self._cond.notify_all()
+
+    def reap(self):
+        """Close connections idle too long and drop abandoned pools."""
+        now = time.monotonic()
+        with self._cond:
+            for dsn, bpool in list(self.pools.items()):
+                active = (now - bpool.last_used) < self.max_idle_seconds
+                keep = bpool.minconn if active else 0
+                # oldest idle connections are at the front
+                while bpool.idle \
+                      and (now - bpool.idle[0][1]) >= self.max_idle_seconds \
+                      and bpool.size() > keep:
+                    conn, ts = bpool.idle.popleft()
+                    _close_quietly(conn)
+                    self._total -= 1
+                if not active and bpool.size() == 0:
+                    # holders of a stale reference must look it up again
+                    bpool.closed = True
+                    del self.pools[dsn]
+            self._cond.notify_all()
+
+    def _reaper_loop(self):
+        while True:
+            time.sleep(self.reaper_interval_s)
+            try:
+                self.reap()
+            except Exception as te:
+                deriva_debug('sanepg2.PoolManager reaper got exception %s' % te)
+
+    def _ensure_reaper(self):
+        # (re-)start after fork() which does not preserve the thread
+        reaper = self._reaper
+        if reaper is not None and reaper.is_alive():
+            return
+        with self._cond:
+            if self._reaper is reaper:
+                self._reaper = threading.Thread(target=self._reaper_loop, name='sanepg2-reaper', daemon=True)
+                self._reaper.start()
+
+pools = PoolManager()
+
+class _AuditTraceWriter (object):
+    """File-like target for COPY which sends each JSON line to the request trace."""
+    def __init__(self):
+        self._buf = io.BytesIO()
+
+    def write(self, data):
+        self._buf.write(data)
+
+    def close(self):
+        for line in self._buf.getvalue().splitlines():
+            deriva_ctx.ermrest_request_trace(json.loads(line))
+
+    def throttle(self):
+        pass
 
 class PooledConnection (object):
-    def __init__(self, dsn, shared=True):
+    def __init__(self, dsn, shared=True, standby=False):
+        """Open pooled (or unshared) connection to dsn.
+
+           standby: True if dsn names a read-only hot standby server
+        """
         if shared:
-            self.used_pool = pools[dsn]
-            self.conn = self.used_pool.getconn()
+            while True:
+                self.used_pool = pools[dsn]
+                try:
+                    self.conn = self.used_pool.getconn()
+                    break
+                except PoolClosed:
+                    # reaped or retired since lookup, so get the current pool
+                    continue
         else:
             self.used_pool = None
             self.conn = connection(dsn)
+        self.dsn = dsn
+        self.is_standby = standby
+        self.conn.standby = standby
         self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
         self.cur = self.conn.cursor()
 
@@ -165,30 +698,11 @@ class PooledConnection (object):
         assert self.conn is not None
         try:
             result = bodyfunc(self.conn, self.cur)
-            cur = self.conn.cursor()
-            cur.execute("""
-SELECT
-  l.id,
-  l.ts::text,
-  l.table_rid,
-  s.schema_name,
-  t.table_name,
-  l.op,
-  l.detail
-FROM ermrest_audit_log l
-JOIN _ermrest.known_tables t ON (l.table_rid = t."RID")
-JOIN _ermrest.known_schemas s ON (t.schema_rid = s."RID")
-""")
-            for ser, ts, trid, sname, tname, op, detail in cur:
-                deriva_ctx.ermrest_request_trace({
-                    "audit_ts": ts,
-                    "audit_op": op,
-                    "catalog": deriva_ctx.ermrest_catalog_id,
-                    "table": [trid, sname, tname],
-                    "detail": detail,
-                })
-            del cur
+            audit = self._drain_audit_log() if self.conn.audit_pending else None
             self.conn.commit()
+            if audit is not None:
+                # back-pressure from the audit writer waits until after commit
+                audit.throttle()
             return finalfunc(result)
         except (psycopg2.InterfaceError, psycopg2.OperationalError) as e:
             # reset bad connection
@@ -208,6 +722,40 @@ JOIN _ermrest.known_schemas s ON (t.schema_rid = s."RID")
                           traceback.format_exception(et, ev, tb))
             raise
 
+    def _drain_audit_log(self):
+        """Stream audit log rows written by _ermrest.table_audit() to the audit sink.
+
+           Rows are copied out in bulk as JSON lines, one event per
+           line.  Without a configured deriva_ctx.ermrest_audit_sink,
+           each event is sent to deriva_ctx.ermrest_request_trace.
+           Returns the closed output, whose throttle() the caller
+           should run after commit.
+        """
+        sink = getattr(deriva_ctx, 'ermrest_audit_sink', None)
+        out = sink.writer() if sink is not None else _AuditTraceWriter()
+        cur = self.conn.cursor()
+        # CSV with unused control chars as delimiter and quote leaves the JSON text unescaped
+        cur.copy_expert("""
+COPY (
+  SELECT json_build_object(
+    'audit_ts', l.ts::text,
+    'audit_op', l.op,
+    'catalog', %(catalog)s,
+    'table', json_build_array(l.table_rid, s.schema_name, t.table_name),
+    'detail', l.detail
+  )::text
+  FROM ermrest_audit_log l
+  JOIN _ermrest.known_tables t ON (l.table_rid = t."RID")
+  JOIN _ermrest.known_schemas s ON (t.schema_rid = s."RID")
+  ORDER BY l.id
+) TO STDOUT WITH (FORMAT csv, DELIMITER e'\\x02', QUOTE e'\\x01')
+""" % {
+    'catalog': cur.mogrify('%s', (getattr(deriva_ctx, 'ermrest_catalog_id', None),)).decode(),
+}, out)
+        cur.close()
+        out.close()
+        return out
+
     def final(self):
         if self.conn is not None:
             self.cur.close()
@@ -357,13 +357,18 @@ BEGIN
     RETURN NULL;
   END IF;
 
-  CREATE TEMPORARY TABLE IF NOT EXISTS ermrest_audit_log (
-    id serial PRIMARY KEY,
-    ts timestamptz NOT NULL,
-    table_rid text NOT NULL,
-    op text NOT NULL,
-    detail jsonb
-  ) ON COMMIT DELETE ROWS;
+  IF current_setting('ermrest.audit_pending', true) IS DISTINCT FROM 'true' THEN
+    -- first audited write in this transaction: create log lazily and tell the client to drain it
+    CREATE TEMPORARY TABLE IF NOT EXISTS ermrest_audit_log (
+      id serial PRIMARY KEY,
+      ts timestamptz NOT NULL,
+      table_rid text NOT NULL,
+      op text NOT NULL,
+      detail jsonb
+    ) ON COMMIT DELETE ROWS;
+    PERFORM set_config('ermrest.audit_pending', 'true', true);
+    RAISE NOTICE 'ermrest_audit_pending';
+  END IF;
 
   ckey := LOWER(TG_OP) || '_show_columns';
   SELECT
@@ -2467,8 +2472,18 @@ RETURNS TABLE ("RID" text, column_rid text) AS $$
   WHERE s.during @> COALESCE($1, now());
 $$ LANGUAGE SQL;
 
+IF (SELECT True
+    FROM pg_catalog.pg_proc p
+    JOIN pg_catalog.pg_namespace n ON (p.pronamespace = n.oid)
+    WHERE n.nspname = '_ermrest'
+      AND p.proname = 'known_columns_denorm'
+      AND NOT 'catalog_not_null' = ANY (p.proargnames)) THEN
+  -- drop this so we can redefine w/ different output type
+  DROP FUNCTION _ermrest.known_columns_denorm(timestamptz);
+END IF;
+
 CREATE OR REPLACE FUNCTION _ermrest.known_columns_denorm(ts timestamptz)
-RETURNS TABLE ("RID" text, table_rid text, column_num int, column_name text, type_rid text, not_null boolean, column_default text, comment text, annotations jsonb, acls jsonb) AS $$
+RETURNS TABLE ("RID" text, table_rid text, column_num int, column_name text, type_rid text, not_null boolean, catalog_not_null boolean, column_default text, comment text, annotations jsonb, acls jsonb) AS $$
 SELECT
   c."RID",
   c.table_rid,
@@ -2476,6 +2491,7 @@ SELECT
   c.column_name,
   c.type_rid,
   n.column_rid IS NOT NULL OR c.not_null AS not_null,
+  c.not_null AS catalog_not_null,
   c.column_default,
   c."comment",
   COALESCE(anno.annotations, '{}'::jsonb) AS annotations,
@@ -25,9 +25,6 @@ import re
 import json
 import hashlib
 import base64
-import datetime
-import itertools
-from collections import OrderedDict
 import flask
 from webauthn2.util import deriva_ctx, deriva_debug, negotiated_content_type
 
@@ -35,6 +32,22 @@ from ...exception import *
 from ... import sanepg2
 from ...model import normalized_history_snaptime
 from ...util import sql_literal
+from ...regcache import registration_cache, registration_cache_key
+
+_client_probe_stmt = sanepg2.prepared_statement(
+    'ermrest_client_probe',
+    """
+SELECT True
+FROM public."ERMrest_Client"
+WHERE "ID" = $1
+  AND "Display_Name" IS NOT DISTINCT FROM $2
+  AND "Full_Name" IS NOT DISTINCT FROM $3
+  AND "Email" IS NOT DISTINCT FROM $4
+  AND "Client_Object" IS NOT DISTINCT FROM $5
+LIMIT 1
+""",
+    ['text', 'text', 'text', 'text', 'jsonb'],
+)
 
 class ApiBase (object):
     def _prepare(self):
@@ -154,33 +167,15 @@ class ApiBase (object):
 
 class Api (ApiBase):
 
-    # caches keyed by (catalog descriptor, identifier URI/guid)
-    CLIENT_CACHE = OrderedDict()
-    GROUP_CACHE = OrderedDict()
-    CACHE_SIZE = 128
-    CACHE_EXPIRE_SECONDS = 30
-
-    @classmethod
-    def _cache_has_key(cls, cache, key):
-        threshold = datetime.datetime.utcnow() - datetime.timedelta(seconds=cls.CACHE_EXPIRE_SECONDS)
-        victims = []
-        if len(cache) > cls.CACHE_SIZE:
-            # prune oldest members if cache is too large
-            victims.extend(itertools.islice(cache, len(cache) - cls.CACHE_SIZE))
-        for k, v in cache.items():
-            if v < threshold:
-                # prune stale members even if cache is small enough
-                victims.append((k, v))
-            else:
-                break
-        for k, v in victims:
-            cache.pop(k, None)
-        return key in cache
+    def _client_cache_key(self, client_obj):
+        return registration_cache_key('client', str(self.catalog.manager.descriptor), client_obj)
 
-    @classmethod
-    def _cache_insert(cls, cache, key):
-        cache.pop(key, None)
-        cache[key] = datetime.datetime.utcnow()
+    def _group_cache_key(self, g):
+        return registration_cache_key(
+            'group',
+            str(self.catalog.manager.descriptor),
+            {'id': g['id'], 'display_name': g.get('display_name')}
+        )
 
     def __init__(self, catalog):
         super(Api, self).__init__()
@@ -191,10 +186,18 @@ class Api (ApiBase):
         self.after = None
 
         try:
-            self.client_register_body(
-                deriva_ctx.ermrest_catalog_pc.conn,
-                deriva_ctx.ermrest_catalog_pc.cur,
-            )
+            if not deriva_ctx.ermrest_catalog_pc.is_standby:
+                self.client_register_body(
+                    deriva_ctx.ermrest_catalog_pc.conn,
+                    deriva_ctx.ermrest_catalog_pc.cur,
+                )
+            elif self._client_register_pending():
+                # registration writes have to go to the primary
+                pc = sanepg2.PooledConnection(catalog.manager.dsn)
+                try:
+                    pc.perform(self.client_register_body)
+                finally:
+                    pc.final()
         except Exception as te:
             # allow service to function even if this mechanism is broken
             deriva_debug('Got exception during ERMrest client registration: %s.' % te)
@@ -212,6 +215,18 @@ class Api (ApiBase):
         else:
             return super(Api, self).set_http_etag(version)
 
+    def _client_register_pending(self):
+        """Return True if client_register_body() might need to write to the catalog."""
+        client = deriva_ctx.webauthn2_context.client
+        client_obj = client if isinstance(client, dict) else { 'id': client }
+        if client and not registration_cache.has_key(self._client_cache_key(client_obj), count=False):
+            return True
+        for g in (deriva_ctx.webauthn2_context.attributes or []):
+            if isinstance(g, dict) and 'identities' not in g and 'display_name' in g:
+                if not registration_cache.has_key(self._group_cache_key(g), count=False):
+                    return True
+        return False
+
     def client_register_body(self, conn, cur):
         client = deriva_ctx.webauthn2_context.client
         if isinstance(client, dict):
@@ -220,8 +235,8 @@ class Api (ApiBase):
         else:
             client_obj = { 'id': client }
 
-        cache_key = (str(self.catalog.manager.descriptor), client)
-        if client and not self._cache_has_key(self.CLIENT_CACHE, cache_key):
+        cache_key = self._client_cache_key(client_obj) if client else None
+        if client and not registration_cache.has_key(cache_key):
             parts = {
                 'id': sql_literal(client_obj['id']),
                 'display_name': sql_literal(client_obj.get('display_name')),
@@ -229,17 +244,13 @@ class Api (ApiBase):
                 'email': sql_literal(client_obj.get('email')),
                 'client_obj': sql_literal(json.dumps(client_obj)),
             }
-            cur.execute("""
-SELECT True
-FROM public."ERMrest_Client"
-WHERE "ID" = %(id)s
-  AND "Display_Name" IS NOT DISTINCT FROM %(display_name)s
-  AND "Full_Name" IS NOT DISTINCT FROM %(full_name)s
-  AND "Email" IS NOT DISTINCT FROM %(email)s
-  AND "Client_Object" IS NOT DISTINCT FROM %(client_obj)s::jsonb
-LIMIT 1;
-""" % parts
-            )
+            conn.execute_prepared(cur, _client_probe_stmt, (
+                client_obj['id'],
+                client_obj.get('display_name'),
+                client_obj.get('full_name'),
+                client_obj.get('email'),
+                json.dumps(client_obj),
+            ))
             if list(cur):
                 # found matching record
                 pass
@@ -260,7 +271,7 @@ SET "Display_Name" = excluded."Display_Name",
                 #  2. If the request handler resets connection, we don't lose this update
                 conn.commit()
 
-            self._cache_insert(self.CLIENT_CACHE, cache_key)
+            registration_cache.insert([cache_key])
 
         attrs = deriva_ctx.webauthn2_context.attributes if deriva_ctx.webauthn2_context.attributes else []
         groups = []
@@ -270,8 +281,8 @@ SET "Display_Name" = excluded."Display_Name",
             if not isinstance(g, dict):
                 g = {'id': g}
             if 'identities' not in g and 'display_name' in g:
-                cache_key = (str(self.catalog.manager.descriptor), g['id'])
-                if not self._cache_has_key(self.GROUP_CACHE, cache_key):
+                cache_key = self._group_cache_key(g)
+                if not registration_cache.has_key(cache_key):
                     groups.append(g)
                     cache_keys.append(cache_key)
 
@@ -305,8 +316,7 @@ SET "Display_Name" = excluded."Display_Name";
                 #  2. If the request handler resets connection, we don't lose this update
                 conn.commit()
 
-            for cache_key in cache_keys:
-                self._cache_insert(self.GROUP_CACHE, cache_key)
+            registration_cache.insert(cache_keys)
 
     def history_range(self, h_from, h_until):
         if deriva_ctx.ermrest_history_snaptime is not None:
@@ -408,21 +418,7 @@ SET "Display_Name" = excluded."Display_Name";
                     for a in deriva_ctx.webauthn2_context.attributes
                 ]
                 
-                cur.execute("""
-SELECT set_config('webauthn2.client', %s, false);
-SELECT set_config('webauthn2.client_json', %s, false);
-SELECT set_config('webauthn2.attributes', %s, false);
-SELECT set_config('webauthn2.attributes_array', (ARRAY[%s]::text[])::text, false);
-""" % (
-    sql_literal(client),
-    sql_literal(json.dumps(client_obj)),
-    sql_literal(json.dumps(attributes)),
-    ','.join([
-        sql_literal(attr)
-        for attr in attributes
-    ])
-)
-                )
+                conn.set_webauthn_context(cur, client, client_obj, attributes)
                 return body(conn, cur)
             except psycopg2.InterfaceError as e:
                 raise rest.ServiceUnavailable("Please try again.")
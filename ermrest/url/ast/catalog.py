@@ -27,9 +27,9 @@ from webauthn2.util import deriva_ctx, deriva_debug, negotiated_content_type
 
 from . import model, data, resolver
 from .api import ApiBase, Api
-from ... import exception, catalog, sanepg2
+from ... import exception, catalog, sanepg2, ermpath
 from ...exception import *
-from ...model import current_catalog_snaptime
+from ...model import current_catalog_snaptime, normalized_history_snaptime, current_history_amendver
 from ...util import sql_literal, service_features, __version__
 
 _application_json = 'application/json'
@@ -48,15 +48,29 @@ class Service (object):
         content_type = negotiated_content_type(flask.request.environ, self.supported_types, self.default_content_type)
 
         try:
-            status = deriva_ctx.ermrest_registry.healthcheck()
-            response = {
-                "version": __version__,
-                "features": service_features(),
-            }
+            health = deriva_ctx.ermrest_registry.cached_healthcheck()
         except Exception as e:
             deriva_debug(e)
+            health = {'healthy': False}
+        if not health['healthy']:
             raise rest.ServiceUnavailable('Registry health-check failed.')
 
+        response = {
+            "version": __version__,
+            "features": service_features(),
+            "health": {
+                "registry": "ok",
+                "age_s": round(health['age_s'], 3),
+            },
+        }
+        if deriva_ctx.ermrest_config.get('expose_service_stats', False) \
+           and flask.request.args.get('stats', 'false').lower() != 'false':
+            response["stats"] = {
+                "connection_pools": sanepg2.pools.stats(),
+                "model_cache": catalog.Catalog.model_cache_stats(),
+                "compiled_query_cache": ermpath.compiled_queries.stats(),
+            }
+
         deriva_ctx.deriva_response.content_type = content_type
         deriva_ctx.deriva_response.status_code = 200
 
@@ -215,7 +229,7 @@ class Catalog (Api):
     supported_types = [default_content_type]
 
     """A specific catalog by ID."""
-    def __init__(self, catalog_id):
+    def __init__(self, catalog_id, snapwhen=None):
         self.catalog_id = catalog_id
         self.manager = None
         entries = deriva_ctx.ermrest_registry.lookup(catalog_id)
@@ -229,13 +243,22 @@ class Catalog (Api):
         )
         
         assert deriva_ctx.ermrest_catalog_pc is None
-        deriva_ctx.ermrest_catalog_pc = sanepg2.PooledConnection(self.manager.dsn)
+        deriva_ctx.ermrest_catalog_pc = self.manager.pooled_connection(
+            read_only=(flask.request.method in {'GET', 'HEAD'}),
+            snapwhen=snapwhen,
+        )
         deriva_ctx.ermrest_catalog_id = catalog_id
 
         Api.__init__(self, self)
         # now enforce read permission
         self.enforce_right('enumerate', 'catalog/' + str(self.catalog_id))
 
+        if snapwhen is not None:
+            # bind historical snapshot for the remaining sub-resources of this request
+            cur = deriva_ctx.ermrest_catalog_pc.cur
+            deriva_ctx.ermrest_history_snaptime = normalized_history_snaptime(cur, snapwhen)
+            deriva_ctx.ermrest_history_amendver = current_history_amendver(cur, deriva_ctx.ermrest_history_snaptime)
+
     def final(self):
         deriva_ctx.ermrest_catalog_pc.final()
 
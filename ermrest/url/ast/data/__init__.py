@@ -20,13 +20,15 @@
 """
 
 import io
+import types
 import tempfile
 import psycopg2
 import datetime
 from datetime import timezone
 import flask
+import werkzeug.wsgi
 
-from webauthn2.util import urlquote, deriva_ctx
+from webauthn2.util import urlquote, deriva_ctx, deriva_debug
 
 from ..api import Api
 from . import path
@@ -84,6 +86,8 @@ def _GET(handler, uri, dresource, vresource):
         results = None
         arrays_to_json = False
 
+    spool_threshold_mb = deriva_ctx.ermrest_config.get('spool_threshold_mb', 16)
+
     def body(conn, cur):
         try:
             conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_REPEATABLE_READ)
@@ -91,7 +95,14 @@ def _GET(handler, uri, dresource, vresource):
             handler.http_check_preconditions()
             dresource.add_sort(handler.sort)
             dresource.add_paging(handler.after, handler.before)
-            return dresource.get(conn, cur, content_type=content_type, output_file=results, limit=limit, arrays_to_json=arrays_to_json)
+            lines = dresource.get(conn, cur, content_type=content_type, output_file=results, limit=limit, arrays_to_json=arrays_to_json)
+            if spool_threshold_mb is not None and isinstance(lines, types.GeneratorType):
+                # drain results now so the cursor and connection need not wait for the client
+                spool = tempfile.SpooledTemporaryFile(max_size=int(float(spool_threshold_mb) * 1024 * 1024))
+                for block in lines:
+                    spool.write(block.encode('utf8'))
+                return spool
+            return lines
         finally:
             try:
                 conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE)
@@ -118,7 +129,11 @@ def _GET(handler, uri, dresource, vresource):
             pos = lines.tell()
             lines.seek(0, 0)
             deriva_ctx.deriva_response.content_length = pos
-            deriva_ctx.deriva_response.response = lines
+            deriva_ctx.deriva_response.response = werkzeug.wsgi.wrap_file(
+                flask.request.environ,
+                lines,
+                buffer_size=int(deriva_ctx.ermrest_config.get('stream_block_bytes', 65536)),
+            )
             deriva_ctx.deriva_response.direct_passthrough = True
         else:
             deriva_ctx.deriva_response.response = lines
@@ -126,6 +141,38 @@ def _GET(handler, uri, dresource, vresource):
 
     return handler.perform(body, post_commit)
 
+def _compiled_GET(handler, uri, entity, projection, resources):
+    """Perform HTTP GET of data resources through the compiled query cache.
+
+       entity: the Entity handler of the data path
+       projection: the attribute syntax of the resource or None
+       resources: function returning (dresource, vresource) as for
+         _GET(), only called if the query is not yet compiled
+    """
+    if ermpath.compiled_queries.size > 0:
+        slots = []
+        try:
+            syntax = ermpath.abstract_literals(
+                [entity._elems, projection, handler.sort, handler.before, handler.after],
+                slots
+            )
+        except TypeError as te:
+            deriva_debug('ERMrest compiled query cache skipped %s: %s' % (uri, te))
+        else:
+            key = (str(handler.catalog.manager.descriptor), type(handler), syntax)
+            dresource = ermpath.CompiledDataPath(key, slots, lambda: resources()[0])
+            dresource.add_sort(handler.sort)
+            dresource.add_paging(handler.after, handler.before)
+            # raise path errors before preconditions as _GET(*resources()) would
+            content_type = handler.negotiated_content_type()
+            dresource.prepare(
+                content_type,
+                limit=handler.negotiated_limit(),
+                arrays_to_json=(content_type == 'text/csv' and handler.queryopts.get('arrays') == 'json'),
+            )
+            return _GET(handler, uri, dresource, dresource)
+    return _GET(handler, uri, *resources())
+
 def _PUT(handler, uri, put_thunk, vresource):
     """Perform HTTP PUT of generic data resources.
     """
@@ -221,38 +268,54 @@ class Entity (Api):
 
     def __init__(self, catalog, elem):
         Api.__init__(self, catalog)
-        cur = deriva_ctx.ermrest_catalog_pc.cur
-        self.epath = ermpath.EntityPath(deriva_ctx.ermrest_catalog_model)
-        if len(elem.name.nameparts) == 2:
-            table = deriva_ctx.ermrest_catalog_model.schemas.get_enumerable(elem.name.nameparts[0]).tables.get_enumerable(elem.name.nameparts[1])
-        elif len(elem.name.nameparts) == 1:
-            table = deriva_ctx.ermrest_catalog_model.lookup_table(elem.name.nameparts[0])
-        else:
-            raise exception.BadSyntax('Name %s is not a valid syntax for a table name.' % elem.name)
-        self.epath.set_base_entity(table, elem.alias)
+        self._elems = [ elem ]
+        self._epath = None
         self.http_vary.add('accept')
 
+    @property
+    def epath(self):
+        """The ermpath.EntityPath for this entity set, built on first use."""
+        if self._epath is None:
+            epath = ermpath.EntityPath(deriva_ctx.ermrest_catalog_model)
+            elem = self._elems[0]
+            if len(elem.name.nameparts) == 2:
+                table = deriva_ctx.ermrest_catalog_model.schemas.get_enumerable(elem.name.nameparts[0]).tables.get_enumerable(elem.name.nameparts[1])
+            elif len(elem.name.nameparts) == 1:
+                table = deriva_ctx.ermrest_catalog_model.lookup_table(elem.name.nameparts[0])
+            else:
+                raise exception.BadSyntax('Name %s is not a valid syntax for a table name.' % elem.name)
+            epath.set_base_entity(table, elem.alias)
+            for elem in self._elems[1:]:
+                self._append(epath, elem)
+            self._epath = epath
+        return self._epath
+
     def append(self, elem):
+        self._elems.append(elem)
+        if self._epath is not None:
+            self._append(self._epath, elem)
+
+    def _append(self, epath, elem):
         if elem.is_filter:
-            self.epath.add_filter(elem)
+            epath.add_filter(elem)
         elif elem.is_context:
             if len(elem.name.nameparts) > 1:
                 raise exception.BadSyntax('Context name %s is not a valid syntax for an entity alias.' % elem.name)
             try:
-                alias = self.epath[elem.name.nameparts[0]].alias
+                alias = epath[elem.name.nameparts[0]].alias
             except KeyError:
                 raise exception.BadData('Context name %s is not a bound alias in entity path.' % elem.name)
                 
-            self.epath.set_context(alias)
+            epath.set_context(alias)
         else:
-            keyref, refop, lalias = elem.resolve_link(deriva_ctx.ermrest_catalog_model, self.epath)
+            keyref, refop, lalias = elem.resolve_link(deriva_ctx.ermrest_catalog_model, epath)
             outer_type = elem.outer_type if hasattr(elem, 'outer_type') else None
-            self.epath.add_link(keyref, refop, elem.alias, lalias, outer_type=outer_type)
+            epath.add_link(keyref, refop, elem.alias, lalias, outer_type=outer_type)
             
     def GET(self, uri):
         """Perform HTTP GET of entities.
         """
-        return _GET(self, uri, self.epath, self.epath)
+        return _compiled_GET(self, uri, self, None, lambda: (self.epath, self.epath))
 
     def PUT(self, uri):
         """Perform HTTP PUT of entities.
@@ -293,19 +356,28 @@ class Attribute (Api):
     def __init__(self, catalog, elem):
         Api.__init__(self, catalog)
         self.Entity = Entity(catalog, elem)
-        self.apath = None
+        self._attributes = None
+        self._apath = None
         self.http_vary.add('accept')
 
     def append(self, elem):
         self.Entity.append(elem)
 
     def set_projection(self, attributes):
-        self.apath = ermpath.AttributePath(self.Entity.epath, _preprocess_attributes(self.Entity.epath, attributes))
+        self._attributes = attributes
+        self._apath = None
+
+    @property
+    def apath(self):
+        """The ermpath.AttributePath for this attribute set, built on first use."""
+        if self._apath is None:
+            self._apath = ermpath.AttributePath(self.Entity.epath, _preprocess_attributes(self.Entity.epath, self._attributes))
+        return self._apath
         
     def GET(self, uri):
         """Perform HTTP GET of attributes.
         """
-        return _GET(self, uri, self.apath, self.apath.epath)
+        return _compiled_GET(self, uri, self.Entity, self._attributes, lambda: (self.apath, self.apath.epath))
 
     def DELETE(self, uri):
         """Perform HTTP DELETE of entity attribute.
@@ -320,23 +392,34 @@ class AttributeGroup (Api):
     def __init__(self, catalog, elem):
         Api.__init__(self, catalog)
         self.Entity = Entity(catalog, elem)
-        self.agpath = None
+        self._groupkeys = None
+        self._attributes = None
+        self._agpath = None
         self.http_vary.add('accept')
 
     def append(self, elem):
         self.Entity.append(elem)
 
     def set_projection(self, groupkeys, attributes):
-        self.agpath = ermpath.AttributeGroupPath(
-            self.Entity.epath,
-            _preprocess_attributes(self.Entity.epath, groupkeys),
-            _preprocess_attributes(self.Entity.epath, attributes)
-        )
+        self._groupkeys = groupkeys
+        self._attributes = attributes
+        self._agpath = None
+
+    @property
+    def agpath(self):
+        """The ermpath.AttributeGroupPath for this group set, built on first use."""
+        if self._agpath is None:
+            self._agpath = ermpath.AttributeGroupPath(
+                self.Entity.epath,
+                _preprocess_attributes(self.Entity.epath, self._groupkeys),
+                _preprocess_attributes(self.Entity.epath, self._attributes)
+            )
+        return self._agpath
     
     def GET(self, uri):
         """Perform HTTP GET of attribute groups.
         """
-        return _GET(self, uri, self.agpath, self.agpath.epath)
+        return _compiled_GET(self, uri, self.Entity, [self._groupkeys, self._attributes], lambda: (self.agpath, self.agpath.epath))
 
     def PUT(self, uri, post_method=False):
         """Perform HTTP PUT of attribute groups.
@@ -351,16 +434,25 @@ class Aggregate (Api):
     def __init__(self, catalog, elem):
         Api.__init__(self, catalog)
         self.Entity = Entity(catalog, elem)
-        self.agpath = None
+        self._attributes = None
+        self._agpath = None
         self.http_vary.add('accept')
 
     def append(self, elem):
         self.Entity.append(elem)
 
     def set_projection(self, attributes):
-        self.agpath = ermpath.AggregatePath(self.Entity.epath, _preprocess_attributes(self.Entity.epath, attributes))
+        self._attributes = attributes
+        self._agpath = None
+
+    @property
+    def agpath(self):
+        """The ermpath.AggregatePath for this aggregate, built on first use."""
+        if self._agpath is None:
+            self._agpath = ermpath.AggregatePath(self.Entity.epath, _preprocess_attributes(self.Entity.epath, self._attributes))
+        return self._agpath
     
     def GET(self, uri):
         """Perform HTTP GET of attribute groups.
         """
-        return _GET(self, uri, self.agpath, self.agpath.epath)
+        return _compiled_GET(self, uri, self.Entity, self._attributes, lambda: (self.agpath, self.agpath.epath))
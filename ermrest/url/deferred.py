@@ -0,0 +1,227 @@
+
+#
+# Copyright 2026 University of Southern California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""ERMREST URL deferred handler construction.
+
+The URL grammar builds plain syntax objects (names, path elements,
+predicates, query options) directly. Handler objects such as
+ast.Catalog need the registry, a database connection, and the model,
+so the grammar only records how to build them as a tree of Deferred
+nodes.
+
+After parsing, a Deferred tree is not modified. The same tree can be
+bound any number of times, from any number of threads:
+
+   handler = bind(tree)
+
+Each bind replays the recorded constructor and method calls against
+fresh copies of the syntax objects. A tree which is bound repeatedly
+should be wrapped once as Frozen(tree), which pickles its syntax
+objects up front so each frozen.bind() only unpickles one fresh copy
+instead of deep-copying them one by one.
+
+Only constructor and method calls are recorded. Plain attribute reads
+must be named explicitly, e.g. attribute(node, 'catalog'), so a typo or
+a forgotten call fails while parsing rather than yielding a bogus node.
+
+"""
+
+import copy
+import pickle
+
+def _check_args(args, kwargs):
+    for v in list(args) + list(kwargs.values()):
+        if isinstance(v, DeferredMethod):
+            raise TypeError('Deferred method %r used as a value without calling it.' % v)
+
+class Deferred (object):
+    """Record of a handler value to produce in the binding phase.
+
+       Deferred(func, *args, **kwargs) stands for func(*args, **kwargs).
+
+       Method calls on a node are recorded rather than performed.
+       Each call is also registered as an effect of its receiver, so
+       calls made only for their side effects, e.g. path.append(elem),
+       are replayed in their original order when the receiver is
+       bound.
+
+       When func is a class, only its methods can be called on the
+       node. Nodes for method results accept any method name, since
+       their type is not known before binding.
+    """
+    __slots__ = ('_kind', '_func', '_args', '_kwargs', '_parent', '_name', '_effects')
+
+    def __init__(self, func, *args, **kwargs):
+        _check_args(args, kwargs)
+        self._kind = 'new'
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._parent = None
+        self._name = None
+        self._effects = []
+
+    @classmethod
+    def _node(cls, kind, parent, name=None, args=(), kwargs={}):
+        node = cls.__new__(cls)
+        node._kind = kind
+        node._func = None
+        node._args = args
+        node._kwargs = kwargs
+        node._parent = parent
+        node._name = name
+        node._effects = []
+        return node
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if self._kind == 'new' and isinstance(self._func, type) \
+           and not callable(getattr(self._func, name, None)):
+            raise AttributeError('%s has no method %s' % (self._func.__name__, name))
+        return DeferredMethod(self, name)
+
+    def __repr__(self):
+        if self._kind == 'new':
+            return '<Deferred %s>' % getattr(self._func, '__name__', self._func)
+        elif self._kind == 'attr':
+            return '<Deferred %r.%s>' % (self._parent, self._name)
+        else:
+            return '<Deferred %r.%s(...)>' % (self._parent, self._name)
+
+    def _bind(self, env):
+        if self in env:
+            return env[self]
+        if self._kind == 'new':
+            value = self._func(*bind(self._args, env), **bind(self._kwargs, env))
+        elif self._kind == 'attr':
+            value = getattr(self._parent._bind(env), self._name)
+        else:
+            func = getattr(self._parent._bind(env), self._name)
+            if self in env:
+                # already replayed as an effect while binding our receiver
+                return env[self]
+            value = func(*bind(self._args, env), **bind(self._kwargs, env))
+        env[self] = value
+        for effect in self._effects:
+            effect._bind(env)
+        return value
+
+class DeferredMethod (object):
+    """Method of a Deferred node, which can only be called."""
+    __slots__ = ('_receiver', '_name')
+
+    def __init__(self, receiver, name):
+        self._receiver = receiver
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        _check_args(args, kwargs)
+        node = Deferred._node('call', self._receiver, name=self._name, args=args, kwargs=kwargs)
+        self._receiver._effects.append(node)
+        return node
+
+    def __repr__(self):
+        return '<DeferredMethod %r.%s>' % (self._receiver, self._name)
+
+def attribute(node, name):
+    """Return a Deferred node for reading attribute name of node once bound."""
+    return Deferred._node('attr', node, name=name)
+
+def _syntax_objects(x, found, seen):
+    """Append to found the syntax objects bind(x) would copy, in walk order."""
+    if isinstance(x, Deferred):
+        if x in seen:
+            return found
+        seen.add(x)
+        _syntax_objects(x._args, found, seen)
+        _syntax_objects(x._kwargs, found, seen)
+        if x._parent is not None:
+            _syntax_objects(x._parent, found, seen)
+        _syntax_objects(x._effects, found, seen)
+    elif type(x) in (tuple, list):
+        for v in x:
+            _syntax_objects(v, found, seen)
+    elif isinstance(x, dict):
+        for v in x.values():
+            _syntax_objects(v, found, seen)
+    elif type(x) is set or isinstance(x, (str, int, float, bool, type(None))):
+        pass
+    elif id(x) not in seen:
+        seen.add(id(x))
+        found.append(x)
+    return found
+
+class Frozen (object):
+    """Deferred tree prepared for repeated binding.
+
+       The syntax objects of the tree are pickled once, as a single
+       list so shared references survive. Each bind() unpickles a
+       fresh copy of all of them for the request to mutate. Trees
+       holding something which cannot be pickled fall back to the
+       deep copies made by plain bind(tree).
+    """
+    __slots__ = ('tree', '_ids', '_pickled')
+
+    def __init__(self, tree):
+        self.tree = tree
+        originals = _syntax_objects(tree, [], set())
+        # the tree keeps the originals alive, so their ids stay valid
+        self._ids = [ id(v) for v in originals ]
+        try:
+            self._pickled = pickle.dumps(originals, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self._pickled = None
+
+    def bind(self):
+        env = {}
+        if self._pickled is not None:
+            env['_copies'] = dict(zip(self._ids, pickle.loads(self._pickled)))
+        return bind(self.tree, env)
+
+def bind(x, env=None):
+    """Return the value of x with all Deferred nodes bound and syntax objects copied.
+
+       env: bound values by node, shared within one binding pass
+    """
+    if env is None:
+        env = {}
+    if isinstance(x, Deferred):
+        return x._bind(env)
+    elif isinstance(x, DeferredMethod):
+        raise TypeError('Deferred method %r used as a value without calling it.' % x)
+    elif type(x) is tuple:
+        return tuple([ bind(v, env) for v in x ])
+    elif type(x) is list:
+        return [ bind(v, env) for v in x ]
+    elif isinstance(x, dict):
+        # includes web_storage query options
+        result = type(x)()
+        for k, v in x.items():
+            result[k] = bind(v, env)
+        return result
+    elif type(x) is set:
+        return set(x)
+    elif isinstance(x, (str, int, float, bool, type(None))):
+        return x
+    else:
+        # syntax object, which the handler may mutate during this request
+        copies = env.get('_copies')
+        if copies is not None:
+            return copies[id(x)]
+        memo = env.setdefault('_deepcopy_memo', {})
+        return copy.deepcopy(x, memo)
@@ -21,17 +21,25 @@ This grammar parses whole URL text for all ERMREST REST URL formats,
 handling the complex syntax allowed under each API prefix.  The resulting
 abstract syntax tree (AST) 
 
+Parsing is side-effect free: handler construction is recorded as a
+tree of Deferred nodes which is memoized by URL text and bound to
+fresh handler instances for each request.
+
 """
 
 import ply.yacc as yacc
+import copy
 import threading
 import urllib
+from collections import OrderedDict
 from webauthn2.util import deriva_ctx, deriva_debug, web_storage
 
 from ..exception import *
-from ..model import predicate, normalized_history_snaptime, current_history_amendver
+from ..model import predicate
 
+from .. import sanepg2
 from .lex import make_lexer, tokens, keywords
+from .deferred import Deferred, Frozen, attribute
 from . import ast
 
 url_parse_func = None
@@ -99,7 +107,7 @@ def p_slashopt(p):
 
 def p_service(p):
     """service : '/' string """
-    p[0] = ast.Service()
+    p[0] = Deferred(ast.Service)
 
 def p_serviceslash(p):
     """serviceslash : service '/' """
@@ -107,14 +115,11 @@ def p_serviceslash(p):
 
 def p_catalog(p):
     """catalog : serviceslash CATALOG '/' string """ 
-    p[0] = ast.Catalog(p[4])
+    p[0] = Deferred(ast.Catalog, p[4])
 
 def p_catalog_when(p):
     """catalog : serviceslash CATALOG '/' string '@' string"""
-    p[0] = ast.Catalog(p[4])
-    cur = deriva_ctx.ermrest_catalog_pc.cur
-    deriva_ctx.ermrest_history_snaptime = normalized_history_snaptime(cur, p[6])
-    deriva_ctx.ermrest_history_amendver = current_history_amendver(cur, deriva_ctx.ermrest_history_snaptime)
+    p[0] = Deferred(ast.Catalog, p[4], snapwhen=p[6])
 
 def p_resolve_entity_rid(p):
     """resolve_entity_rid : catalogslash ENTITY_RID '/' string"""
@@ -130,19 +135,19 @@ def p_catalog_history_slash(p):
 
 def p_catalog_range0(p):
     """catalog_range : cataloghistoryslash ',' """
-    p[0] = ast.history.CatalogHistory(p[1].history_range('', ''))
+    p[0] = Deferred(ast.history.CatalogHistory, p[1].history_range('', ''))
 
 def p_catalog_range1(p):
     """catalog_range : cataloghistoryslash ',' string """
-    p[0] = ast.history.CatalogHistory(p[1].history_range('', p[3]))
+    p[0] = Deferred(ast.history.CatalogHistory, p[1].history_range('', p[3]))
 
 def p_catalog_range2(p):
     """catalog_range : cataloghistoryslash string ',' string """
-    p[0] = ast.history.CatalogHistory(p[1].history_range(p[2], p[4]))
+    p[0] = Deferred(ast.history.CatalogHistory, p[1].history_range(p[2], p[4]))
 
 def p_catalog_range3(p):
     """catalog_range : cataloghistoryslash string ',' """
-    p[0] = ast.history.CatalogHistory(p[1].history_range(p[2], ''))
+    p[0] = Deferred(ast.history.CatalogHistory, p[1].history_range(p[2], ''))
 
 def p_catalog_rangeslash(p):
     """catalog_rangeslash : catalog_range '/'"""
@@ -150,7 +155,7 @@ def p_catalog_rangeslash(p):
 
 def p_data_range(p):
     """data_range : catalog_rangeslash ATTRIBUTE '/' string """
-    p[0] = ast.history.DataHistory(p[1].catalog, p[4])
+    p[0] = Deferred(ast.history.DataHistory, attribute(p[1], 'catalog'), p[4])
 
 def p_data_range_filtered(p):
     """data_range : data_range '/' string '=' string """
@@ -164,11 +169,11 @@ def p_config_api(p):
 
 def p_config_range(p):
     """config_range : catalog_rangeslash config_api """
-    p[0] = ast.history.ConfigHistory(p[1].catalog, p[2])
+    p[0] = Deferred(ast.history.ConfigHistory, attribute(p[1], 'catalog'), p[2])
 
 def p_config_range2(p):
     """config_range : catalog_rangeslash config_api '/' string"""
-    p[0] = ast.history.ConfigHistory(p[1].catalog, p[2], target_rid=p[4])
+    p[0] = Deferred(ast.history.ConfigHistory, attribute(p[1], 'catalog'), p[2], target_rid=p[4])
 
 def p_catalogslash(p):
     """catalogslash : catalog '/' """
@@ -884,22 +889,56 @@ def make_parser():
     #return yacc.yacc(debug=True, tabmodule='ermrest_url_parsetab', write_tables=0, outputdir='/tmp')
 
 def make_parse():
-    lock = threading.Lock()
-    lock.acquire()
-    try:
-        parser = make_parser()
-        lexer = make_lexer()
-    finally:
-        lock.release()
-        
-    def parse(s):
-        lock.acquire()
+    """Return a parse(s) function which is safe to call from concurrent threads.
+
+       The grammar tables are built once. Each thread lazily gets
+       its own shallow copy of the parser and clone of the lexer, since
+       PLY keeps per-parse state on those instances.
+
+       Syntax trees are memoized in an LRU keyed by URL text, bounded
+       by the url_parse_cache_size configuration setting. Each call
+       binds the syntax tree to new handler instances, unpickling
+       fresh syntax objects rather than deep-copying them.
+
+       The pure syntax phase is available as parse.syntax(s).
+    """
+    parser = make_parser()
+    lexer = make_lexer()
+    local = threading.local()
+    cache = OrderedDict()
+    cache_lock = threading.Lock()
+
+    def syntax(s):
         try:
-            return parser.parse(s, lexer=lexer)
-        finally:
-            lock.release()
+            tparser, tlexer = local.parser, local.lexer
+        except AttributeError:
+            tparser = local.parser = copy.copy(parser)
+            tlexer = local.lexer = lexer.clone()
+        return tparser.parse(s, lexer=tlexer)
+
+    def parse(s):
+        with cache_lock:
+            tree = cache.get(s)
+            if tree is not None:
+                cache.move_to_end(s)
+        if tree is None:
+            sanepg2.request_stat_add('url_cache_misses')
+            tree = Frozen(syntax(s))
+            try:
+                cache_size = int(deriva_ctx.ermrest_config.get('url_parse_cache_size', 1000))
+            except AttributeError:
+                cache_size = 1000
+            with cache_lock:
+                cache[s] = tree
+                while len(cache) > cache_size:
+                    cache.popitem(last=False)
+        else:
+            sanepg2.request_stat_add('url_cache_hits')
+        return tree.bind()
+
+    parse.syntax = syntax
     return parse
 
-# provide a mutexed parser instance for all to use
+# provide a thread-safe parser instance for all to use
 url_parse_func = make_parse()
 
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+
+"""Benchmark keyset paging predicates over a large table.
+
+usage: keyset-paging-benchmark.py dbname [ nrows [ page_size [ samples ] ] ]
+
+The dbname must name an existing database. A schema "paging_bench"
+is created in it on the first run, with nrows (default 20000000) rows
+and a btree index on the sort key (grp, id). Drop the schema to clean
+up afterwards.
+
+The whole table is walked page by page, page_size (default 1000) rows
+at a time, as a client would page through
+
+  /entity/item@sort(grp,id)@after(G,I)?limit=page_size
+
+using the row-value page predicate generated for NOT NULL sort
+columns. The latency of every page is recorded. For samples (default
+10) pages spread over the walk, the same page is also fetched with the
+general predicate generated for nullable columns, which is too slow to
+walk the whole table with.
+
+Each sample reports its row offset and the latency of both forms. The
+row-value form should stay flat as the offset grows.
+"""
+
+import sys
+import time
+import psycopg2
+
+from ermrest.model.predicate import Value
+from ermrest.model.type import int8_type
+from ermrest.ermpath.resource import page_filter_sql
+
+dbname = sys.argv[1]
+nrows = int(sys.argv[2]) if len(sys.argv) > 2 else 20000000
+page_size = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+samples = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+
+conn = psycopg2.connect(database=dbname)
+cur = conn.cursor()
+
+cur.execute("SELECT count(*) FROM information_schema.tables WHERE table_schema = 'paging_bench';")
+if cur.fetchone()[0] < 1:
+    cur.execute("""
+DROP SCHEMA IF EXISTS paging_bench CASCADE;
+CREATE SCHEMA paging_bench;
+CREATE TABLE paging_bench.item (
+  id int8 PRIMARY KEY,
+  grp int8 NOT NULL,
+  name text NOT NULL
+);
+INSERT INTO paging_bench.item
+SELECT i, (i * 7919) %% 1000, 'item ' || i FROM generate_series(1, %(nrows)d) i;
+CREATE INDEX ON paging_bench.item (grp, id);
+ANALYZE paging_bench.item;
+""" % {'nrows': nrows})
+    conn.commit()
+
+cur.execute("SELECT count(*) FROM paging_bench.item;")
+nrows = cur.fetchone()[0]
+
+def page_sql(boundary, nullables):
+    if boundary is None:
+        page = ''
+    else:
+        page = 'WHERE (%s)' % page_filter_sql(
+            ['grp', 'id'], [False, False], [int8_type, int8_type],
+            [ Value(str(v)) for v in boundary ],
+            is_before=False,
+            nullables=nullables
+        )
+    return 'SELECT * FROM (SELECT * FROM paging_bench.item) s %s ORDER BY "grp" ASC NULLS LAST, "id" ASC NULLS LAST LIMIT %d' % (page, page_size)
+
+def fetch_page(boundary, nullables):
+    t0 = time.time()
+    cur.execute(page_sql(boundary, nullables))
+    rows = cur.fetchall()
+    return rows, 1000.0 * (time.time() - t0)
+
+npages = (nrows + page_size - 1) // page_size
+sample_pages = set([ (i * (npages - 1)) // max(samples - 1, 1) for i in range(samples) ])
+
+boundary = None
+latencies = []
+results = []
+for pageno in range(npages):
+    if pageno in sample_pages:
+        general_rows, general_ms = fetch_page(boundary, None)
+    rows, ms = fetch_page(boundary, [False, False])
+    latencies.append(ms)
+    if pageno in sample_pages:
+        assert general_rows == rows
+        results.append((pageno * page_size, ms, general_ms))
+    if not rows:
+        break
+    boundary = (rows[-1][1], rows[-1][0])
+conn.commit()
+
+print('%d rows, %d pages of %d rows, row-value mean %.3f ms/page max %.3f ms/page' % (
+    nrows, len(latencies), page_size, sum(latencies) / len(latencies), max(latencies)
+))
+for offset, ms, general_ms in results:
+    print('offset %10d   row-value %8.3f ms   general %10.3f ms' % (offset, ms, general_ms))
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+"""Benchmark cold model introspection against snapshot loading.
+
+usage: model-snapshot-benchmark.py dbname [ ntables [ rounds ] ]
+
+The dbname must name an existing ERMrest catalog database. A schema
+"snapshot_bench" with ntables (default 2000) tables is created in it
+on the first run, each table with a key and a foreign key to the
+previous table. Drop the schema and run _ermrest.model_change_event()
+to clean up afterwards.
+
+Each round times:
+
+  introspect: introspect_rows() and build_model(), as a cold worker did
+  snapshot: snapshot load and build_model()
+
+and reports the fetch, load and build phases separately.
+"""
+
+import sys
+import time
+import tempfile
+import psycopg2
+from webauthn2.util import deriva_ctx
+
+from ermrest import sanepg2
+from ermrest.model import current_model_snaptime
+from ermrest.model.introspect import introspect_rows, build_model
+from ermrest.model.snapshot import ModelSnapshotStore
+
+dbname = sys.argv[1]
+ntables = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+deriva_ctx.ermrest_config = {
+    'require_primary_keys': False,
+    'warn_missing_system_columns': False,
+}
+deriva_ctx.ermrest_request_stats = None
+deriva_ctx.ermrest_model_rights_cache = dict()
+
+conn = psycopg2.connect(database=dbname, connection_factory=sanepg2.connection)
+cur = conn.cursor()
+
+cur.execute("SELECT count(*) FROM pg_tables WHERE schemaname = 'snapshot_bench';")
+if cur.fetchone()[0] < ntables:
+    cur.execute("DROP SCHEMA IF EXISTS snapshot_bench CASCADE; CREATE SCHEMA snapshot_bench;")
+    for i in range(ntables):
+        cur.execute("""
+CREATE TABLE snapshot_bench.t%(i)d (
+  id serial PRIMARY KEY,
+  name text UNIQUE,
+  value float8,
+  prev int %(fkey)s
+);
+COMMENT ON TABLE snapshot_bench.t%(i)d IS 'benchmark table %(i)d';
+""" % {
+    'i': i,
+    'fkey': ('REFERENCES snapshot_bench.t%d (id)' % (i - 1)) if i > 0 else '',
+})
+    cur.execute("SELECT _ermrest.model_change_event();")
+    conn.commit()
+
+snapwhen = current_model_snaptime(cur)
+store = ModelSnapshotStore({'path': tempfile.mkdtemp(prefix='ermrest-snapshot-bench-')})
+key = (dbname, (snapwhen, None))
+
+def timed(func):
+    t0 = time.time()
+    result = func()
+    return result, time.time() - t0
+
+for r in range(rounds):
+    rows, fetch_s = timed(lambda: introspect_rows(cur, snapwhen))
+    model, build_s = timed(lambda: build_model(cur, rows, None, snapwhen, None))
+    conn.commit()
+    if r == 0:
+        _, store_s = timed(lambda: store.store(key, rows))
+        print('%d tables, snapshot stored in %.3fs' % (ntables, store_s))
+    loaded, load_s = timed(lambda: store.load(key))
+    model, rebuild_s = timed(lambda: build_model(cur, loaded, None, snapwhen, None))
+    conn.commit()
+    print('round %d: introspect %.3fs (fetch %.3fs build %.3fs)  snapshot %.3fs (load %.3fs build %.3fs)' % (
+        r, fetch_s + build_s, fetch_s, build_s, load_s + rebuild_s, load_s, rebuild_s
+    ))
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+"""Benchmark inlined literals against prepared statements for a facet query.
+
+usage: prepared-query-benchmark.py dbname [ nitems [ queries ] ]
+
+The dbname must name an existing database. A schema "prepared_bench"
+is created in it on the first run, with nitems (default 100000) items
+linked to categories and tags, as a faceted search interface would
+browse. Drop the schema to clean up afterwards.
+
+The facet query is compiled once into a QueryTemplate as for a data
+GET of
+
+  /entity/I:=item/year::geq::Y/category/name=C/$I/tag/tag=T/$I
+
+and then run for queries (default 500) random combinations of
+literals in two modes:
+
+  inline: literals bound into the SQL text, re-planned per statement
+  prepared: $n parameters run by connection.execute_statement()
+
+Each mode reports wall-clock time per query and the mean planning
+time reported by EXPLAIN ANALYZE for a sample of the same queries.
+"""
+
+import sys
+import json
+import time
+import random
+import psycopg2
+from webauthn2.util import deriva_ctx
+
+from ermrest import sanepg2
+from ermrest.model.predicate import Value
+from ermrest.model.type import text_type, int8_type
+from ermrest.ermpath.compiled import ValueSlot, QueryTemplate
+
+dbname = sys.argv[1]
+nitems = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+queries = int(sys.argv[3]) if len(sys.argv) > 3 else 500
+
+deriva_ctx.ermrest_request_stats = None
+
+conn = psycopg2.connect(database=dbname, connection_factory=sanepg2.connection)
+cur = conn.cursor()
+
+cur.execute("SELECT count(*) FROM information_schema.tables WHERE table_schema = 'prepared_bench';")
+if cur.fetchone()[0] < 3:
+    cur.execute("""
+DROP SCHEMA IF EXISTS prepared_bench CASCADE;
+CREATE SCHEMA prepared_bench;
+CREATE TABLE prepared_bench.category (id int8 PRIMARY KEY, name text UNIQUE NOT NULL);
+CREATE TABLE prepared_bench.item (
+  id int8 PRIMARY KEY,
+  category int8 NOT NULL REFERENCES prepared_bench.category (id),
+  year int8 NOT NULL,
+  name text NOT NULL
+);
+CREATE TABLE prepared_bench.tag (
+  item int8 NOT NULL REFERENCES prepared_bench.item (id),
+  tag text NOT NULL,
+  PRIMARY KEY (item, tag)
+);
+INSERT INTO prepared_bench.category SELECT i, 'category ' || i FROM generate_series(1, 100) i;
+INSERT INTO prepared_bench.item
+SELECT i, 1 + i %% 100, 1950 + i %% 75, 'item ' || i FROM generate_series(1, %(nitems)d) i;
+INSERT INTO prepared_bench.tag
+SELECT i, 'tag ' || ((i * t) %% 500) FROM generate_series(1, %(nitems)d) i, generate_series(1, 3) t
+ON CONFLICT DO NOTHING;
+CREATE INDEX ON prepared_bench.item (category);
+CREATE INDEX ON prepared_bench.item (year);
+CREATE INDEX ON prepared_bench.tag (tag);
+ANALYZE;
+""" % {'nitems': nitems})
+    conn.commit()
+
+# compile the facet query as the data path SQL generator would
+slots = [ ValueSlot(Value('0'), i) for i in range(3) ]
+template = QueryTemplate()
+for slot in slots:
+    slot.template = template
+template.set_sql("""
+SELECT DISTINCT ON (t0."id") t0.*
+FROM prepared_bench.item AS t0
+JOIN prepared_bench.category AS t1 ON (t0."category" = t1."id")
+JOIN prepared_bench.tag AS t2 ON (t0."id" = t2."item")
+WHERE (t0."year" >= %s) AND (t1."name" = %s) AND (t2."tag" = %s)
+LIMIT 100
+""" % (
+    slots[0].sql_literal(int8_type),
+    slots[1].sql_literal(text_type),
+    slots[2].sql_literal(text_type),
+))
+
+random.seed(0)
+workload = [
+    [ str(random.randint(1950, 2024)), 'category %d' % random.randint(1, 100), 'tag %d' % random.randint(0, 499) ]
+    for i in range(queries)
+]
+
+def run_inline(values):
+    cur.execute(template.bind(values))
+    return cur.fetchall()
+
+def run_prepared(values):
+    sql, argtypes, args = template.bind_params(values)
+    conn.execute_statement(cur, sql, argtypes, args)
+    return cur.fetchall()
+
+def planning_ms(values, prepared):
+    if prepared:
+        sql, argtypes, args = template.bind_params(values)
+        conn.execute_statement(cur, sql, argtypes, args)
+        cur.fetchall()
+        name = list(conn._session_statements)[-1]
+        cur.execute('EXPLAIN (ANALYZE, FORMAT JSON) EXECUTE %s(%s)' % (name, ', '.join([ '%s' for a in args ])), args)
+    else:
+        cur.execute('EXPLAIN (ANALYZE, FORMAT JSON) %s' % template.bind(values))
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Planning Time']
+
+for label, func, prepared in [ ('inline', run_inline, False), ('prepared', run_prepared, True) ]:
+    t0 = time.time()
+    for values in workload:
+        func(values)
+    conn.commit()
+    elapsed = time.time() - t0
+    sample = workload[0:min(50, len(workload))]
+    plan_ms = [ planning_ms(values, prepared) for values in sample ]
+    conn.commit()
+    print('%-9s %6d queries %8.3f ms/query   planning %7.3f ms/query' % (
+        label, len(workload), 1000.0 * elapsed / len(workload), sum(plan_ms) / len(plan_ms)
+    ))
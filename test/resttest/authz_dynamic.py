@@ -439,6 +439,31 @@ class StaticHidden (common.ErmrestTest):
         expect = self.test_expectations['anonymous_get_join1']
         expect.check(self, common.anonymous_session.get(self._get_join1_url))
 
+    # entity form filters context rows by an EXISTS subquery over the other tables
+    _get_join2_url = 'entity/A:=%(S)s:Data/%(S)s:Category/%(S)s:Data_Category/$A' % dict(S=_S)
+    _get_join2_group_url = 'attributegroup/A:=%(S)s:Data/%(S)s:Category/%(S)s:Data_Category/A:id' % dict(S=_S)
+
+    def _check_join2(self, session):
+        # the grouped join form gives the expected result under the same ACLs
+        g = session.get(self._get_join2_group_url)
+        r = session.get(self._get_join2_url)
+        self.assertHttp(r, g.status_code)
+        if r.status_code == 200:
+            ids = [ row['id'] for row in r.json() ]
+            self.assertEqual(len(ids), len(set(ids)), "Duplicate IDs %r" % ids)
+            self.assertEqual(set(ids), set([ row['id'] for row in g.json() ]))
+
+    def test_primary_get_join2(self):
+        self._check_join2(common.primary_session)
+
+    @unittest.skipIf(common.secondary_session is None, "secondary authz test requires TEST_COOKIES2")
+    def test_secondary_get_join2(self):
+        self._check_join2(common.secondary_session)
+
+    @unittest.skipIf(common.anonymous_session is None, "anonymous authz test requires ermrest_config permission")
+    def test_anonymous_get_join2(self):
+        self._check_join2(common.anonymous_session)
+
 class HiddenPolicy (StaticHidden):
     acls = {
         "Data": {
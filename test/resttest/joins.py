@@ -137,6 +137,41 @@ class JoinedProjections (common.ErmrestTest):
         self.assertHttp(r, 200, 'application/json')
         self.assertEqual(r.json()[0]['c'], expected)
 
+def add_context_row_tests(klass):
+    parts = {
+        'T1': '%s:%s' % (_S, _T1),
+        'T2': '%s:%s' % (_S, _T2),
+    }
+    for name, path, expected in [
+            # outbound links to a key cannot repeat context rows
+            ("outbound", "A:=%(T2)s/%(T1)s/$A", [1, 2, 3, 4]),
+            ("outbound_left", "A:=%(T2)s/left(level1_id)=(%(T1)s:id)/$A", [1, 2, 3, 4, 5]),
+            # fan-in to the referenced table needs each context row only once
+            ("fanin", "%(T2)s/%(T1)s", [1, 2, 3]),
+            ("fanin_cols", "%(T2)s/(level1_id)=(%(T1)s:id)", [1, 2, 3]),
+            ("inbound_reset", "A:=%(T1)s/%(T2)s/$A", [1, 2, 3]),
+            ("inbound_reset_sorted", "A:=%(T1)s/%(T2)s/$A@sort(id::desc::)?limit=2", [3, 2]),
+            # filters on non-context elements
+            ("fanin_filter", "%(T2)s/name=foo%%201;name=bar%%201/%(T1)s", [1, 2]),
+            ("reset_filter", "A:=%(T1)s/%(T2)s/id::gt::2/$A", [2, 3]),
+            ("reset_regexp", "A:=%(T1)s/%(T2)s/name::regexp::foo/$A", [1]),
+            ("alias_filter", "A:=%(T1)s/B:=%(T2)s/A:name=foo/$B", [1, 2]),
+    ]:
+        def test(self, path=path % parts, expected=expected):
+            self._check_ids('entity/%s' % path, expected)
+        setattr(klass, 'test_%s' % name, test)
+    return klass
+
+@add_context_row_tests
+class JoinedContextRows (common.ErmrestTest):
+    def _check_ids(self, path, expected):
+        r = self.session.get(path)
+        self.assertHttp(r, 200, 'application/json')
+        ids = [ row['id'] for row in r.json() ]
+        if '@sort' not in path:
+            ids.sort()
+        self.assertEqual(ids, expected, path)
+
 class MultiKeyReference (common.ErmrestTest):
     def test_implicit_multi(self):
         # regression test for ermrest#160, internal server error with MultiKeyReference
@@ -1,5 +1,7 @@
 
 import unittest
+import csv
+import json
 import common
 
 from common import Int4, Int8, Serial8, Text, Int4Array, TextArray, Timestamptz, \
@@ -8,6 +10,8 @@ from common import Int4, Int8, Serial8, Text, Int4Array, TextArray, Timestamptz,
 
 _S = 'paging'
 _T = 'pagedata'
+_Ta = 'pagearrays'
+_Tk = 'pagekeys'
 _defs = ModelDoc(
     [
         SchemaDoc(
@@ -22,7 +26,27 @@ _defs = ModelDoc(
                         ColumnDoc("value", Int4),
                     ],
                     [ RidKey, KeyDoc(["id"]) ],
-                )
+                ),
+                TableDoc(
+                    _Ta,
+                    [
+                        RID, RCT, RMT, RCB, RMB,
+                        ColumnDoc("id", Serial8, nullok=False),
+                        ColumnDoc("grp", Int4, nullok=False),
+                        ColumnDoc("vals", Int4Array),
+                    ],
+                    [ RidKey, KeyDoc(["id"]) ],
+                ),
+                TableDoc(
+                    _Tk,
+                    [
+                        RID, RCT, RMT, RCB, RMB,
+                        ColumnDoc("id", Serial8, nullok=False),
+                        ColumnDoc("a", Int4, nullok=False),
+                        ColumnDoc("b", Int4),
+                    ],
+                    [ RidKey, KeyDoc(["id"]) ],
+                ),
             ]
         )
     ]
@@ -47,12 +71,26 @@ _data = [
     {}
 ]
 
+# ids 1..8 get grp 0,0,0,1,1,1,2,2
+_array_data = [
+    {"grp": i // 3, "vals": [i, i * i]}
+    for i in range(8)
+]
+
+# b is NULL for every fourth row
+_key_data = [
+    {"a": i % 3, "b": (i * 7) % 5 if i % 4 else None}
+    for i in range(12)
+]
+
 def setUpModule():
     r = common.primary_session.get('schema/%s' % _S)
     if r.status_code == 404:
         # idempotent because unittest can re-enter module several times...
         common.primary_session.post('schema', json=_defs).raise_for_status()
         common.primary_session.post('entity/%s:%s?defaults=id' % (_S, _T), json=_data).raise_for_status()
+        common.primary_session.post('entity/%s:%s?defaults=id' % (_S, _Ta), json=_array_data).raise_for_status()
+        common.primary_session.post('entity/%s:%s?defaults=id' % (_S, _Tk), json=_key_data).raise_for_status()
 
 def add_paging_tests(klass):
     # generate many paging variants
@@ -173,6 +211,155 @@ class PagingCsv (PagingJsonStream):
     content_type = 'text/csv'
     def _count(self, r):
         return len(list(r.iter_lines())) - 1
-        
+
+def add_pushdown_tests(klass):
+    # paging pushed into DISTINCT-free queries, incl. arrays output as JSON
+    pages = [
+        ("A_id",       "",       "@sort(id)@after(3)?limit=2", [4, 5]),
+        ("B_id",       "",       "@sort(id)@before(6)?limit=2", [4, 5]),
+        ("A_grp_id",   "",       "@sort(grp,id)@after(1,4)?limit=3", [5, 6, 7]),
+        ("B_grp_id",   "",       "@sort(grp,id)@before(1,5)?limit=2", [3, 4]),
+        ("A_mixed",    "",       "@sort(grp::desc::,id)@after(1,5)?limit=2", [6, 1]),
+        ("B_mixed",    "",       "@sort(grp::desc::,id)@before(1,5)?limit=2", [8, 4]),
+        ("A_filtered", "/grp=1", "@sort(id)@after(4)", [5, 6]),
+        ("B_filtered", "/grp=1", "@sort(id::desc::)@before(4)?limit=5", [6, 5]),
+    ]
+    queries = [
+        ("entity",    "entity/%s:%s%%(filter)s%%(page)s" % (_S, _Ta)),
+        ("attribute", "attribute/%s:%s%%(filter)s/id,grp,vals%%(page)s" % (_S, _Ta)),
+    ]
+    for qname, query in queries:
+        for pname, pfilter, page, expected in pages:
+            def test(self, path=query % {'filter': pfilter, 'page': page}, expected=expected):
+                self._check(path, expected)
+            setattr(klass, 'test_%s_%s' % (qname, pname), test)
+    return klass
+
+@add_pushdown_tests
+class PagingPushdown (common.ErmrestTest):
+    def _check(self, path, expected):
+        r = self.session.get(path)
+        self.assertHttp(r, 200, 'application/json')
+        self.assertEqual([ row['id'] for row in r.json() ], expected, path)
+        for row in r.json():
+            self.assertEqual(row['vals'], [row['id'] - 1, (row['id'] - 1) ** 2])
+
+        # same page as CSV with arrays serialized as JSON
+        path += '%sarrays=json' % ('&' if '?' in path else '?')
+        r = self.session.get(path, headers={"Accept": "text/csv"})
+        self.assertHttp(r, 200, 'text/csv')
+        rows = list(csv.DictReader(r.text.splitlines()))
+        self.assertEqual([ int(row['id']) for row in rows ], expected, path)
+        for row in rows:
+            self.assertEqual(json.loads(row['vals']), [int(row['id']) - 1, (int(row['id']) - 1) ** 2])
+
+def add_walk_tests(klass):
+    # NOT NULL keys sorting in one direction page by row-value comparison
+    # others use the general form, which must handle NULL values and bounds
+    sorts = [
+        ("rowvalue",      ["a", "id"]),
+        ("rowvalue_desc", ["a::desc::", "id::desc::"]),
+        ("mixed",         ["a::desc::", "id"]),
+        ("nullable",      ["b", "id"]),
+        ("nullable_desc", ["b::desc::", "a", "id"]),
+    ]
+    queries = [
+        ("entity",    "entity/%s:%s" % (_S, _Tk)),
+        ("attribute", "attribute/%s:%s/id,a,b" % (_S, _Tk)),
+    ]
+    for qname, query in queries:
+        for sname, keys in sorts:
+            def test(self, query=query, keys=keys):
+                self._check_walks(query, keys)
+            setattr(klass, 'test_%s_%s' % (qname, sname), test)
+    return klass
+
+@add_walk_tests
+class PagingWalk (common.ErmrestTest):
+    limit = 5
+
+    def _get(self, path):
+        r = self.session.get(path)
+        self.assertHttp(r, 200, 'application/json')
+        return r.json()
+
+    def _boundary(self, row, keys):
+        return ','.join([
+            '::null::' if row[k.split('::')[0]] is None else str(row[k.split('::')[0]])
+            for k in keys
+        ])
+
+    def _check_walks(self, path, keys, count=len(_key_data)):
+        sort = '@sort(%s)' % ','.join(keys)
+        full = self._get(path + sort)
+        self.assertEqual(len(full), count)
+        self.assertEqual(len(set([ row['id'] for row in full ])), count)
+
+        # forward through @after pages
+        rows = []
+        page = self._get('%s%s?limit=%d' % (path, sort, self.limit))
+        while page:
+            rows.extend(page)
+            page = self._get('%s%s@after(%s)?limit=%d' % (path, sort, self._boundary(page[-1], keys), self.limit))
+        self.assertEqual(rows, full, path + sort)
+
+        # backward through @before pages
+        rows = full[-1:]
+        page = self._get('%s%s@before(%s)?limit=%d' % (path, sort, self._boundary(rows[0], keys), self.limit))
+        while page:
+            rows = page + rows
+            page = self._get('%s%s@before(%s)?limit=%d' % (path, sort, self._boundary(page[0], keys), self.limit))
+        self.assertEqual(rows, full, path + sort)
+
+    def test_z_dropped_notnull(self):
+        # paging must stop using the row-value form once NOT NULL is dropped
+        colurl = 'schema/%s/table/%s/column/a' % (_S, _Tk)
+        self.assertHttp(self.session.put(colurl, json={"nullok": True}), 200)
+        try:
+            r = self.session.post('entity/%s:%s?defaults=id' % (_S, _Tk), json=[{"b": 1}])
+            self.assertHttp(r, 200)
+            try:
+                for keys in [["a", "id"], ["a::desc::", "id::desc::"]]:
+                    self._check_walks('entity/%s:%s' % (_S, _Tk), keys, len(_key_data) + 1)
+            finally:
+                self.assertHttp(self.session.delete('entity/%s:%s/id=%s' % (_S, _Tk, r.json()[0]['id'])), 204)
+        finally:
+            self.assertHttp(self.session.put(colurl, json={"nullok": False}), 200)
+
+class Binning (common.ErmrestTest):
+    # same query shape with different bin parameters must not share results
+    shapes = [
+        ('5;0;5',  {1: 3, 2: 3, 3: 3, 4: 3, 5: 3, 6: 1, None: 4}, (0, 1)),
+        ('2;0;10', {1: 15, 2: 1, None: 4}, (0, 5)),
+        ('4;0;8',  {1: 6, 2: 6, 3: 4, None: 4}, (0, 2)),
+    ]
+
+    def _check_bins(self, path, counts, first_range):
+        r = self.session.get(path)
+        self.assertHttp(r, 200, 'application/json')
+        actual = {}
+        ranges = {}
+        for row in r.json():
+            bucket = row['b'][0]
+            actual[bucket] = actual.get(bucket, 0) + row.get('c', 1)
+            ranges[bucket] = tuple(row['b'][1:])
+        self.assertEqual(actual, counts, path)
+        # bucket bounds are computed in float4 precision
+        for actual_bound, expected_bound in zip(ranges[1], first_range):
+            self.assertAlmostEqual(actual_bound, expected_bound, places=5, msg=path)
+
+    def test_1_attributegroup(self):
+        for params, counts, first_range in self.shapes:
+            self._check_bins('attributegroup/%s:%s/b:=bin(value;%s);c:=cnt(*)' % (_S, _T, params), counts, first_range)
+
+    def test_2_attribute(self):
+        for params, counts, first_range in self.shapes:
+            self._check_bins('attribute/%s:%s/id,b:=bin(value;%s)' % (_S, _T, params), counts, first_range)
+
+    def test_3_repeat(self):
+        # second pass runs from cached query templates
+        self.test_1_attributegroup()
+        self.test_2_attribute()
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
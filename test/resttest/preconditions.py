@@ -107,5 +107,24 @@ class PreconditionData2 (PreconditionData1):
     # run this whole sequence twice...
     pass
 
+class PreconditionDataErrors (Precondition):
+    resource = 'entity/%s:%s' % (_S, _T1)
+
+    def _error_check(self, url, status):
+        # errors in the request take precedence over 304 and 412
+        for hdrs in [
+                {'if-none-match': self.etag},
+                {'if-none-match': '*'},
+                {'if-match': '"wrong-etag"'},
+        ]:
+            self.assertHttp(self.session.get(url, headers=hdrs), status)
+        self.assertHttp(self.session.get(url), status)
+
+    def test_1_get_unknown_table(self):
+        self._error_check('entity/%s:DOES_NOT_EXIST' % (_S,), 409)
+
+    def test_1_get_unknown_column(self):
+        self._error_check('entity/%s:%s/DOES_NOT_EXIST=1' % (_S, _T1), 409)
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
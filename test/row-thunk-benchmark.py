@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+"""Microbenchmark for ermpath row streaming.
+
+Compares the old one-row-per-chunk streaming loop with
+make_row_thunk() batch fetching and block assembly, for each text
+content type.
+
+usage: row-thunk-benchmark.py [ nrows [ fetch_rows [ block_bytes ] ] ]
+
+This test uses the default database for the user calling it, i.e. one
+named by username, and a temporary table of nrows (default 10000000)
+rows.
+"""
+
+import sys
+import time
+import psycopg2
+from ermrest import sanepg2
+from ermrest.ermpath.resource import make_row_thunk, preserialize, row_to_csv
+
+nrows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+fetch_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+block_bytes = int(sys.argv[3]) if len(sys.argv) > 3 else 65536
+
+conn = psycopg2.connect(database='', connection_factory=sanepg2.connection)
+cur = conn.cursor()
+cur.execute("""
+CREATE TEMPORARY TABLE bench AS
+SELECT i AS id, 'row ' || i AS name, now() AS ts
+FROM generate_series(1, %s) s(i);
+""" % nrows)
+conn.commit()
+
+def old_row_thunk(cur, content_type):
+    """Streaming loop as it was before batch fetching."""
+    if content_type == 'text/csv':
+        hdr = True
+        for row in cur:
+            if hdr:
+                yield row_to_csv([ col.name for col in cur.description ]) + '\n'
+                hdr = False
+            yield row_to_csv(row, cur.description) + '\n'
+    else:
+        for row in cur:
+            yield row[0] + '\n'
+
+def run(label, content_type, thunk_func):
+    cur = conn.execute(preserialize('SELECT * FROM bench', content_type))
+    t0 = time.time()
+    chunks = 0
+    nbytes = 0
+    for chunk in thunk_func(cur, content_type):
+        chunks += 1
+        nbytes += len(chunk)
+    elapsed = time.time() - t0
+    cur.close()
+    conn.commit()
+    print('%-8s %-28s %10d chunks %12d bytes %8.2fs %12.0f rows/sec' % (
+        label, content_type, chunks, nbytes, elapsed, nrows / elapsed
+    ))
+
+for content_type in [ 'text/csv', 'application/x-json-stream', 'application/json' ]:
+    run('before', content_type, old_row_thunk)
+    run('after', content_type, lambda cur, content_type: make_row_thunk(None, cur, content_type, fetch_rows=fetch_rows, block_bytes=block_bytes)())
@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+"""Multithreaded URL parsing throughput benchmark.
+
+Parses the positive corpus of url-parse-tests.py from several threads:
+
+  locked: a single lock-guarded parser (the old scheme)
+  threadlocal: per-thread parsers, re-parsing every URL
+  deepcopy: memoized syntax trees, deep-copying syntax objects per bind
+  cached: url_parse_func, unpickling memoized syntax objects per bind
+
+usage: url-parse-benchmark.py [ nthreads [ seconds [ action_latency_ms ] ] ]
+
+Catalog construction is replaced by a stand-in so that no registry or
+database is needed. The stand-in sleeps action_latency_ms (default 0)
+to emulate the registry and database round trips which grammar
+actions used to make while holding the parser lock.
+"""
+
+import os
+import sys
+import time
+import threading
+import importlib.util
+
+from ermrest.url import parse, ast
+from ermrest.url.deferred import bind
+
+spec = importlib.util.spec_from_file_location(
+    'url_parse_tests',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'url-parse-tests.py')
+)
+url_parse_tests = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(url_parse_tests)
+
+nthreads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+action_latency_s = float(sys.argv[3]) / 1000.0 if len(sys.argv) > 3 else 0.0
+
+class StubCatalog (ast.Catalog):
+    """Absorbs AST method calls so parsing runs without a registry or database."""
+    def __init__(self, *args, **kwargs):
+        if action_latency_s:
+            time.sleep(action_latency_s)
+
+    def __getattribute__(self, name):
+        if name.startswith('__'):
+            return object.__getattribute__(self, name)
+        return lambda *args, **kwargs: self
+
+ast.Catalog = StubCatalog
+
+def _parses(url):
+    try:
+        parse.url_parse_func.syntax(url)
+        return True
+    except parse.ParseError:
+        # the test corpus still lists some retired URL forms
+        return False
+
+corpus = [
+    url
+    for url in url_parse_tests.positive_urls
+    if url.startswith('/ermrest/catalog/') and _parses(url)
+]
+
+def run(label, parse_func):
+    counts = [0] * nthreads
+    deadline = time.time() + seconds
+
+    def worker(i):
+        n = 0
+        while time.time() < deadline:
+            for url in corpus:
+                parse_func(url)
+            n += len(corpus)
+        counts[i] = n
+
+    threads = [ threading.Thread(target=worker, args=(i,)) for i in range(nthreads) ]
+    t0 = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - t0
+    print('%-12s %3d threads %10d parses %10.0f parses/sec' % (label, nthreads, sum(counts), sum(counts) / elapsed))
+
+lock = threading.Lock()
+locked_parser = parse.make_parser()
+locked_lexer = parse.make_lexer()
+
+def locked_parse(s):
+    with lock:
+        return bind(locked_parser.parse(s, lexer=locked_lexer))
+
+def threadlocal_parse(s):
+    return bind(parse.url_parse_func.syntax(s))
+
+trees = { url: parse.url_parse_func.syntax(url) for url in corpus }
+
+def deepcopy_parse(s):
+    return bind(trees[s])
+
+run('locked', locked_parse)
+run('threadlocal', threadlocal_parse)
+run('deepcopy', deepcopy_parse)
+run('cached', parse.url_parse_func)
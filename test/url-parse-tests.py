@@ -6,8 +6,7 @@ from ermrest.url import url_parse_func
 from ermrest.url.parse import ParseError
 
 # positive tests
-
-for url in [
+positive_urls = [
     '/ermrest/catalog',
     '/ermrest/catalog/',
     '/ermrest/catalog/232',
@@ -42,43 +41,49 @@ for url in [
     '/ermrest/catalog/232/entity/S1:T1/C1/alias:=C2/N1,N2/(N1)/alias(C1,C2)=@(Cx,Cy)S2:T2/@=(C3,C4)S3:T3',
     '/ermrest/catalog/232/attribute/S1:T1/C1,C2,C3',
     '/ermrest/catalog/232/query/S1:T1/C1,C2,C3'
-    ]:
-    try:
-        url_parse_func(url)
-    except Exception as e:
-        sys.stderr.write('got exception for: %s\n' % url)
-        raise
-
+]
 
 # negative tests throwing ValueError
-
-for url in [
+value_error_urls = [
     '/ermrest/catalog/232/schema/S1/table/T1/key/C1,C2,C3/referencedby/S2:T2:bad',
     '/ermrest/catalog/232/schema/S1/table/T1/foreignkey/Cx,Cy,Cz/reference/S2:T2:bad',
     '/ermrest/catalog/232/schema/S1/table/T1/referencedby/S2:T2:bad/Cx,Cy,Cz/key/C1,C2,C3',
     '/ermrest/catalog/232/schema/S1/table/T1/reference/S2:T2:bad'
-    ]:
-    got_error = False
-    try:
-        url_parse_func(url)
-    except ValueError:
-        got_error = True
+]
 
-    if not got_error:
-        raise ValueError('negative test did not raise expected ValueError for: %s' % url)
+# negative tests throwing ParseError
+parse_error_urls = [
+    '/ermrest/catalog/232/entity'
+]
 
+def run_tests():
+    for url in positive_urls:
+        try:
+            url_parse_func(url)
+        except Exception as e:
+            sys.stderr.write('got exception for: %s\n' % url)
+            raise
 
-# negative tests throwing ParseError
+    for url in value_error_urls:
+        got_error = False
+        try:
+            url_parse_func(url)
+        except ValueError:
+            got_error = True
 
-for url in [
-    '/ermrest/catalog/232/entity'
-    ]:
-    got_error = False
-    try:
-        url_parse_func(url)
-    except ParseError:
-        got_error = True
+        if not got_error:
+            raise ValueError('negative test did not raise expected ValueError for: %s' % url)
+
+    for url in parse_error_urls:
+        got_error = False
+        try:
+            url_parse_func(url)
+        except ParseError:
+            got_error = True
+
+        if not got_error:
+            raise ValueError('negative test did not raise expected ParseError for: %s' % url)
 
-    if not got_error:
-        raise ValueError('negative test did not raise expected ParseError for: %s' % url)
+if __name__ == '__main__':
+    run_tests()
 